@@ -9,33 +9,98 @@ Author: MIDICOM Team
 Version: 1.0.0
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 import os
 import json
 import asyncio
-from typing import Optional
+import math
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
-import mido
 
 # Import logger centralizzato
 from logger import setup_logger
+from audio_io import AUDIO_EXTENSIONS, PROBE_CACHE_SIZE, AudioDecodeError, probe_audio
+from jobs import JobManager, JOB_COMPLETED, JOB_FAILED
+from http_cache import (IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, cache_headers,
+                        cached_file_response, file_etag, not_modified)
+from midi_cache import ParsedMidiCache
+from midi_payload import (COMPRESS_MIN_BYTES, MIDI_BINARY_MEDIA_TYPE, OVERVIEW_BINARY_MEDIA_TYPE, compress_payload,
+                          encode_midi_binary, encode_overview_binary, midi_data_json,
+                          negotiate_binary, negotiate_encoding, overview_json)
+from result_store import MULTITRACK_MIDI_NAME, ResultStore, sweep_directory
+from uploads import UploadLimitMiddleware, save_upload_file
 
 # Configurazione logging
 logger = setup_logger(__name__)
 
+# Pool di job per separazione/trascrizione (processi worker CPU-bound)
+MAX_JOB_WORKERS = int(os.environ.get("MIDICOM_MAX_JOB_WORKERS", "1"))
+# Job terminati tenuti in memoria per /jobs (numero massimo e permanenza in secondi)
+MAX_FINISHED_JOBS = int(os.environ.get("MIDICOM_MAX_FINISHED_JOBS", "1000"))
+FINISHED_JOB_TTL_SECONDS = float(os.environ.get("MIDICOM_FINISHED_JOB_TTL", "86400"))
+job_manager = JobManager(max_workers=MAX_JOB_WORKERS, max_finished_jobs=MAX_FINISHED_JOBS,
+                         finished_ttl_seconds=FINISHED_JOB_TTL_SECONDS)
+# Processi per job dedicati alla trascrizione parallela degli stem
+TRANSCRIPTION_WORKERS = int(os.environ.get("MIDICOM_TRANSCRIPTION_WORKERS", "4"))
+
+
+async def cleanup_sweeper():
+    """Pulizia periodica di upload orfani, risultati incompleti e budget dell'archivio"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            active = job_manager.active_jobs()
+            await asyncio.to_thread(
+                sweep_directory, UPLOAD_DIR, TEMP_FILE_TTL_SECONDS,
+                [job.input_path for job in active if job.input_path]
+            )
+            await asyncio.to_thread(
+                result_store.sweep, TEMP_FILE_TTL_SECONDS, [job.job_id for job in active]
+            )
+        except Exception as e:
+            logger.error(f"Errore durante la pulizia dei file temporanei: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvio e arresto del pool di job e della pulizia periodica insieme al server"""
+    job_manager.start()
+    # Indice dell'archivio letto una volta all'avvio, fuori dall'event loop
+    await asyncio.to_thread(result_store.evict)
+    sweeper = asyncio.create_task(cleanup_sweeper())
+    yield
+    sweeper.cancel()
+    job_manager.shutdown()
+
+
 # Inizializzazione app FastAPI
 app = FastAPI(
     title="MIDICOM API",
     description="API per separazione audio e trascrizione MIDI",
     version="1.0.0",
     docs_url="/docs",  # Swagger UI disponibile su /docs
-    redoc_url="/redoc"  # ReDoc disponibile su /redoc
+    redoc_url="/redoc",  # ReDoc disponibile su /redoc
+    lifespan=lifespan
 )
 
+# Limiti di dimensione degli upload (scritti su disco a blocchi, mai interi in RAM)
+MAX_AUDIO_UPLOAD_MB = int(os.environ.get("MIDICOM_MAX_AUDIO_UPLOAD_MB", "500"))
+MAX_MIDI_UPLOAD_MB = int(os.environ.get("MIDICOM_MAX_MIDI_UPLOAD_MB", "20"))
+# Rifiuto sul Content-Length prima della lettura del multipart (aggiunto prima
+# di CORS così anche il 413 porta gli header CORS)
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/upload-midi": MAX_MIDI_UPLOAD_MB * 1024 * 1024,
+    "/probe": MAX_AUDIO_UPLOAD_MB * 1024 * 1024,
+    "/transcribe": MAX_AUDIO_UPLOAD_MB * 1024 * 1024
+})
+
 # Configurazione CORS per permettere richieste dal frontend
 app.add_middleware(
     CORSMiddleware,
@@ -52,106 +117,304 @@ app.add_middleware(
 
 # Directory per file temporanei
 UPLOAD_DIR = "temp_uploads"
-STEMS_DIR = "temp_stems"
-MIDI_DIR = "temp_midi"
+RESULTS_DIR = "temp_results"  # Archivio content-addressed di stem e MIDI
 TEST_MIDI_DIR = "test_samples"  # Directory per file MIDI di test
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(STEMS_DIR, exist_ok=True)
-os.makedirs(MIDI_DIR, exist_ok=True)
 os.makedirs(TEST_MIDI_DIR, exist_ok=True)
 
-def read_midi_file(file_path):
-    """
-    Legge un file MIDI e restituisce i dati in formato JSON.
+# Archivio dei risultati: un brano già elaborato con le stesse opzioni non
+# viene rielaborato. Eviction LRU oltre il budget, pulizia periodica dei temp.
+RESULT_STORE_MB = int(os.environ.get("MIDICOM_RESULT_STORE_MB", "5120"))
+TEMP_FILE_TTL_SECONDS = int(os.environ.get("MIDICOM_TEMP_FILE_TTL", "86400"))
+SWEEP_INTERVAL_SECONDS = int(os.environ.get("MIDICOM_SWEEP_INTERVAL", "600"))
+result_store = ResultStore(RESULTS_DIR, max_bytes=RESULT_STORE_MB * 1024 * 1024)
+
+# Capacità del modello CREPE (stessi valori di transcribe_to_midi.CREPE_CAPACITIES,
+# ripetuti qui per non importare librosa nel processo API)
+CREPE_CAPACITIES = ("tiny", "small", "medium", "large", "full")
+# Limiti dei parametri di trascrizione accettati da /transcribe
+MAX_HOP_LENGTH = 8192
+MAX_MIN_NOTE_DURATION = 10.0
+MAX_QUANTIZE_MS = 2000
+
+# Admission control prima dell'accodamento (0 = nessun limite)
+MAX_AUDIO_SECONDS = float(os.environ.get("MIDICOM_MAX_AUDIO_SECONDS", "3600"))
+MAX_QUEUE_WAIT_SECONDS = float(os.environ.get("MIDICOM_MAX_QUEUE_WAIT_SECONDS", "0"))
+# Secondi di elaborazione per secondo di audio (separazione + trascrizione), per l'ETA
+PROCESSING_RTF = float(os.environ.get("MIDICOM_PROCESSING_RTF", "1.2"))
+# Stream di progresso (/jobs/{id}/events): snapshot con ETA aggiornata almeno
+# ogni N secondi anche senza eventi (tiene viva la connessione nei proxy)
+JOB_EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("MIDICOM_JOB_EVENTS_HEARTBEAT", "15"))
+# Attesa (ms) prima che EventSource si riconnetta dopo una disconnessione
+JOB_EVENTS_RETRY_MS = 3000
+
+# Probe degli upload per sha256: lo stesso audio non viene riletto
+probe_cache: "OrderedDict[str, Dict]" = OrderedDict()
+
+# Cache dei MIDI parsati (risposte già serializzate, JSON o binarie, anche
+# compresse, e indici delle note per le query per finestra), budget in MB
+MIDI_CACHE_MB = int(os.environ.get("MIDICOM_MIDI_CACHE_MB", "256"))
+midi_cache = ParsedMidiCache(max_bytes=MIDI_CACHE_MB * 1024 * 1024)
+# Le risposte /midi dipendono da formato e codifica negoziati
+MIDI_VARY = "Accept, Accept-Encoding"
+
+
+def load_midi_json(file_path: str) -> bytes:
+    """Parsa un file MIDI e restituisce midi_data serializzato in JSON"""
+    # Import al primo parsing: mido e numpy non rallentano l'avvio del server
+    from midi_reader import read_midi_file
     
+    return json.dumps(read_midi_file(file_path)).encode("utf-8")
+
+
+def load_processed_json(file_path: str) -> bytes:
+    """Legge un risultato di trascrizione già in formato JSON"""
+    with open(file_path, "rb") as f:
+        return json.dumps(json.load(f)).encode("utf-8")
+
+
+def load_midi_index(file_path: str):
+    """Parsa un file MIDI direttamente in array e ne costruisce l'indice delle note"""
+    from midi_index import MidiIndex
+    from midi_reader import read_midi_arrays
+
+    return MidiIndex(read_midi_arrays(file_path))
+
+
+def load_processed_index(file_path: str):
+    """Indice delle note di un risultato di trascrizione JSON"""
+    from midi_index import MidiIndex
+
+    with open(file_path, "rb") as f:
+        return MidiIndex(json.load(f))
+
+
+def midi_window(start: Optional[float], end: Optional[float], tracks: Optional[str],
+                min_pitch: Optional[int], max_pitch: Optional[int],
+                optional: bool = True) -> Optional[Dict]:
+    """Parametri della query per finestra di /midi
+
     Args:
-        file_path: Percorso del file MIDI
-        
+        optional: Se nessun parametro è indicato restituisce None (file
+            intero) invece della finestra di default
+
+    Raises:
+        HTTPException: 400 se la finestra non è valida
+    """
+    if optional and all(value is None for value in (start, end, tracks, min_pitch, max_pitch)):
+        return None
+
+    window = {
+        "start": 0.0 if start is None else start,
+        "end": math.inf if end is None else end,
+        "tracks": [token.strip() for token in tracks.split(",") if token.strip()] if tracks else None,
+        "min_pitch": 0 if min_pitch is None else min_pitch,
+        "max_pitch": 127 if max_pitch is None else max_pitch
+    }
+    # end omesso = fino alla fine del brano; valori espliciti devono essere finiti
+    if (not all(value is None or math.isfinite(value) for value in (start, end))
+            or window["start"] < 0 or window["end"] <= window["start"]):
+        raise HTTPException(status_code=400, detail="Finestra non valida: serve 0 <= start < end (secondi finiti)")
+    if not 0 <= window["min_pitch"] <= window["max_pitch"] <= 127:
+        raise HTTPException(status_code=400, detail="Range di pitch non valido: serve 0 <= min_pitch <= max_pitch <= 127")
+    return window
+
+
+def check_audio_extension(filename: str) -> str:
+    """Estensione del file audio caricato (400 se non supportata)"""
+    file_extension = os.path.splitext(filename)[1].lower()
+    if file_extension not in AUDIO_EXTENSIONS:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Formato file non supportato. Usa: {', '.join(AUDIO_EXTENSIONS)}"
+        )
+    return file_extension
+
+
+async def probe_upload(file_path: str, sha256: str) -> Dict:
+    """Durata e formato di un audio caricato (header, decodifica solo come fallback)
+
+    Raises:
+        HTTPException: 400 se il file non è un audio leggibile
+    """
+    probe = probe_cache.get(sha256)
+    if probe is None:
+        try:
+            probe = await asyncio.to_thread(probe_audio, file_path)
+        except AudioDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"File audio non leggibile: {str(e)}")
+        probe_cache[sha256] = probe
+        while len(probe_cache) > PROBE_CACHE_SIZE:
+            probe_cache.popitem(last=False)
+    probe_cache.move_to_end(sha256)
+    return probe
+
+
+def admission(probe: Dict) -> Dict:
+    """Stima dei tempi e decisione di ammissione per un audio già analizzato
+
     Returns:
-        dict: Dati MIDI in formato JSON con BPM e timing info
+        dict: admitted, reason, status_code (413/503 se rifiutato),
+        estimated_seconds, queue_wait_seconds, eta_seconds
     """
-    try:
-        mid = mido.MidiFile(file_path)
-        
-        tracks = []
-        total_duration = 0
-        tempo = 500000  # Default tempo (microseconds per beat, 500000 = 120 BPM)
-        
-        # Extract tempo from first track (usually contains tempo meta messages)
-        for track in mid.tracks:
-            for msg in track:
-                if msg.type == 'set_tempo':
-                    tempo = msg.tempo
-                    break
-            if tempo != 500000:  # Found a tempo, break outer loop
-                break
-        
-        # Calculate BPM from tempo (microseconds per beat)
-        bpm = round(60_000_000 / tempo, 2)  # Convert microseconds to BPM
-        logger.info(f"MIDI file BPM: {bpm}, ticks_per_beat: {mid.ticks_per_beat}")
-        
-        # Calculate seconds per tick for time conversion
-        seconds_per_beat = 60.0 / bpm
-        seconds_per_tick = seconds_per_beat / mid.ticks_per_beat
-        
-        for i, track in enumerate(mid.tracks):
-            track_name = f"Track {i+1}"
-            notes = []
-            current_time_ticks = 0
-            
-            for msg in track:
-                current_time_ticks += msg.time
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    # Trova il note_off corrispondente
-                    note_off_time_ticks = current_time_ticks
-                    for j, next_msg in enumerate(track[track.index(msg)+1:], track.index(msg)+1):
-                        if (next_msg.type == 'note_off' and next_msg.note == msg.note) or \
-                           (next_msg.type == 'note_on' and next_msg.note == msg.note and next_msg.velocity == 0):
-                            note_off_time_ticks += sum(m.time for m in track[track.index(msg)+1:j+1])
-                            break
-                    
-                    duration_ticks = note_off_time_ticks - current_time_ticks
-                    if duration_ticks > 0:
-                        # Convert ticks to seconds
-                        time_seconds = current_time_ticks * seconds_per_tick
-                        duration_seconds = duration_ticks * seconds_per_tick
-                        
-                        # Log first note conversion for debugging
-                        if len(notes) == 0:
-                            logger.info(f"First note conversion: {current_time_ticks} ticks -> {time_seconds:.4f}s (seconds_per_tick={seconds_per_tick:.6f})")
-                        
-                        notes.append({
-                            "midi": msg.note,
-                            "time": time_seconds,
-                            "duration": duration_seconds,
-                            "velocity": msg.velocity
-                        })
-                
-                # Cerca track name
-                if msg.type == 'track_name':
-                    track_name = msg.name
-            
-            if notes:  # Solo aggiungi track con note
-                tracks.append({
-                    "name": track_name,
-                    "notes": notes
-                })
-                
-                # Calcola durata totale
-                for note in notes:
-                    total_duration = max(total_duration, note["time"] + note["duration"])
-        
-        return {
-            "duration": total_duration,
-            "tracks": tracks,
-            "bpm": bpm,
-            "ticks_per_beat": mid.ticks_per_beat
-        }
-        
-    except Exception as e:
-        logger.error(f"Errore nella lettura del file MIDI {file_path}: {str(e)}")
-        raise
+    estimated_seconds = probe["duration"] * PROCESSING_RTF
+    queue_wait_seconds = job_manager.backlog_seconds()
+    reason, status_code = None, None
+    if MAX_AUDIO_SECONDS and probe["duration"] > MAX_AUDIO_SECONDS:
+        reason = f"Audio troppo lungo ({probe['duration']:.0f}s, massimo {MAX_AUDIO_SECONDS:.0f}s)"
+        status_code = 413
+    elif MAX_QUEUE_WAIT_SECONDS and queue_wait_seconds > MAX_QUEUE_WAIT_SECONDS:
+        reason = f"Coda piena: attesa stimata {queue_wait_seconds:.0f}s"
+        status_code = 503
+    return {
+        "admitted": reason is None,
+        "reason": reason,
+        "status_code": status_code,
+        "estimated_seconds": round(estimated_seconds, 1),
+        "queue_wait_seconds": round(queue_wait_seconds, 1),
+        "eta_seconds": round(queue_wait_seconds + estimated_seconds * job_manager.estimate_scale, 1)
+    }
+
+
+def commit_job_result(job):
+    """Archivia il risultato di un job di trascrizione completato"""
+    result_store.commit(job.job_id, job.result,
+                        protected=[active.job_id for active in job_manager.active_jobs()])
+
+
+def commit_exported_stems(job):
+    """Aggiunge alla voce in archivio gli stem di un job export_stems"""
+    result = result_store.update_result(
+        job.job_id, {"stems": job.result["stems"], "stems_exported": True},
+        protected=[active.job_id for active in job_manager.active_jobs()]
+    )
+    if result is not None:
+        job.result = result  # /jobs/{id}/result restituisce la voce completa
+
+
+def sse_event(event: str, data: Dict) -> bytes:
+    """Messaggio Server-Sent Events con payload JSON su una riga"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def get_cached_midi(file_path: str, loader, variant: str) -> bytes:
+    """Hit dalla cache in-process; in caso di miss il parsing gira in un thread
+    per non bloccare l'event loop"""
+    payload = midi_cache.get(file_path, variant)
+    if payload is None:
+        payload = await asyncio.to_thread(midi_cache.load, file_path, loader, variant)
+    return payload
+
+
+def midi_json_body(filename: str, midi_json: bytes, source: str) -> bytes:
+    """Corpo della risposta /midi JSON attorno a midi_data già serializzato"""
+    return b"".join([
+        b'{"status":"success","filename":', json.dumps(filename).encode("utf-8"),
+        b',"midi_data":', midi_json,
+        b',"source":', json.dumps(source).encode("utf-8"), b'}'
+    ])
+
+
+def load_midi_overview(index_loader):
+    """Loader della piramide di occupazione, costruita dall'indice in cache"""
+    def load(file_path: str):
+        from midi_overview import MidiOverview
+
+        return MidiOverview(midi_cache.get_or_load(file_path, index_loader, "index"))
+    return load
+
+
+def find_midi_file(filename: str) -> Optional[Tuple]:
+    """File di /midi/{filename}: prima i risultati dei job, poi i file di test
+
+    Returns:
+        (path, source, json_loader, index_loader) o None se non esiste
+    """
+    midi_file = os.path.join(result_store.midi_dir(filename), "midi_data.json")
+    if ResultStore.is_valid_key(filename) and os.path.exists(midi_file):
+        result_store.touch(filename)
+        return midi_file, "processed", load_processed_json, load_processed_index
+
+    test_midi_path = os.path.join(TEST_MIDI_DIR, filename)
+    if os.path.exists(test_midi_path):
+        return test_midi_path, "uploaded_file", load_midi_json, load_midi_index
+    return None
+
+
+def encode_midi_window(midi_data: Dict, filename: str, source: str, binary: bool) -> bytes:
+    """Serializza il risultato di una query per finestra nel formato richiesto"""
+    if binary:
+        return encode_midi_binary(midi_data, filename=filename, source=source)
+    return midi_json_body(filename, json.dumps(midi_data_json(midi_data)).encode("utf-8"), source)
+
+
+def midi_cache_control(source: str) -> str:
+    """Cache-Control di /midi: immutabile per i risultati dei job
+    (content-addressed), sempre rivalidato per i file caricati"""
+    return IMMUTABLE_CACHE_CONTROL if source == "processed" else REVALIDATE_CACHE_CONTROL
+
+
+def encode_overview_tile(tile: Dict, filename: str, source: str, binary: bool) -> bytes:
+    """Serializza una tile di /midi/{filename}/overview nel formato richiesto"""
+    if binary:
+        return encode_overview_binary(tile, filename=filename, source=source)
+    return json.dumps({"status": "success", "filename": filename,
+                       "overview": overview_json(tile), "source": source}).encode("utf-8")
+
+
+async def midi_response(request: Request, filename: str, file_path: str, source: str,
+                        json_loader, index_loader, window: Optional[Dict] = None) -> Response:
+    """Risposta /midi nel formato e nella codifica negoziati con il client
+
+    Accept: application/vnd.midicom.notes seleziona il formato binario
+    struct-of-arrays (vedi midi_payload.py), altrimenti JSON. Il corpo viene
+    compresso con gzip/br secondo Accept-Encoding. Per il file intero ogni
+    combinazione è una variante della cache MIDI: né parsing né encoding si
+    ripetono per richiesta. Con una finestra (midi_window) le note vengono
+    estratte dall'indice in cache e serializzate per la singola richiesta.
+
+    L'ETag dipende dal file e dalla rappresentazione: se il client ha già
+    quella versione la risposta è un 304, prima di cache e parsing.
+    """
+    binary = negotiate_binary(request.headers.get("accept"))
+    media_type = MIDI_BINARY_MEDIA_TYPE if binary else "application/json"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+
+    etag = file_etag(file_path, media_type, encoding, json.dumps(window, sort_keys=True))
+    cache_control = midi_cache_control(source)
+    cached = not_modified(request, etag, cache_control, MIDI_VARY)
+    if cached is not None:
+        return cached
+    headers = cache_headers(etag, cache_control, MIDI_VARY)
+
+    if window is not None:
+        index = await get_cached_midi(file_path, index_loader, "index")
+        try:
+            midi_data = index.query(**window)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        body = await asyncio.to_thread(encode_midi_window, midi_data, filename, source, binary)
+        if encoding and len(body) >= COMPRESS_MIN_BYTES:
+            body = await asyncio.to_thread(compress_payload, body, encoding)
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    if binary:
+        variant = "binary"
+        loader = lambda path: encode_midi_binary(
+            midi_cache.get_or_load(path, index_loader, "index").to_midi_data(),
+            filename=filename, source=source
+        )
+    else:
+        variant = "json"
+        loader = lambda path: midi_json_body(filename, json_loader(path), source)
+
+    body = await get_cached_midi(file_path, loader, variant)
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        body = await get_cached_midi(file_path, lambda path: compress_payload(body, encoding),
+                                     f"{variant}.{encoding}")
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
 
 @app.get("/")
 async def root():
@@ -177,7 +440,10 @@ async def get_status():
         "status": "ok",
         "server": "MIDICOM API",
         "version": "1.0.0",
-        "uptime": "running"
+        "uptime": "running",
+        "midi_cache": midi_cache.stats(),
+        "result_store": result_store.stats(),
+        "jobs": job_manager.stats()
     }
 
 @app.post("/upload-midi")
@@ -199,117 +465,243 @@ async def upload_midi_file(midi_file: UploadFile = File(...)):
         # Crea directory se non esiste
         os.makedirs(TEST_MIDI_DIR, exist_ok=True)
         
-        # Salva il file
-        file_path = os.path.join(TEST_MIDI_DIR, midi_file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await midi_file.read()
-            buffer.write(content)
+        # Salva il file (streaming a blocchi su disco)
+        file_path = os.path.join(TEST_MIDI_DIR, os.path.basename(midi_file.filename))
+        saved = await save_upload_file(midi_file, file_path, MAX_MIDI_UPLOAD_MB * 1024 * 1024)
+        midi_cache.invalidate(file_path)
         
-        logger.info(f"File MIDI caricato: {midi_file.filename} ({len(content)} bytes)")
+        logger.info(f"File MIDI caricato: {midi_file.filename} ({saved['size']} bytes)")
         
         return JSONResponse({
             "status": "success",
             "filename": midi_file.filename,
-            "size": len(content),
+            "size": saved["size"],
+            "sha256": saved["sha256"],
             "message": f"File MIDI '{midi_file.filename}' caricato con successo"
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Errore durante l'upload del file MIDI: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Errore durante l'upload: {str(e)}")
 
-@app.post("/transcribe")
+@app.post("/probe")
+async def probe_audio_file(file: UploadFile = File(...)):
+    """
+    Durata, formato e tempi stimati di un audio, senza accodare nessun job
+    
+    La durata viene letta dagli header (soundfile o metadati del container);
+    il file viene decodificato solo se nessun header è leggibile.
+    
+    Args:
+        file (UploadFile): File audio da analizzare
+    
+    Returns:
+        dict: probe (durata, sample rate, canali, formato), stima
+        dell'elaborazione, attesa in coda e ammissione
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="Nessun file selezionato")
+    file_extension = check_audio_extension(file.filename)
+    
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{file_extension}")
+    try:
+        saved = await save_upload_file(file, file_path, MAX_AUDIO_UPLOAD_MB * 1024 * 1024)
+        probe = await probe_upload(file_path, saved["sha256"])
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    
+    estimate = admission(probe)
+    return {
+        "status": "success",
+        "filename": file.filename,
+        "size": saved["size"],
+        "sha256": saved["sha256"],
+        "probe": probe,
+        **{key: value for key, value in estimate.items() if key != "status_code"}
+    }
+
+@app.post("/transcribe", status_code=202)
 async def transcribe_audio(
+    response: Response,
     file: UploadFile = File(...),
     separation_model: str = Form("htdemucs"),
-    transcription_method: str = Form("librosa")
+    transcription_method: str = Form("librosa"),
+    hop_length: int = Form(512),
+    threshold_onset: float = Form(0.3),
+    min_note_duration: float = Form(0.1),
+    quantize_ms: int = Form(50),
+    export_stems: bool = Form(False),
+    crepe_capacity: str = Form("full"),
+    crepe_step_ms: int = Form(10),
+    crepe_batch_size: int = Form(256),
+    crepe_silence_db: Optional[float] = Form(None)
 ):
     """
     Endpoint per trascrizione audio in MIDI
     
+    Il file viene salvato e accodato come job: la risposta arriva subito con
+    il job_id, il lavoro gira nel pool di processi worker. Il job_id è la
+    chiave content-addressed del risultato: se lo stesso audio è già stato
+    elaborato con le stesse opzioni il risultato viene restituito subito.
+    
     Args:
         file (UploadFile): File audio da trascrivere
         separation_model (str): Modello per separazione audio (htdemucs, mdxt, etc.)
         transcription_method (str): Metodo di trascrizione (librosa, crepe, etc.)
+        hop_length, threshold_onset, min_note_duration, quantize_ms: Parametri
+            di MIDITranscriber (400 se fuori range; quantize_ms=0 disabilita
+            la quantizzazione)
+        export_stems (bool): Salva gli stem come WAV scaricabili da
+            /stems/{job_id}/{stem}; altrimenti restano solo in memoria.
+            Non fa parte della chiave: se il risultato è in archivio senza
+            stem, un job di sola separazione li esporta
+        crepe_capacity, crepe_step_ms, crepe_batch_size: Modello CREPE
+            (tiny..full), passo tra frame e batch di inferenza; ignorati
+            con transcription_method=librosa
+        crepe_silence_db (float): Gate RMS opzionale in dBFS per CREPE;
+            più veloce sugli stem con pause ma cambia le note rilevate
     
     Returns:
-        dict: Risultato della trascrizione con file MIDI generato
+        dict: job_id e URL per seguire stato e risultato
     """
     try:
         # Validazione file
         if not file.filename:
             raise HTTPException(status_code=400, detail="Nessun file selezionato")
         
-        # Controllo estensione file
-        allowed_extensions = ['.wav', '.mp3', '.flac', '.m4a', '.ogg']
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        if file_extension not in allowed_extensions:
+        file_extension = check_audio_extension(file.filename)
+        if crepe_capacity not in CREPE_CAPACITIES:
             raise HTTPException(
-                status_code=400, 
-                detail=f"Formato file non supportato. Usa: {', '.join(allowed_extensions)}"
+                status_code=400,
+                detail=f"crepe_capacity non valida. Usa: {', '.join(CREPE_CAPACITIES)}"
             )
+        if crepe_step_ms < 1 or crepe_batch_size < 1:
+            raise HTTPException(status_code=400, detail="crepe_step_ms e crepe_batch_size devono essere >= 1")
+        # Parametri del trascrittore controllati prima dell'upload: valori non
+        # validi fallirebbero solo dopo la separazione (ed entrerebbero nella chiave)
+        if not 1 <= hop_length <= MAX_HOP_LENGTH:
+            raise HTTPException(status_code=400, detail=f"hop_length deve essere tra 1 e {MAX_HOP_LENGTH}")
+        if not (math.isfinite(threshold_onset) and 0 <= threshold_onset <= 1):
+            raise HTTPException(status_code=400, detail="threshold_onset deve essere tra 0 e 1")
+        if not (math.isfinite(min_note_duration) and 0 <= min_note_duration <= MAX_MIN_NOTE_DURATION):
+            raise HTTPException(status_code=400,
+                                detail=f"min_note_duration deve essere tra 0 e {MAX_MIN_NOTE_DURATION:g} secondi")
+        if not 0 <= quantize_ms <= MAX_QUANTIZE_MS:
+            raise HTTPException(status_code=400,
+                                detail=f"quantize_ms deve essere tra 0 (disabilitata) e {MAX_QUANTIZE_MS}")
+        if crepe_silence_db is not None and not math.isfinite(crepe_silence_db):
+            raise HTTPException(status_code=400, detail="crepe_silence_db deve essere un numero finito")
         
-        # Salvataggio file temporaneo
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        logger.info(f"File ricevuto: {file.filename} ({len(content)} bytes)")
-        
-        # TODO: Implementare logica di trascrizione
-        # 1. Separazione audio con Demucs
-        # 2. Trascrizione MIDI con librosa/CREPE
-        # 3. Generazione file MIDI
+        # Salvataggio file temporaneo (nome univoco, streaming a blocchi)
+        file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{file_extension}")
+        saved = await save_upload_file(file, file_path, MAX_AUDIO_UPLOAD_MB * 1024 * 1024)
         
-        # Per ora, simula il processing e crea file mock
-        await asyncio.sleep(2)  # Simula processing time
+        logger.info(f"File ricevuto: {file.filename} ({saved['size']} bytes, sha256 {saved['sha256'][:12]})")
         
-        # Crea stems mock
-        stems_data = {
-            "drums": f"{STEMS_DIR}/drums_{file.filename}",
-            "bass": f"{STEMS_DIR}/bass_{file.filename}",
-            "other": f"{STEMS_DIR}/other_{file.filename}",
-            "vocals": f"{STEMS_DIR}/vocals_{file.filename}"
+        transcriber_params = {
+            "hop_length": hop_length,
+            "threshold_onset": threshold_onset,
+            "min_note_duration": min_note_duration,
+            "quantize_ms": quantize_ms
         }
-        
-        # Crea MIDI mock
-        midi_data = {
-            "duration": 10.0,
-            "tracks": [
-                {
-                    "name": "Piano",
-                    "notes": [
-                        {"midi": 60, "time": 0, "duration": 1, "velocity": 80},
-                        {"midi": 64, "time": 1, "duration": 1, "velocity": 75},
-                        {"midi": 67, "time": 2, "duration": 1, "velocity": 82},
-                        {"midi": 72, "time": 3, "duration": 1, "velocity": 90}
-                    ]
-                }
-            ]
+        if transcription_method != "librosa":
+            # Solo quando CREPE può essere usato: non cambiano la chiave dei job librosa
+            transcriber_params.update({
+                "crepe_capacity": crepe_capacity,
+                "crepe_step_ms": crepe_step_ms,
+                "crepe_batch_size": crepe_batch_size
+            })
+            if crepe_silence_db is not None:
+                transcriber_params["crepe_silence_db"] = crepe_silence_db
+        options = {
+            "separation_model": separation_model,
+            "transcription_method": transcription_method,
+            "transcriber_params": transcriber_params,
+            "transcription_workers": TRANSCRIPTION_WORKERS,
+            # Core ripartiti tra le separazioni simultanee del pool
+            "separation_options": {"concurrent_jobs": MAX_JOB_WORKERS},
+            "export_stems": export_stems
         }
+        # Chiave dei soli input che determinano il MIDI: gli stem WAV sono
+        # un artefatto opzionale della stessa voce
+        result_key = ResultStore.make_key(
+            saved["sha256"], separation_model, transcription_method, transcriber_params
+        )
+        manifest = result_store.lookup(result_key)
+        active = job_manager.get_active(result_key)
         
-        # Salva stems info
-        stems_file = os.path.join(STEMS_DIR, f"stems_{file.filename}.json")
-        with open(stems_file, "w") as f:
-            json.dump(stems_data, f)
-        
-        # Salva MIDI data
-        midi_file = os.path.join(MIDI_DIR, f"midi_{file.filename}.json")
-        with open(midi_file, "w") as f:
-            json.dump(midi_data, f)
+        # 1. Risultato già in archivio (con gli stem, se richiesti): nessuna nuova elaborazione
+        if manifest is not None and (not export_stems or manifest["result"].get("stems_exported")):
+            os.remove(file_path)
+            job = job_manager.add_completed(result_key, file.filename, options, manifest["result"])
+            response.status_code = 200
+            logger.info(f"♻️ Risultato riutilizzato per {file.filename}: {result_key[:12]}")
+        # 2. Stesso brano già in elaborazione: si aggancia al job esistente, se
+        # produce anche gli stem richiesti (altrimenti si riprova al termine:
+        # la voce sarà in archivio e gli stem verranno esportati su richiesta)
+        elif active is not None:
+            os.remove(file_path)
+            if export_stems and not active.options.get("export_stems"):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Job in corso sullo stesso audio senza export degli stem: riprova al termine",
+                    headers={"Retry-After": str(int(job_manager.eta_seconds(result_key) or 60))}
+                )
+            job = active
+            logger.info(f"♻️ Job già in corso per {file.filename}: {result_key[:12]}")
+        # 3. Nuovo job che scrive direttamente nell'archivio, se ammesso: la
+        # pipeline completa, o solo la separazione se manca l'export degli stem
+        else:
+            try:
+                probe = await probe_upload(file_path, saved["sha256"])
+            except HTTPException:
+                os.remove(file_path)
+                raise
+            estimate = admission(probe)
+            if not estimate["admitted"]:
+                os.remove(file_path)
+                logger.warning(f"🚫 Job rifiutato per {file.filename}: {estimate['reason']}")
+                raise HTTPException(
+                    status_code=estimate["status_code"],
+                    detail=estimate["reason"],
+                    headers={"Retry-After": str(int(estimate["queue_wait_seconds"]))}
+                    if estimate["status_code"] == 503 else None
+                )
+            export_only = manifest is not None
+            if not export_only:
+                result_store.remove(result_key)  # Residui di un eventuale job fallito
+            job = job_manager.submit(
+                file_path,
+                file.filename,
+                result_store.stems_dir(result_key),
+                result_store.midi_dir(result_key),
+                options=options,
+                job_id=result_key,
+                on_success=commit_exported_stems if export_only else commit_job_result,
+                cleanup_input=True,
+                estimated_seconds=estimate["estimated_seconds"],
+                task="export_stems" if export_only else "transcribe"
+            )
+            if export_only:
+                logger.info(f"📤 Export degli stem per il risultato in archivio {result_key[:12]}")
         
         return {
-            "status": "success",
-            "message": "File ricevuto e processato correttamente",
+            "status": job.status if job.cached else "accepted",
+            "message": "Risultato già disponibile" if job.cached else "File ricevuto, elaborazione in coda",
+            "job_id": job.job_id,
+            "cached": job.cached,
             "filename": file.filename,
-            "size": len(content),
+            "size": saved["size"],
+            "sha256": saved["sha256"],
             "separation_model": separation_model,
             "transcription_method": transcription_method,
-            "stems_file": stems_file,
-            "midi_file": midi_file,
-            "processing_time": 2.0
+            "estimated_seconds": job.estimated_seconds,
+            "eta_seconds": job_manager.eta_seconds(job.job_id),
+            "status_url": f"/jobs/{job.job_id}",
+            "result_url": f"/jobs/{job.job_id}/result"
         }
         
     except HTTPException:
@@ -318,31 +710,145 @@ async def transcribe_audio(
         logger.error(f"Errore durante trascrizione: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
+@app.get("/jobs")
+async def list_jobs():
+    """
+    Elenco dei job di trascrizione
+    
+    Returns:
+        dict: Job con stato e progresso
+    """
+    return {"status": "success", "jobs": job_manager.list()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Stato e progresso di un job
+    
+    Args:
+        job_id (str): Id restituito da /transcribe
+    
+    Returns:
+        dict: Stato del job (queued, running, completed, failed)
+    """
+    job = job_manager.snapshot(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} non trovato")
+    return {"status": "success", "job": job}
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """
+    Stream del progresso di un job (Server-Sent Events)
+    
+    Un evento "progress" con lo stato del job (come /jobs/{job_id}, con
+    eta_seconds) a ogni confine di fase della pipeline: decode, separate
+    (per segmento), onset, pitch, group, quantize, write. Senza eventi lo
+    snapshot viene ripetuto ogni MIDICOM_JOB_EVENTS_HEARTBEAT secondi con
+    l'ETA aggiornata. Lo stream termina con un evento "completed" o "failed".
+    
+    Args:
+        job_id (str): Id restituito da /transcribe
+    
+    Returns:
+        StreamingResponse: text/event-stream
+    """
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} non trovato")
+    
+    async def stream():
+        yield f"retry: {JOB_EVENTS_RETRY_MS}\n\n".encode("utf-8")
+        with job_manager.listen(job_id) as changed:
+            while True:
+                # Prima dello snapshot: un aggiornamento successivo risveglia l'attesa
+                changed.clear()
+                job = job_manager.snapshot(job_id)
+                if job is None:  # Scartato dalla retention dei job terminati
+                    return
+                if job["status"] in (JOB_COMPLETED, JOB_FAILED):
+                    yield sse_event(job["status"], job)
+                    return
+                yield sse_event("progress", job)
+                try:
+                    await asyncio.wait_for(changed.wait(), JOB_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # no-transform/X-Accel-Buffering: nessun buffering o compressione nei proxy
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Risultato di un job completato
+    
+    Args:
+        job_id (str): Id restituito da /transcribe
+    
+    Returns:
+        dict: Stems, file MIDI e statistiche; 409 se il job non è terminato
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} non trovato")
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=f"Job fallito: {job.error}")
+    if job.status != JOB_COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job non ancora completato ({job.status})")
+    
+    return {
+        "status": "success",
+        "job_id": job_id,
+        "filename": job.filename,
+        "result": job.result,
+        "stems_url": f"/stems/{job_id}",
+        "midi_url": f"/midi/{job_id}"
+    }
+
 @app.get("/stems/{filename}")
-async def get_stems(filename: str):
+async def get_stems(filename: str, request: Request):
     """
     Endpoint per ottenere i stems separati
     
     Args:
-        filename (str): Nome del file processato
+        filename (str): Id del job di trascrizione
     
     Returns:
         dict: Informazioni sui stems disponibili
     """
     try:
-        stems_file = os.path.join(STEMS_DIR, f"stems_{filename}.json")
+        if not ResultStore.is_valid_key(filename):
+            raise HTTPException(status_code=404, detail="Stems non trovati per questo file")
+        
+        stems_file = os.path.join(result_store.stems_dir(filename), "stems.json")
         
         if not os.path.exists(stems_file):
             raise HTTPException(status_code=404, detail="Stems non trovati per questo file")
+        result_store.touch(filename)
+        
+        # Elenco rivalidato: un export successivo degli stem lo cambia
+        etag = file_etag(stems_file)
+        cached = not_modified(request, etag, REVALIDATE_CACHE_CONTROL)
+        if cached is not None:
+            return cached
         
         with open(stems_file, "r") as f:
             stems_data = json.load(f)
         
-        return {
-            "status": "success",
-            "filename": filename,
-            "stems": stems_data
-        }
+        # Percorsi relativi a /stems: il frontend li usa come URL dei WAV
+        return JSONResponse(
+            content={
+                "status": "success",
+                "filename": filename,
+                "exported": bool(stems_data),
+                "stems": {name: f"{filename}/{name}" for name in stems_data}
+            },
+            headers=cache_headers(etag, REVALIDATE_CACHE_CONTROL)
+        )
         
     except HTTPException:
         raise
@@ -350,48 +856,80 @@ async def get_stems(filename: str):
         logger.error(f"Errore nel recupero stems: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
+@app.get("/stems/{filename}/{stem_name}")
+async def get_stem_audio(filename: str, stem_name: str, request: Request):
+    """
+    Endpoint per scaricare il WAV di uno stem (job con export_stems)
+    
+    Args:
+        filename (str): Id del job di trascrizione
+        stem_name (str): Nome dello stem (drums, bass, other, vocals)
+    
+    Returns:
+        FileResponse: Audio WAV dello stem (con ETag, 304 e richieste Range)
+    """
+    if not ResultStore.is_valid_key(filename):
+        raise HTTPException(status_code=404, detail="Stem non trovato")
+    
+    stems_file = os.path.join(result_store.stems_dir(filename), "stems.json")
+    try:
+        with open(stems_file, "r") as f:
+            stems_data = json.load(f)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=404, detail="Stem non trovato")
+    
+    # Solo nomi elencati in stems.json (nessun path arbitrario dall'URL)
+    stem_path = stems_data.get(stem_name)
+    if stem_path is None or not os.path.exists(stem_path):
+        raise HTTPException(
+            status_code=404,
+            detail="Stem non disponibile: richiedi export_stems in /transcribe"
+        )
+    result_store.touch(filename)
+    
+    return cached_file_response(request, stem_path, IMMUTABLE_CACHE_CONTROL,
+                                filename=f"{stem_name}.wav", media_type="audio/wav")
+
 @app.get("/midi/{filename}")
-async def get_midi(filename: str):
+async def get_midi(filename: str, request: Request,
+                   start: Optional[float] = None,
+                   end: Optional[float] = None,
+                   tracks: Optional[str] = None,
+                   min_pitch: Optional[int] = None,
+                   max_pitch: Optional[int] = None):
     """
     Endpoint per ottenere i dati MIDI trascritti
     Cerca prima nei file processati, poi nei file di test
     
     Args:
-        filename (str): Nome del file processato o di test
+        filename (str): Id del job di trascrizione o nome del file di test
+        start, end (float): Finestra temporale in secondi: solo le note che
+            suonano in [start, end)
+        tracks (str): Tracce da includere, per indice o nome separati da virgola
+        min_pitch, max_pitch (int): Range di note MIDI da includere
     
     Returns:
-        dict: Dati MIDI trascritti
+        dict: Dati MIDI trascritti, oppure il payload binario se il client
+        invia Accept: application/vnd.midicom.notes. Con una finestra le
+        tracce riportano "index" e midi_data contiene "window"
     """
+    window = midi_window(start, end, tracks, min_pitch, max_pitch)
     try:
-        # Prima cerca nei file processati
-        midi_file = os.path.join(MIDI_DIR, f"midi_{filename}.json")
+        # Prima cerca nei file processati (risultati dei job), poi nei file di test
+        found = find_midi_file(filename)
         
-        if os.path.exists(midi_file):
-            with open(midi_file, "r") as f:
-                midi_data = json.load(f)
-            
-            return {
-                "status": "success",
-                "filename": filename,
-                "midi_data": midi_data,
-                "source": "processed"
-            }
-        
-        # Se non trovato, cerca nei file di test
-        test_midi_path = os.path.join(TEST_MIDI_DIR, filename)
+        if found is not None and found[1] == "processed":
+            return await midi_response(request, filename, *found, window)
         
-        if os.path.exists(test_midi_path):
+        if found is not None:
             try:
-                # Leggi il file MIDI reale
-                real_midi_data = read_midi_file(test_midi_path)
+                # Leggi il file MIDI reale (o la versione in cache se invariato)
+                response = await midi_response(request, filename, *found, window)
                 logger.info(f"✅ MIDI file read successfully: {filename}")
                 
-                return {
-                    "status": "success",
-                    "filename": filename,
-                    "midi_data": real_midi_data,
-                    "source": "uploaded_file"
-                }
+                return response
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.error(f"Errore nella lettura del file MIDI {filename}: {str(e)}")
                 # Fallback a dati mock se la lettura fallisce
@@ -433,33 +971,105 @@ async def get_midi(filename: str):
         logger.error(f"Errore nel recupero MIDI: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
+@app.get("/midi/{filename}/overview")
+async def get_midi_overview(filename: str, request: Request,
+                            start: Optional[float] = None,
+                            end: Optional[float] = None,
+                            width: int = 1024,
+                            tracks: Optional[str] = None,
+                            min_pitch: Optional[int] = None,
+                            max_pitch: Optional[int] = None):
+    """
+    Riepilogo di occupazione delle note per le viste a zoom ridotto
+    
+    Restituisce la tile del livello (potenza di due) con circa un bucket per
+    pixel: il costo di rendering dipende da width e non dal numero di note.
+    
+    Args:
+        filename (str): Id del job di trascrizione o nome del file di test
+        start, end (float): Intervallo visibile in secondi (default: brano intero)
+        width (int): Larghezza della vista in pixel
+        tracks (str): Tracce da includere, per indice o nome separati da virgola
+        min_pitch, max_pitch (int): Range di note MIDI da includere
+    
+    Returns:
+        dict: Tile di occupazione (vedi midi_overview.MidiOverview.tile), o
+        il payload binario se il client invia Accept: application/vnd.midicom.overview
+    """
+    window = midi_window(start, end, tracks, min_pitch, max_pitch, optional=False)
+    if width < 1:
+        raise HTTPException(status_code=400, detail="width deve essere almeno 1")
+    
+    found = find_midi_file(filename)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"MIDI file {filename} not found")
+    file_path, source, _, index_loader = found
+    
+    binary = negotiate_binary(request.headers.get("accept"), OVERVIEW_BINARY_MEDIA_TYPE)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    etag = file_etag(file_path, "overview", binary, encoding, width, json.dumps(window, sort_keys=True))
+    cache_control = midi_cache_control(source)
+    cached = not_modified(request, etag, cache_control, MIDI_VARY)
+    if cached is not None:
+        return cached
+    
+    try:
+        overview = await get_cached_midi(file_path, load_midi_overview(index_loader), "overview")
+        tile = overview.tile(width=width, **window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Errore nel calcolo dell'overview MIDI {filename}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
+    
+    body = await asyncio.to_thread(encode_overview_tile, tile, filename, source, binary)
+    headers = cache_headers(etag, cache_control, MIDI_VARY)
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        body = await asyncio.to_thread(compress_payload, body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=OVERVIEW_BINARY_MEDIA_TYPE if binary else "application/json",
+                    headers=headers)
+
 @app.get("/download/{file_type}/{filename}")
-async def download_file(file_type: str, filename: str):
+async def download_file(file_type: str, filename: str, request: Request):
     """
     Endpoint per scaricare file processati
     
     Args:
-        file_type (str): Tipo di file ('stems' o 'midi')
-        filename (str): Nome del file
+        file_type (str): Tipo di file ('stems', 'midi' o 'multitrack')
+        filename (str): Id del job di trascrizione
     
     Returns:
-        FileResponse: File da scaricare
+        FileResponse: File da scaricare (con ETag, 304 e richieste Range)
     """
     try:
+        media_type = "application/json"
+        download_name = f"{file_type}_{filename}"
+        cache_control = IMMUTABLE_CACHE_CONTROL
         if file_type == "stems":
-            file_path = os.path.join(STEMS_DIR, f"stems_{filename}.json")
+            cache_control = REVALIDATE_CACHE_CONTROL  # Cambia con l'export degli stem
+            file_path = os.path.join(result_store.stems_dir(filename), "stems.json")
         elif file_type == "midi":
-            file_path = os.path.join(MIDI_DIR, f"midi_{filename}.json")
+            file_path = os.path.join(result_store.midi_dir(filename), "midi_data.json")
+        elif file_type == "multitrack":
+            file_path = os.path.join(result_store.midi_dir(filename), MULTITRACK_MIDI_NAME)
+            media_type = "audio/midi"
+            download_name = f"{filename}.mid"
         else:
             raise HTTPException(status_code=400, detail="Tipo file non supportato")
         
+        if not ResultStore.is_valid_key(filename):
+            raise HTTPException(status_code=404, detail="File non trovato")
+        
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File non trovato")
         
-        return FileResponse(
-            path=file_path,
-            filename=f"{file_type}_{filename}",
-            media_type="application/json"
+        return cached_file_response(
+            request,
+            file_path,
+            cache_control,
+            filename=download_name,
+            media_type=media_type
         )
         
     except HTTPException:
@@ -476,14 +1086,17 @@ async def health_check():
     Returns:
         dict: Stato di salute del server
     """
+    job_stats = job_manager.stats()
+    processing = "ok" if job_stats["pool_active"] else "stopped"
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "services": {
             "api": "ok",
-            "audio_processing": "pending",  # TODO: Verificare stato servizi
-            "midi_generation": "pending"
-        }
+            "audio_processing": processing,
+            "midi_generation": processing
+        },
+        "jobs": job_stats
     }
 
 # Handler per errori 404
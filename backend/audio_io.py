@@ -0,0 +1,300 @@
+"""
+MIDICOM Audio I/O
+=================
+
+Decodifica audio nel processo: il file viene letto in un buffer NumPy
+float32 (soundfile, poi audioread) e ricampionato in memoria, senza WAV
+temporanei su disco. ffmpeg resta solo come fallback per i codec che le
+librerie non leggono, e anche in quel caso l'audio arriva via pipe.
+
+probe_audio legge durata e formato dagli header (soundfile, poi i metadati
+del container via ffprobe) e decodifica solo se nessun header è leggibile;
+il risultato è in cache per file (path, dimensione, mtime).
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+# numpy viene importato al primo uso: il processo API usa solo probe_audio
+if TYPE_CHECKING:
+    import numpy as np
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+# File diversi di cui si tiene in cache il probe
+PROBE_CACHE_SIZE = 256
+# Formati audio accettati (upload e ricerca nelle directory in modalità batch)
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.ogg')
+
+
+class AudioDecodeError(Exception):
+    """Nessun decoder disponibile riesce a leggere il file"""
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_available() -> bool:
+    """Verifica (una sola volta per processo) che ffmpeg sia installato"""
+    if shutil.which("ffmpeg") is None:
+        return False
+    try:
+        subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
+        return True
+    except (subprocess.CalledProcessError, OSError):
+        return False
+
+
+def _decode_soundfile(path: str) -> Tuple["np.ndarray", int]:
+    """WAV, FLAC, OGG, MP3 (libsndfile >= 1.1) senza processi esterni"""
+    import soundfile as sf
+
+    data, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+    return data.T, sample_rate
+
+
+def _decode_audioread(path: str) -> Tuple["np.ndarray", int]:
+    """Formati compressi tramite i backend di audioread (PCM int16 a blocchi)"""
+    import audioread
+    import numpy as np
+
+    with audioread.audio_open(path) as f:
+        channels, sample_rate = f.channels, f.samplerate
+        pcm = b"".join(f)
+    data = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    return data.reshape(-1, channels).T, sample_rate
+
+
+def _decode_ffmpeg(path: str) -> Tuple["np.ndarray", int]:
+    """Fallback ffmpeg: PCM float32 letto da stdout, nessun file intermedio"""
+    if not ffmpeg_available():
+        raise AudioDecodeError("FFmpeg non trovato")
+
+    import numpy as np
+
+    try:
+        info = _probe_ffprobe(path)
+        sample_rate, channels = info["sample_rate"], info["channels"]
+    except (AudioDecodeError, OSError):
+        sample_rate, channels = 44100, 2  # ffprobe assente: formato fissato in uscita
+
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", path, "-f", "f32le",
+         "-ar", str(sample_rate), "-ac", str(channels), "-"],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise AudioDecodeError(result.stderr.decode(errors="replace").strip())
+    data = np.frombuffer(result.stdout, dtype="<f4")
+    return data.reshape(-1, channels).T, sample_rate
+
+
+def decode_audio(path: str) -> Tuple["np.ndarray", int]:
+    """Decodifica un file audio in memoria
+
+    Returns:
+        Tuple[audio, sample_rate]: audio float32 con shape (canali, campioni)
+
+    Raises:
+        AudioDecodeError: se nessun decoder legge il file
+    """
+    errors = []
+    for name, decoder in (("soundfile", _decode_soundfile),
+                          ("audioread", _decode_audioread),
+                          ("ffmpeg", _decode_ffmpeg)):
+        try:
+            audio, sample_rate = decoder(path)
+        except Exception as e:
+            errors.append(f"{name}: {str(e) or type(e).__name__}")
+            continue
+        if audio.size == 0:
+            errors.append(f"{name}: nessun campione")
+            continue
+        logger.info(f"🎧 Decodificato con {name}: {audio.shape[1] / sample_rate:.1f}s, "
+                    f"{sample_rate}Hz, {audio.shape[0]} canali")
+        return audio, sample_rate
+
+    raise AudioDecodeError(f"Impossibile decodificare {path} ({'; '.join(errors)})")
+
+
+def prepare_audio(audio: "np.ndarray", sample_rate: int,
+                  target_rate: int, channels: Optional[int] = None) -> "np.ndarray":
+    """Ricampiona e adatta i canali in memoria
+
+    Args:
+        audio: Audio (canali, campioni)
+        sample_rate: Sample rate di audio
+        target_rate: Sample rate richiesto dal modello
+        channels: Canali richiesti (mono duplicato, downmix verso mono,
+            canali extra scartati)
+    """
+    import numpy as np
+
+    if channels is not None and audio.shape[0] != channels:
+        if audio.shape[0] == 1:
+            audio = np.repeat(audio, channels, axis=0)
+        elif channels == 1:
+            audio = audio.mean(axis=0, keepdims=True)
+        elif audio.shape[0] > channels:
+            audio = audio[:channels]
+        else:
+            raise ValueError(f"Impossibile convertire {audio.shape[0]} canali in {channels}")
+
+    if sample_rate != target_rate:
+        import librosa
+
+        audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=target_rate, axis=-1)
+    return np.ascontiguousarray(audio, dtype=np.float32)
+
+
+def _probe_soundfile(path: str) -> Dict:
+    """Header letto da libsndfile (WAV, FLAC, OGG, MP3 con libsndfile >= 1.1)"""
+    import soundfile as sf
+
+    info = sf.info(path)
+    return {
+        "duration": info.frames / info.samplerate,
+        "sample_rate": info.samplerate,
+        "channels": info.channels,
+        "format": info.format.lower()
+    }
+
+
+def _probe_ffprobe(path: str) -> Dict:
+    """Metadati del container via ffprobe (nessuna decodifica dell'audio)"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0",
+         "-show_entries", "stream=sample_rate,channels:format=duration,format_name",
+         "-of", "default=noprint_wrappers=1", path],
+        capture_output=True, text=True
+    )
+    fields = dict(line.split("=", 1) for line in result.stdout.splitlines() if "=" in line)
+    try:
+        info = {
+            "duration": float(fields["duration"]),
+            "sample_rate": int(fields["sample_rate"]),
+            "channels": int(fields["channels"]),
+            "format": fields.get("format_name", "").split(",")[0]
+        }
+    except (KeyError, ValueError):
+        raise AudioDecodeError(result.stderr.strip() or "metadati audio assenti")
+    return info
+
+
+def _probe_decode(path: str) -> Dict:
+    """Ultima risorsa: durata dai campioni decodificati"""
+    audio, sample_rate = decode_audio(path)
+    return {
+        "duration": audio.shape[1] / sample_rate,
+        "sample_rate": sample_rate,
+        "channels": audio.shape[0],
+        "format": os.path.splitext(path)[1].lstrip(".").lower()
+    }
+
+
+@lru_cache(maxsize=PROBE_CACHE_SIZE)
+def _probe_cached(path: str, size: int, mtime_ns: int, decode_fallback: bool) -> Dict:
+    """Probe memoizzato: dimensione e mtime invalidano la voce se il file cambia"""
+    probers = [("soundfile", _probe_soundfile)]
+    if ffmpeg_available():
+        probers.append(("ffprobe", _probe_ffprobe))
+    if decode_fallback:
+        probers.append(("decode", _probe_decode))
+
+    errors = []
+    for name, prober in probers:
+        try:
+            info = prober(path)
+        except Exception as e:
+            errors.append(f"{name}: {str(e) or type(e).__name__}")
+            continue
+        if info["duration"] <= 0:
+            errors.append(f"{name}: durata non disponibile")
+            continue
+        info["method"] = name
+        info["size"] = size
+        logger.info(f"🔎 Probe {name}: {info['duration']:.1f}s, {info['sample_rate']}Hz, "
+                    f"{info['channels']} canali ({info['format']})")
+        return info
+
+    raise AudioDecodeError(f"Impossibile leggere il formato di {path} ({'; '.join(errors)})")
+
+
+def probe_audio(path: str, decode_fallback: bool = True) -> Dict:
+    """Durata e formato di un file audio, senza decodificarlo se possibile
+
+    Args:
+        path: File audio
+        decode_fallback: Se nessun header è leggibile decodifica il file
+            (costoso, ma dà comunque la durata)
+
+    Returns:
+        dict: {"duration", "sample_rate", "channels", "format", "method", "size"}
+
+    Raises:
+        AudioDecodeError: se il formato non è leggibile
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise AudioDecodeError(f"File non accessibile: {path} ({e})")
+    return dict(_probe_cached(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, decode_fallback))
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Durata in secondi dagli header, o None (nessuna decodifica)"""
+    try:
+        return probe_audio(path, decode_fallback=False)["duration"]
+    except AudioDecodeError:
+        return None
+
+
+def collect_audio_files(inputs: List[str]) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """File audio da file, directory (ricorsive) e glob
+
+    Input con lo stesso percorso relativo senza estensione (stesso nome da
+    directory o glob diversi, oppure song.wav e song.flac) finirebbero sullo
+    stesso output: ricevono un suffisso con l'hash breve del path assoluto,
+    stabile tra un'esecuzione e l'altra.
+
+    Returns:
+        Tuple[coppie, non trovati]: coppie (path, percorso relativo) ordinate
+        per path (per i file trovati in una directory il percorso relativo a
+        essa, altrimenti il nome del file) e input senza nessun file audio
+    """
+    files = {}
+    unmatched = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = [(os.path.join(root, name), os.path.relpath(os.path.join(root, name), pattern))
+                       for root, _, names in os.walk(pattern) for name in names]
+        else:
+            matches = [(path, os.path.basename(path)) for path in glob.glob(pattern, recursive=True)]
+        found = [(path, relative) for path, relative in matches
+                 if os.path.isfile(path) and path.lower().endswith(AUDIO_EXTENSIONS)]
+        if not found:
+            logger.warning(f"⚠️ Nessun file audio per l'input: {pattern}")
+            unmatched.append(pattern)
+        for path, relative in found:
+            # Lo stesso file raggiunto da due input conta una volta sola
+            files[os.path.normpath(path)] = relative
+
+    stems = Counter(os.path.normcase(os.path.splitext(relative)[0]) for relative in files.values())
+    for path, relative in files.items():
+        stem, extension = os.path.splitext(relative)
+        if stems[os.path.normcase(stem)] > 1:
+            digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+            files[path] = f"{stem}-{digest}{extension}"
+            logger.warning(f"⚠️ Nome duplicato: {path} -> {files[path]}")
+    return sorted(files.items()), unmatched
@@ -0,0 +1,105 @@
+"""
+MIDICOM CPU Scheduler
+=====================
+
+Sceglie il parallelismo di Demucs in base ai core disponibili e al numero di
+separazioni che girano in contemporanea (i worker del pool dei job).
+
+Su CPU Demucs ha due livelli di parallelismo:
+- jobs: segmenti del brano elaborati in parallelo (thread di apply_model)
+- thread intra-op di torch usati da ogni convoluzione
+
+Lo scaling intra-op oltre pochi thread è sublineare, quindi i core assegnati
+a un job vanno prima ai thread torch (fino a MAX_TORCH_THREADS) e il resto a
+segmenti paralleli. Il totale jobs × thread non supera mai la quota del job:
+separazioni simultanee non si contendono i core.
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import os
+from typing import Dict, Optional
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+# Oltre questa soglia un thread torch in più rende meno di un segmento in più
+MAX_TORCH_THREADS = 4
+# Segmento minimo (secondi): sotto, l'overlap tra segmenti domina il costo
+MIN_SEGMENT_SECONDS = 4.0
+
+
+def available_cores() -> int:
+    """Core utilizzabili dal processo (affinity e quota CPU del cgroup)"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # sched_getaffinity non esiste su macOS/Windows
+        cores = os.cpu_count() or 1
+
+    # Container: quota cgroup v2 ("max 100000" = nessun limite)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cores)
+
+
+def plan_separation(concurrent_jobs: int = 1,
+                    cores: Optional[int] = None,
+                    duration: Optional[float] = None,
+                    max_segment: Optional[float] = None,
+                    jobs: Optional[int] = None,
+                    segment: Optional[float] = None,
+                    torch_threads: Optional[int] = None) -> Dict:
+    """Parallelismo di una separazione Demucs
+
+    I valori passati esplicitamente (jobs, segment, torch_threads) vengono
+    rispettati; quelli a None sono scelti dallo scheduler.
+
+    Args:
+        concurrent_jobs: Separazioni eseguite in contemporanea sulla macchina
+        cores: Core disponibili (default: available_cores())
+        duration: Durata del brano in secondi, se nota
+        max_segment: Segmento massimo supportato dal modello (es. 7.8s per htdemucs)
+        jobs: Segmenti in parallelo forzati
+        segment: Lunghezza segmento forzata in secondi
+        torch_threads: Thread intra-op torch forzati
+
+    Returns:
+        dict: {"cores", "torch_threads", "jobs", "segment"}
+    """
+    cores = cores or available_cores()
+    cores_per_job = max(1, cores // max(1, concurrent_jobs))
+
+    if torch_threads is None:
+        if jobs is not None:
+            torch_threads = max(1, cores_per_job // jobs)  # Core restanti ai thread torch
+        else:
+            torch_threads = min(MAX_TORCH_THREADS, cores_per_job)
+    if jobs is None:
+        jobs = max(1, cores_per_job // torch_threads)
+
+    # Segmenti abbastanza corti da dare lavoro a tutti i jobs
+    if segment is None and duration and jobs > 1:
+        segment = max(MIN_SEGMENT_SECONDS, duration / jobs)
+    if segment is not None and max_segment is not None:
+        segment = min(segment, max_segment)
+
+    plan = {"cores": cores_per_job, "torch_threads": torch_threads, "jobs": jobs, "segment": segment}
+    logger.info(f"🧮 Piano CPU: {plan} ({cores} core, {concurrent_jobs} separazioni simultanee)")
+    return plan
+
+
+def apply_torch_threads(num_threads: int):
+    """Imposta i thread intra-op di torch per il processo corrente"""
+    import torch
+
+    if torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
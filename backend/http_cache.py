@@ -0,0 +1,102 @@
+"""
+MIDICOM HTTP Cache
+==================
+
+Validatori HTTP per le risposte di MIDI, stem e download: ETag forti,
+Cache-Control e GET condizionali (If-None-Match -> 304 Not Modified).
+
+L'ETag si calcola dalla firma del file su disco (mtime in ns, dimensione)
+e dalla rappresentazione servita (formato, Content-Encoding, parametri
+della query): il 304 arriva dopo una sola stat, senza leggere né parsare
+il file. Le risposte di file (FileResponse) supportano anche le richieste
+Range e If-Range (download parziali e ripresi degli stem grandi).
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import hashlib
+import os
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+# Import logger centralizzato
+from logger import setup_logger
+from midi_cache import file_signature
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+# Validità in cache dei risultati dei job (secondi)
+RESULT_MAX_AGE = int(os.environ.get("MIDICOM_RESULT_MAX_AGE", "86400"))
+# Risultati dei job: l'id è l'hash del contenuto, quindi lo stesso URL
+# restituisce sempre gli stessi byte
+IMMUTABLE_CACHE_CONTROL = f"private, max-age={RESULT_MAX_AGE}, immutable"
+# File caricati dall'utente (sovrascrivibili): in cache ma sempre rivalidati
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    """ETag forte dalle parti che identificano la rappresentazione"""
+    digest = hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def file_etag(path: str, *parts) -> str:
+    """ETag di un file (path, mtime, dimensione) e della sua rappresentazione
+
+    Raises:
+        OSError: se il file non esiste
+    """
+    real_path = os.path.realpath(path)
+    return make_etag(real_path, *file_signature(real_path), *parts)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Confronto debole di If-None-Match con l'ETag corrente (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str, cache_control: str, vary: Optional[str] = None) -> Dict[str, str]:
+    """Header di validazione di una risposta"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def not_modified(request: Request, etag: str, cache_control: str,
+                 vary: Optional[str] = None) -> Optional[Response]:
+    """304 se il client ha già questa rappresentazione, altrimenti None"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers(etag, cache_control, vary))
+    return None
+
+
+def cached_file_response(request: Request, path: str, cache_control: str, **kwargs) -> Response:
+    """FileResponse con ETag forte, Cache-Control e 304 condizionale
+
+    Range e If-Range sono gestiti da Starlette (>= 0.39) con lo stesso ETag.
+
+    Args:
+        request: Richiesta HTTP (If-None-Match)
+        path: File da inviare
+        cache_control: Valore di Cache-Control
+        **kwargs: Argomenti di FileResponse (filename, media_type, ...)
+    """
+    etag = file_etag(path)
+    return not_modified(request, etag, cache_control) or FileResponse(
+        path=path, headers=cache_headers(etag, cache_control), **kwargs
+    )
@@ -0,0 +1,442 @@
+"""
+MIDICOM Job Manager
+===================
+
+Sottosistema di job asincroni per separazione + trascrizione.
+Il lavoro CPU-bound (Demucs, librosa, CREPE) gira in un ProcessPoolExecutor
+limitato, così un job lungo non blocca l'event loop di FastAPI né /health.
+I worker inviano il progresso al processo API tramite una multiprocessing.Queue;
+gli endpoint di streaming (/jobs/{id}/events) vengono svegliati a ogni
+aggiornamento tramite listener asyncio.
+
+ETA: stima iniziale (durata × RTF) corretta dal ritmo osservato del job
+in corso e, per i job in coda, dal rapporto tempo reale / stima dei job
+già completati (che sale quando la macchina è carica).
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+# Stati possibili di un job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Peso dell'ultimo job completato nella correzione delle stime (media mobile)
+ESTIMATE_SMOOTHING = 0.3
+
+# Tipi di job: funzione di pipeline.py eseguita nel worker
+JOB_TASKS = {
+    "transcribe": "run_transcription_pipeline",
+    "export_stems": "run_stems_export"  # Solo stem WAV di un risultato in archivio
+}
+
+# Coda di progresso del processo worker (impostata da _init_worker)
+_worker_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    """Inizializzatore dei processi worker
+
+    I worker vivono quanto il pool: i modelli Demucs precaricati qui restano
+    caldi per tutti i job successivi (vedi model_registry.py).
+    """
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+    from model_registry import PRELOAD_MODELS, get_model_registry
+
+    registry = get_model_registry()
+    registry.start_reaper()
+    registry.preload([name.strip() for name in PRELOAD_MODELS.split(",") if name.strip()])
+
+
+def _run_job(job_id: str, input_path: str, stems_dir: str, midi_dir: str,
+             options: Dict, task: str = "transcribe") -> Dict:
+    """Entry point eseguito nel processo worker"""
+    # Import nel worker: i moduli pesanti non vengono caricati nel processo API
+    import pipeline
+
+    def progress(stage: str, fraction: float, message: str = ""):
+        _worker_progress_queue.put((job_id, stage, fraction, message))
+
+    progress("started", 0.0, "Job avviato")
+    return getattr(pipeline, JOB_TASKS[task])(
+        input_path,
+        stems_dir,
+        midi_dir,
+        progress=progress,
+        **options
+    )
+
+
+class Job:
+    """Stato di un job di trascrizione"""
+
+    def __init__(self, job_id: str, filename: str, options: Dict,
+                 input_path: Optional[str] = None,
+                 estimated_seconds: Optional[float] = None):
+        self.job_id = job_id
+        self.filename = filename
+        self.options = options
+        self.input_path = input_path
+        self.estimated_seconds = estimated_seconds
+        self.cached = False
+        self.status = JOB_QUEUED
+        self.stage = JOB_QUEUED
+        self.progress = 0.0
+        self.message = "In coda"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        """Rappresentazione JSON per gli endpoint /jobs"""
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 4),
+            "message": self.message,
+            "options": self.options,
+            "cached": self.cached,
+            "estimated_seconds": self.estimated_seconds,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """Gestisce la coda dei job e il pool di processi worker"""
+
+    def __init__(self, max_workers: int = 1, max_finished_jobs: int = 1000,
+                 finished_ttl_seconds: float = 86400):
+        """
+        Args:
+            max_workers: Numero massimo di job eseguiti in parallelo
+            max_finished_jobs: Job terminati (completati o falliti) tenuti in
+                memoria per /jobs; oltre il limite si scartano i più vecchi
+            finished_ttl_seconds: Permanenza massima di un job terminato
+                (0 = nessun limite); i risultati restano nel ResultStore
+        """
+        self.max_workers = max_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.finished_ttl_seconds = finished_ttl_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._progress_thread: Optional[threading.Thread] = None
+        self._on_success: Dict[str, Callable[[Job], None]] = {}
+        self._cleanup_inputs: Set[str] = set()
+        self._listeners: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        # Tempo reale / tempo stimato dei job completati (media mobile)
+        self._estimate_scale = 1.0
+
+    def start(self):
+        """Avvia pool e thread di progresso (chiamato allo startup dell'app)"""
+        if self._executor is not None:
+            return
+
+        # spawn: i worker non ereditano thread/stato dell'event loop del server
+        context = multiprocessing.get_context("spawn")
+        self._progress_queue = context.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._progress_queue,)
+        )
+        self._progress_thread = threading.Thread(
+            target=self._drain_progress, name="job-progress", daemon=True
+        )
+        self._progress_thread.start()
+        logger.info(f"✅ Job manager avviato ({self.max_workers} worker)")
+
+    def shutdown(self):
+        """Ferma il pool (i job in corso vengono completati)"""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._progress_queue.put(None)
+        self._progress_thread.join(timeout=5)
+        self._executor = None
+        logger.info("🛑 Job manager fermato")
+
+    def submit(self, input_path: str, filename: str, stems_dir: str, midi_dir: str,
+               options: Dict, job_id: Optional[str] = None,
+               on_success: Optional[Callable[[Job], None]] = None,
+               cleanup_input: bool = False,
+               estimated_seconds: Optional[float] = None,
+               task: str = "transcribe") -> Job:
+        """Accoda un job e restituisce subito il suo stato
+
+        Args:
+            input_path: File audio da elaborare
+            filename: Nome originale del file (solo informativo)
+            stems_dir: Directory di output degli stem
+            midi_dir: Directory di output dei file MIDI
+            options: Opzioni passate a run_transcription_pipeline
+            job_id: Id del job (generato se assente)
+            on_success: Callback invocata con il job completato
+            cleanup_input: Se True, input_path viene rimosso a fine job
+            estimated_seconds: Durata stimata dell'elaborazione (per l'ETA dei job in coda)
+            task: Tipo di job (vedi JOB_TASKS)
+        """
+        if self._executor is None:
+            self.start()
+
+        job = Job(job_id or uuid.uuid4().hex, filename, options, input_path, estimated_seconds)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            if on_success is not None:
+                self._on_success[job.job_id] = on_success
+            if cleanup_input:
+                self._cleanup_inputs.add(job.job_id)
+
+        future = self._executor.submit(
+            _run_job, job.job_id, input_path, stems_dir, midi_dir, options, task
+        )
+        future.add_done_callback(lambda f, job_id=job.job_id: self._on_done(job_id, f))
+        logger.info(f"📥 Job {job.job_id} accodato: {filename}")
+        return job
+
+    def add_completed(self, job_id: str, filename: str, options: Dict, result: Dict) -> Job:
+        """Registra un job già completato (risultato trovato in archivio)"""
+        job = Job(job_id, filename, options)
+        job.status = job.stage = JOB_COMPLETED
+        job.progress = 1.0
+        job.message = "Risultato già disponibile"
+        job.cached = True
+        job.started_at = job.finished_at = job.created_at
+        job.result = result
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune_finished()
+        return job
+
+    def get_active(self, job_id: str) -> Optional[Job]:
+        """Restituisce il job se è ancora in coda o in esecuzione"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in (JOB_QUEUED, JOB_RUNNING):
+                return job
+            return None
+
+    def active_jobs(self) -> List[Job]:
+        """Job in coda o in esecuzione (le loro directory non vanno pulite)"""
+        with self._lock:
+            return [job for job in self._jobs.values()
+                    if job.status in (JOB_QUEUED, JOB_RUNNING)]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Restituisce un job per id"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def estimate_scale(self) -> float:
+        """Rapporto tra tempo reale e stimato dei job completati (1.0 senza storico)"""
+        return self._estimate_scale
+
+    def snapshot(self, job_id: str) -> Optional[Dict]:
+        """Stato del job con ETA aggiornata (per /jobs/{id} e /jobs/{id}/events)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        return {**job.to_dict(), "eta_seconds": self.eta_seconds(job_id)}
+
+    @contextmanager
+    def listen(self, job_id: str) -> Iterator[asyncio.Event]:
+        """Evento asyncio segnalato a ogni aggiornamento del job
+
+        Va usato dall'event loop: gli aggiornamenti arrivano dai thread di
+        progresso e di completamento, che svegliano il loop con
+        call_soon_threadsafe. Più aggiornamenti tra due attese si fondono in
+        uno: chi legge lo snapshot riceve sempre lo stato più recente.
+        """
+        listener = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._listeners.setdefault(job_id, []).append(listener)
+        try:
+            yield listener[1]
+        finally:
+            with self._lock:
+                listeners = self._listeners.get(job_id, [])
+                listeners.remove(listener)
+                if not listeners:
+                    self._listeners.pop(job_id, None)
+
+    def _notify(self, job_id: str):
+        """Sveglia i listener di un job"""
+        with self._lock:
+            listeners = list(self._listeners.get(job_id, ()))
+        for loop, changed in listeners:
+            try:
+                loop.call_soon_threadsafe(changed.set)
+            except RuntimeError:  # Event loop già chiuso (shutdown)
+                pass
+
+    def list(self) -> List[Dict]:
+        """Elenco dei job (più recenti prima)"""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+            return [job.to_dict() for job in jobs]
+
+    def backlog_seconds(self) -> float:
+        """Attesa stimata prima che un nuovo job parta
+
+        Lavoro residuo dei job in coda e in esecuzione (stima × progresso
+        mancante) ripartito sui worker del pool.
+        """
+        with self._lock:
+            remaining = sum(self._remaining_seconds(job) for job in self._jobs.values())
+        return remaining / max(1, self.max_workers)
+
+    def eta_seconds(self, job_id: str) -> Optional[float]:
+        """Secondi stimati al completamento di un job (None se terminato o senza stima)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.estimated_seconds is None \
+                    or job.status not in (JOB_QUEUED, JOB_RUNNING):
+                return None
+            eta = self._remaining_seconds(job)
+            if job.status == JOB_QUEUED:
+                # Job accodati prima: lavoro residuo ripartito sui worker
+                ahead = sum(self._remaining_seconds(other) for other in self._jobs.values()
+                            if other.created_at < job.created_at)
+                eta += ahead / max(1, self.max_workers)
+        return round(eta, 1)
+
+    def _remaining_seconds(self, job: Job) -> float:
+        """Lavoro stimato ancora da svolgere per un job attivo
+
+        La stima iniziale è scalata dal rapporto reale / stimato dei job
+        completati; per un job in corso si fonde con l'estrapolazione del
+        ritmo osservato (tempo trascorso / progresso), con peso crescente
+        man mano che il progresso avanza.
+        """
+        if job.status not in (JOB_QUEUED, JOB_RUNNING):
+            return 0.0
+        remaining = (job.estimated_seconds or 0.0) * self._estimate_scale * (1.0 - job.progress)
+        if job.status == JOB_RUNNING and job.started_at is not None and job.progress > 0:
+            observed = (time.time() - job.started_at) * (1.0 - job.progress) / job.progress
+            remaining = (1.0 - job.progress) * remaining + job.progress * observed
+        return remaining
+
+    def stats(self) -> Dict:
+        """Conteggio dei job per stato, per /status e /health"""
+        with self._lock:
+            counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_COMPLETED: 0, JOB_FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {"max_workers": self.max_workers, "pool_active": self._executor is not None,
+                "backlog_seconds": round(self.backlog_seconds(), 1),
+                "estimate_scale": round(self._estimate_scale, 3), **counts}
+
+    def _drain_progress(self):
+        """Thread che applica gli eventi di progresso inviati dai worker"""
+        while True:
+            event = self._progress_queue.get()
+            if event is None:
+                break
+            job_id, stage, fraction, message = event
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.status in (JOB_COMPLETED, JOB_FAILED):
+                    continue
+                if job.status == JOB_QUEUED:
+                    job.status = JOB_RUNNING
+                    job.started_at = time.time()
+                job.stage = stage
+                job.progress = fraction
+                job.message = message
+            self._notify(job_id)
+
+    def _prune_finished(self):
+        """Scarta i job terminati scaduti od oltre il limite (con il lock acquisito)
+
+        Il job appena terminato è il più recente: resta visibile a /jobs e
+        agli stream di eventi ancora aperti.
+        """
+        now = time.time()
+        finished = sorted(
+            (job for job in self._jobs.values() if job.status in (JOB_COMPLETED, JOB_FAILED)),
+            key=lambda job: job.finished_at or job.created_at
+        )
+        excess = len(finished) - self.max_finished_jobs
+        for position, job in enumerate(finished):
+            expired = self.finished_ttl_seconds and \
+                now - (job.finished_at or job.created_at) > self.finished_ttl_seconds
+            if position < excess or expired:
+                del self._jobs[job.job_id]
+
+    def _on_done(self, job_id: str, future: Future):
+        """Callback di completamento del future"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.finished_at = time.time()
+
+            if future.cancelled():
+                job.status = JOB_FAILED
+                job.error = "Job annullato"
+            elif future.exception() is not None:
+                job.status = JOB_FAILED
+                job.error = str(future.exception())
+            elif not future.result().get("success"):
+                job.status = JOB_FAILED
+                job.result = future.result()
+                job.error = job.result.get("error", "Errore sconosciuto")
+            else:
+                job.status = JOB_COMPLETED
+                job.result = future.result()
+                job.progress = 1.0
+                if job.estimated_seconds and job.started_at is not None:
+                    ratio = (job.finished_at - job.started_at) / job.estimated_seconds
+                    self._estimate_scale += ESTIMATE_SMOOTHING * (ratio - self._estimate_scale)
+
+            job.stage = job.status
+            job.message = job.error or "Completato"
+            on_success = self._on_success.pop(job_id, None)
+            cleanup_input = job_id in self._cleanup_inputs
+            self._cleanup_inputs.discard(job_id)
+            self._prune_finished()
+        self._notify(job_id)
+
+        if cleanup_input and job.input_path and os.path.exists(job.input_path):
+            os.remove(job.input_path)
+
+        if job.status == JOB_FAILED:
+            logger.error(f"❌ Job {job_id} fallito: {job.error}")
+            return
+
+        logger.info(f"🎉 Job {job_id} completato")
+        if on_success is not None:
+            try:
+                on_success(job)
+            except Exception as e:
+                logger.error(f"❌ Errore nel completamento del job {job_id}: {e}")
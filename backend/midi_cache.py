@@ -0,0 +1,149 @@
+"""
+MIDICOM Parsed MIDI Cache
+=========================
+
+Cache in-process LRU dei file MIDI già parsati.
+Ogni voce è validata con (mtime, size) del file su disco, quindi un file
+sovrascritto viene riparsato automaticamente.
+
+Uno stesso file può avere più varianti in cache (JSON, binario, versioni
+compresse, indice delle note): ognuna è una voce separata con la propria
+dimensione nel budget.
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+
+def file_signature(path: str) -> Tuple[int, int]:
+    """Firma economica del contenuto di un file: (mtime in ns, dimensione)"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def payload_size(value: Any) -> int:
+    """Dimensione di una voce: nbytes per indici e array, altrimenti len (bytes)"""
+    nbytes = getattr(value, "nbytes", None)
+    return nbytes if nbytes is not None else len(value)
+
+
+class ParsedMidiCache:
+    """Cache LRU con budget di memoria e contatori hit/miss
+
+    Le chiavi sono (path reale del file, variante); il valore viene
+    ricaricato se la firma (mtime, size) del file è cambiata. Quando la somma
+    delle dimensioni supera max_bytes vengono rimosse le voci usate meno di
+    recente.
+    """
+
+    def __init__(self, max_bytes: int, size_of: Callable[[Any], int] = payload_size):
+        """
+        Args:
+            max_bytes: Budget di memoria totale della cache
+            size_of: Funzione che stima la dimensione in byte di un valore
+        """
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Tuple[int, int], Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, variant: str = "") -> Optional[Any]:
+        """Restituisce il valore in cache se ancora valido, altrimenti None"""
+        real_path = os.path.realpath(path)
+        signature = file_signature(real_path)
+        key = (real_path, variant)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, path: str, value: Any, signature: Optional[Tuple[int, int]] = None,
+            variant: str = ""):
+        """Inserisce un valore ed applica l'eviction LRU"""
+        real_path = os.path.realpath(path)
+        signature = signature or file_signature(real_path)
+        key = (real_path, variant)
+        size = self.size_of(value)
+
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                logger.warning(f"⚠️ Voce troppo grande per la cache MIDI: {real_path} ({size} bytes)")
+                return
+
+            self._entries[key] = (signature, value, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_load(self, path: str, loader: Callable[[str], Any], variant: str = "") -> Any:
+        """Restituisce il valore in cache o lo calcola con loader(path)"""
+        value = self.get(path, variant)
+        if value is not None:
+            return value
+        return self.load(path, loader, variant)
+
+    def load(self, path: str, loader: Callable[[str], Any], variant: str = "") -> Any:
+        """Calcola il valore con loader(path) e lo inserisce in cache"""
+        # La firma va letta prima del parsing: se il file cambia durante il
+        # caricamento la voce risulterà scaduta alla prossima richiesta
+        signature = file_signature(os.path.realpath(path))
+        value = loader(path)
+        self.put(path, value, signature, variant)
+        return value
+
+    def invalidate(self, path: str):
+        """Rimuove tutte le varianti relative a un file (es. dopo un nuovo upload)"""
+        real_path = os.path.realpath(path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == real_path]:
+                self._discard(key)
+
+    def clear(self):
+        """Svuota la cache mantenendo i contatori"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict:
+        """Statistiche della cache per /status"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _discard(self, key: Tuple[str, str]):
+        """Rimuove una voce (da chiamare con il lock acquisito)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
@@ -0,0 +1,167 @@
+"""
+MIDICOM MIDI Index
+==================
+
+Indice a intervalli delle note di un file MIDI per le query per finestra
+(tempo, pitch, tracce) di /midi/{filename}: il PianoRoll scarica solo le
+note visibili invece dell'intero file.
+
+Per ogni traccia le note sono ordinate per inizio, con il massimo
+cumulativo delle fine (max_end[i] = max(end[0..i])). Le note che si
+sovrappongono a [start, end) hanno indice in [lo, hi) con
+    hi = prima nota che inizia a end o dopo   (searchsorted su time)
+    lo = prima nota con max_end > start       (searchsorted su max_end)
+e si filtrano solo le note in quel range: O(log n + k) invece di O(n).
+Note lunghe che iniziano molto prima della finestra allargano [lo, hi),
+ma mai oltre le note che iniziano prima di end.
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Import logger centralizzato
+from logger import setup_logger
+from midi_payload import track_arrays
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+MIN_PITCH = 0
+MAX_PITCH = 127
+
+
+def select_tracks(names: Sequence[str], tracks: Optional[Sequence[str]]) -> List[int]:
+    """Indici delle tracce richieste per posizione ("0") o per nome ("bass")
+
+    Args:
+        names: Nomi delle tracce del file, in ordine
+        tracks: Tracce richieste (None o vuoto = tutte)
+
+    Raises:
+        ValueError: se una traccia non esiste
+    """
+    if not tracks:
+        return list(range(len(names)))
+
+    positions = {name: i for i, name in enumerate(names)}
+    selected = []
+    for token in tracks:
+        if token.isdigit() and int(token) < len(names):
+            selected.append(int(token))
+        elif token in positions:
+            selected.append(positions[token])
+        else:
+            raise ValueError(f"Traccia inesistente: {token}")
+    return sorted(set(selected))
+
+
+class TrackIndex:
+    """Note di una traccia ordinate per inizio, con max_end cumulativo"""
+
+    def __init__(self, name: str, arrays: Dict[str, np.ndarray]):
+        """
+        Args:
+            name: Nome della traccia
+            arrays: time/duration/pitch/velocity ordinati per inizio (track_arrays)
+        """
+        self.name = name
+        self.time = np.ascontiguousarray(arrays["time"], dtype=np.float64)
+        self.duration = np.ascontiguousarray(arrays["duration"], dtype=np.float64)
+        self.pitch = np.ascontiguousarray(arrays["pitch"], dtype=np.int64)
+        self.velocity = np.ascontiguousarray(arrays["velocity"], dtype=np.int64)
+        self.max_end = np.maximum.accumulate(self.time + self.duration) if len(self.time) else self.time
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria occupata dagli array"""
+        return sum(values.nbytes for values in
+                   (self.time, self.duration, self.pitch, self.velocity, self.max_end))
+
+    def query(self, start: float, end: float,
+              min_pitch: int = MIN_PITCH, max_pitch: int = MAX_PITCH) -> np.ndarray:
+        """Indici delle note che suonano in [start, end) con pitch nel range"""
+        lo = int(np.searchsorted(self.max_end, start, side="right"))
+        hi = int(np.searchsorted(self.time, end, side="left"))
+        if lo >= hi:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = slice(lo, hi)
+        mask = self.time[candidates] + self.duration[candidates] > start
+        if min_pitch > MIN_PITCH or max_pitch < MAX_PITCH:
+            pitch = self.pitch[candidates]
+            mask &= (pitch >= min_pitch) & (pitch <= max_pitch)
+        return np.flatnonzero(mask) + lo
+
+    def arrays(self, indices=slice(None)) -> Dict[str, np.ndarray]:
+        """Traccia (o sottoinsieme di note) nel formato di read_midi_arrays"""
+        return {
+            "name": self.name,
+            "time": self.time[indices],
+            "duration": self.duration[indices],
+            "pitch": self.pitch[indices],
+            "velocity": self.velocity[indices]
+        }
+
+
+class MidiIndex:
+    """Indice di un file MIDI: metadati e un TrackIndex per traccia"""
+
+    def __init__(self, midi_data: Dict):
+        """
+        Args:
+            midi_data: Dati MIDI (tracce JSON o di read_midi_arrays)
+        """
+        self.metadata = {key: value for key, value in midi_data.items() if key != "tracks"}
+        self.tracks = [TrackIndex(track["name"], track_arrays(track)) for track in midi_data["tracks"]]
+        logger.info(f"🗂️ Indice MIDI: {sum(len(track) for track in self.tracks):,} note, "
+                    f"{len(self.tracks)} tracce")
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria occupata dall'indice (per il budget della cache MIDI)"""
+        return sum(track.nbytes for track in self.tracks)
+
+    def select_tracks(self, tracks: Optional[Sequence[str]]) -> List[int]:
+        """Indici delle tracce richieste (vedi select_tracks)"""
+        return select_tracks([track.name for track in self.tracks], tracks)
+
+    def to_midi_data(self) -> Dict:
+        """Tutte le note, tracce nel formato di read_midi_arrays"""
+        return {**self.metadata, "tracks": [track.arrays() for track in self.tracks]}
+
+    def query(self, start: float = 0.0, end: float = float("inf"),
+              tracks: Optional[Sequence[str]] = None,
+              min_pitch: int = MIN_PITCH, max_pitch: int = MAX_PITCH) -> Dict:
+        """Note visibili in una finestra tempo/pitch
+
+        Returns:
+            dict: Metadati del file e tracce selezionate (array, con "index"
+            = posizione della traccia nel file), più "window" con i
+            parametri della query e il numero di note restituite
+        """
+        result_tracks = []
+        for i in self.select_tracks(tracks):
+            track = self.tracks[i]
+            window = track.arrays(track.query(start, end, min_pitch, max_pitch))
+            window["index"] = i
+            result_tracks.append(window)
+
+        return {
+            **self.metadata,
+            "tracks": result_tracks,
+            "window": {
+                "start": start,
+                "end": end if np.isfinite(end) else None,
+                "min_pitch": min_pitch,
+                "max_pitch": max_pitch,
+                "tracks": [track["index"] for track in result_tracks],
+                "notes": sum(len(track["time"]) for track in result_tracks)
+            }
+        }
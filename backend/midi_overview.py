@@ -0,0 +1,183 @@
+"""
+MIDICOM MIDI Overview
+=====================
+
+Riepiloghi multi-risoluzione delle note per le viste a zoom ridotto del
+PianoRoll: invece di tutte le note il client riceve una "tile" di
+occupazione (traccia × bucket di tempo × pitch) alla risoluzione dello
+schermo, quindi il costo di rendering dipende dai pixel e non dalle note.
+
+Livelli a potenze di due:
+- livello 0: bucket di base_seconds (potenza di due, scelta perché il
+  brano stia in al massimo MAX_BUCKETS bucket)
+- livello k: bucket di base_seconds * 2^k, media di coppie del livello k-1
+
+Ogni cella vale la frazione del bucket in cui la nota suona (0-255 in
+uint8; più note sovrapposte sullo stesso pitch saturano a 255). La memoria
+totale è circa il doppio del livello 0: con 4 tracce e 4096 bucket ~4 MB.
+
+Per gli zoom più fini del livello 0 il client usa le query per finestra
+di /midi/{filename} (vedi midi_index.py): la tile lo segnala con "detail".
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Import logger centralizzato
+from logger import setup_logger
+from midi_index import MAX_PITCH, MIN_PITCH, MidiIndex, select_tracks
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+# Bucket al livello più fine (per l'intero brano)
+MAX_BUCKETS = 4096
+# Bucket minimo: sotto i ~16 ms il livello 0 non serve più (file brevi)
+MIN_BUCKET_SECONDS = 2.0 ** -6
+# Bucket massimi per tile (larghezza richiesta in pixel)
+MAX_TILE_WIDTH = 8192
+PITCHES = MAX_PITCH - MIN_PITCH + 1
+
+
+def occupancy_grid(time: np.ndarray, duration: np.ndarray, pitch: np.ndarray,
+                   bucket_seconds: float, buckets: int) -> np.ndarray:
+    """Frazione di ogni bucket in cui ciascun pitch suona (float, buckets × 128)
+
+    Le note che coprono bucket interi si sommano con un array di differenze
+    (+1 al primo bucket pieno, -1 dopo l'ultimo, poi cumsum); i bucket di
+    inizio e fine ricevono la sola frazione coperta.
+    """
+    grid = np.zeros((buckets + 1, PITCHES), dtype=np.float64)
+    if len(time) == 0:
+        return grid[:buckets]
+
+    start = time / bucket_seconds
+    end = (time + duration) / bucket_seconds
+    first = np.minimum(start.astype(np.int64), buckets - 1)
+    last = np.minimum(end.astype(np.int64), buckets)
+    pitch = pitch - MIN_PITCH
+
+    # Nota contenuta in un solo bucket
+    single = first == last
+    np.add.at(grid, (first[single], pitch[single]), end[single] - start[single])
+
+    # Nota su più bucket: coda del primo, testa dell'ultimo, bucket interi nel mezzo
+    multi = ~single
+    first, last, pitch = first[multi], last[multi], pitch[multi]
+    np.add.at(grid, (first, pitch), first + 1 - start[multi])
+    np.add.at(grid, (last, pitch), end[multi] - last)
+    full = np.zeros_like(grid)
+    np.add.at(full, (first + 1, pitch), 1.0)
+    np.add.at(full, (last, pitch), -1.0)
+    grid += np.cumsum(full, axis=0)
+    return grid[:buckets]
+
+
+def _quantize(grid: np.ndarray) -> np.ndarray:
+    """Occupazione [0, 1] in uint8 0-255"""
+    return np.rint(np.clip(grid, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+class MidiOverview:
+    """Piramide di occupazione per traccia a risoluzioni potenze di due"""
+
+    def __init__(self, index: MidiIndex):
+        """
+        Args:
+            index: Indice delle note del file (midi_index.MidiIndex)
+        """
+        self.duration = float(max((track.max_end[-1] for track in index.tracks if len(track)),
+                                  default=0.0))
+        self.track_names = [track.name for track in index.tracks]
+        self.base_seconds = max(MIN_BUCKET_SECONDS,
+                                2.0 ** math.ceil(math.log2(max(self.duration, 1e-9) / MAX_BUCKETS)))
+        buckets = max(1, math.ceil(self.duration / self.base_seconds))
+
+        grid = np.stack([
+            occupancy_grid(track.time, track.duration, track.pitch, self.base_seconds, buckets)
+            for track in index.tracks
+        ]) if index.tracks else np.zeros((0, buckets, PITCHES))
+
+        # Livello k+1 = media di coppie di bucket del livello k
+        self.levels: List[np.ndarray] = [_quantize(grid)]
+        while grid.shape[1] > 1:
+            if grid.shape[1] % 2:
+                grid = np.concatenate([grid, np.zeros_like(grid[:, :1])], axis=1)
+            grid = 0.5 * (grid[:, 0::2] + grid[:, 1::2])
+            self.levels.append(_quantize(grid))
+
+        logger.info(f"🗺️ Overview MIDI: {len(self.levels)} livelli, bucket base "
+                    f"{self.base_seconds * 1000:.1f} ms, {self.nbytes / (1024 * 1024):.1f} MB")
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria occupata dai livelli (per il budget della cache MIDI)"""
+        return sum(level.nbytes for level in self.levels)
+
+    def bucket_seconds(self, level: int) -> float:
+        """Durata di un bucket al livello indicato"""
+        return self.base_seconds * 2 ** level
+
+    def level_for(self, seconds_per_pixel: float) -> int:
+        """Livello più grossolano con almeno un bucket per pixel"""
+        level = 0
+        while level + 1 < len(self.levels) and self.bucket_seconds(level + 1) <= seconds_per_pixel:
+            level += 1
+        return level
+
+    def tile(self, start: float = 0.0, end: float = float("inf"), width: int = 1024,
+             tracks: Optional[Sequence[str]] = None,
+             min_pitch: int = MIN_PITCH, max_pitch: int = MAX_PITCH) -> Dict:
+        """Tile di occupazione per una vista larga width pixel su [start, end)
+
+        Returns:
+            dict: level, bucket_seconds, start (inizio del primo bucket),
+            buckets, min_pitch, max_pitch, levels, detail (True se anche il
+            livello 0 è più grossolano di un pixel: conviene chiedere le note)
+            e per traccia {"index", "name", "occupancy"} con occupancy uint8
+            di shape (buckets, max_pitch - min_pitch + 1)
+
+        Raises:
+            ValueError: se una traccia non esiste
+        """
+        selected = select_tracks(self.track_names, tracks)
+        start = max(0.0, start)
+        # La scala è quella della vista richiesta, anche se va oltre la fine
+        # del brano (altrimenti il livello sarebbe più fine dei pixel)
+        view_end = end if math.isfinite(end) else max(self.duration, start + self.base_seconds)
+        seconds_per_pixel = (view_end - start) / max(1, min(width, MAX_TILE_WIDTH))
+        # Finestra dentro [0, duration]: first/last restano indici validi e
+        # buckets coincide con le righe di occupancy
+        end = min(end, self.duration) if self.duration > start else start + self.base_seconds
+        level = self.level_for(seconds_per_pixel)
+        bucket_seconds = self.bucket_seconds(level)
+
+        data = self.levels[level]
+        first = min(int(start // bucket_seconds), data.shape[1])
+        last = min(max(first + 1, math.ceil(end / bucket_seconds)), data.shape[1])
+        pitches = slice(min_pitch - MIN_PITCH, max_pitch - MIN_PITCH + 1)
+
+        return {
+            "level": level,
+            "levels": len(self.levels),
+            "bucket_seconds": bucket_seconds,
+            "start": first * bucket_seconds,
+            "buckets": last - first,
+            "min_pitch": min_pitch,
+            "max_pitch": max_pitch,
+            "duration": self.duration,
+            "detail": bucket_seconds > seconds_per_pixel,
+            "tracks": [
+                {
+                    "index": i,
+                    "name": self.track_names[i],
+                    "occupancy": data[i, first:last, pitches]
+                }
+                for i in selected
+            ]
+        }
@@ -0,0 +1,275 @@
+"""
+MIDICOM MIDI Payload
+====================
+
+Formato binario compatto per /midi/{filename}, scelto dal client con
+content negotiation (Accept: application/vnd.midicom.notes).
+
+Ogni traccia è codificata struct-of-arrays, con le note ordinate per tempo
+di inizio, così il frontend crea TypedArray direttamente sul buffer ricevuto
+senza allocare un oggetto per nota. Layout (little-endian):
+
+    0   magic "MIDN"
+    4   uint16 versione
+    6   uint16 riservato
+    8   uint32 lunghezza dell'header JSON (multiplo di 4)
+    12  header JSON UTF-8: metadati del file (duration, bpm, tempo_map, ...)
+        e per ogni traccia {"name", "count", "offset"}
+    per ogni traccia, a partire da offset (dall'inizio del buffer,
+    multiplo di 4), con n = count:
+        float32 time[n]      inizio in secondi
+        float32 duration[n]  durata in secondi
+        uint8   pitch[n]     nota MIDI
+        uint8   velocity[n]  velocity MIDI
+
+float32 ha una risoluzione migliore di 0.5 ms fino a circa 2 ore.
+
+Le tile di /midi/{filename}/overview (midi_overview.py) usano lo stesso
+prefisso con magic "MIDO": per ogni traccia {"index", "name", "offset"} e
+una matrice uint8 di occupazione buckets × pitch. Hanno un media type
+proprio (Accept: application/vnd.midicom.overview), così cache e client le
+distinguono dalle note dal solo Content-Type.
+
+Qui si trova anche la compressione delle risposte (gzip e, se il pacchetto
+brotli è installato, br) negoziata con Accept-Encoding.
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import gzip
+import json
+import struct
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+# numpy viene importato al primo encoding: il server non lo carica all'avvio
+if TYPE_CHECKING:
+    import numpy as np
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+MIDI_BINARY_MEDIA_TYPE = "application/vnd.midicom.notes"
+OVERVIEW_BINARY_MEDIA_TYPE = "application/vnd.midicom.overview"
+BINARY_MAGIC = b"MIDN"
+OVERVIEW_MAGIC = b"MIDO"
+BINARY_VERSION = 1
+# magic, versione, riservato, lunghezza header
+_PREFIX = struct.Struct("<4sHHI")
+
+# Sotto questa dimensione la compressione non conviene
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+# Qualità brotli: le risposte compresse vengono messe in cache, ma la prima
+# richiesta paga la compressione (oltre 9 diventa lenta su file grandi)
+BROTLI_QUALITY = 5
+BROTLI_AVAILABLE = find_spec("brotli") is not None
+
+
+def _align(size: int, alignment: int = 4) -> int:
+    """Arrotonda size al multiplo successivo di alignment"""
+    return -(-size // alignment) * alignment
+
+
+def track_arrays(track: Dict) -> Dict[str, "np.ndarray"]:
+    """Array time/duration/pitch/velocity di una traccia, ordinati per inizio
+
+    Accetta sia le tracce di read_midi_arrays (già in forma di array) sia
+    quelle JSON con la lista "notes" (midi_data.json dei job).
+    """
+    import numpy as np
+
+    if "notes" in track:
+        notes = track["notes"]
+        arrays = {
+            "time": np.fromiter((note["time"] for note in notes), dtype=np.float64, count=len(notes)),
+            "duration": np.fromiter((note["duration"] for note in notes), dtype=np.float64, count=len(notes)),
+            "pitch": np.fromiter((note["midi"] for note in notes), dtype=np.int64, count=len(notes)),
+            "velocity": np.fromiter((note["velocity"] for note in notes), dtype=np.int64, count=len(notes))
+        }
+    else:
+        arrays = {field: np.asarray(track[field]) for field in ("time", "duration", "pitch", "velocity")}
+
+    if np.any(np.diff(arrays["time"]) < 0):
+        order = np.argsort(arrays["time"], kind="stable")
+        arrays = {field: values[order] for field, values in arrays.items()}
+    return arrays
+
+
+def track_notes_json(track: Dict) -> List[Dict]:
+    """Note di una traccia in forma di array come lista JSON del PianoRoll"""
+    return [
+        {
+            "midi": pitch,
+            "time": time,
+            "duration": duration,
+            "velocity": velocity
+        }
+        for pitch, time, duration, velocity in zip(
+            track["pitch"].tolist(), track["time"].tolist(),
+            track["duration"].tolist(), track["velocity"].tolist()
+        )
+    ]
+
+
+def midi_data_json(midi_data: Dict) -> Dict:
+    """midi_data con tracce in forma di array convertito nel formato JSON"""
+    tracks = []
+    for track in midi_data["tracks"]:
+        entry = {"name": track["name"], "notes": track_notes_json(track)}
+        if "index" in track:
+            entry["index"] = track["index"]
+        tracks.append(entry)
+    return {**midi_data, "tracks": tracks}
+
+
+def _pack_payload(magic: bytes, header: Dict, blocks: List[bytes]) -> bytes:
+    """Prefisso, header JSON e blocchi allineati a 4 byte
+
+    header["tracks"] ha una voce per blocco, a cui viene aggiunto "offset"
+    (dall'inizio del buffer).
+    """
+    blocks = [block.ljust(_align(len(block)), b"\0") for block in blocks]
+
+    # Gli offset dipendono dalla lunghezza dell'header, che a sua volta li
+    # contiene: si ricalcolano finché la lunghezza non si stabilizza
+    header_length = 0
+    while True:
+        offset = _PREFIX.size + header_length
+        for entry, block in zip(header["tracks"], blocks):
+            entry["offset"] = offset
+            offset += len(block)
+        encoded = json.dumps(header).encode("utf-8")
+        if _align(len(encoded)) == header_length:
+            break
+        header_length = _align(len(encoded))
+
+    return b"".join([
+        _PREFIX.pack(magic, BINARY_VERSION, 0, header_length),
+        encoded.ljust(header_length, b" "),
+        *blocks
+    ])
+
+
+def encode_midi_binary(midi_data: Dict, **metadata) -> bytes:
+    """Codifica midi_data nel formato binario struct-of-arrays
+
+    Args:
+        midi_data: Dati MIDI (tracce JSON o di read_midi_arrays)
+        **metadata: Campi aggiuntivi dell'header (es. filename, source)
+
+    Returns:
+        bytes: Payload completo
+    """
+    import numpy as np
+
+    blocks: List[bytes] = []
+    header_tracks = []
+    for track in midi_data["tracks"]:
+        arrays = track_arrays(track)
+        count = len(arrays["time"])
+        blocks.append(b"".join([
+            arrays["time"].astype("<f4").tobytes(),
+            arrays["duration"].astype("<f4").tobytes(),
+            np.clip(arrays["pitch"], 0, 127).astype(np.uint8).tobytes(),
+            np.clip(arrays["velocity"], 0, 127).astype(np.uint8).tobytes()
+        ]))
+        entry = {"name": track["name"], "count": count}
+        if "index" in track:  # Posizione nel file (query per finestra)
+            entry["index"] = track["index"]
+        header_tracks.append(entry)
+
+    header = {key: value for key, value in midi_data.items() if key != "tracks"}
+    header.update(metadata)
+    header["tracks"] = header_tracks
+
+    payload = _pack_payload(BINARY_MAGIC, header, blocks)
+    logger.info(f"📦 Payload binario: {sum(entry['count'] for entry in header_tracks):,} note, "
+                f"{len(header_tracks)} tracce, {len(payload):,} bytes")
+    return payload
+
+
+def encode_overview_binary(tile: Dict, **metadata) -> bytes:
+    """Codifica una tile di midi_overview (stesso prefisso, magic "MIDO")
+
+    Per ogni traccia il blocco è la matrice uint8 di occupazione
+    (buckets × pitch) in ordine row-major: bucket per bucket, pitch crescenti.
+    """
+    header = {key: value for key, value in tile.items() if key != "tracks"}
+    header.update(metadata)
+    header["tracks"] = [{"index": track["index"], "name": track["name"]} for track in tile["tracks"]]
+    return _pack_payload(OVERVIEW_MAGIC, header,
+                         [track["occupancy"].tobytes() for track in tile["tracks"]])
+
+
+def overview_json(tile: Dict) -> Dict:
+    """Tile di midi_overview in formato JSON (occupancy come liste annidate)"""
+    return {
+        **tile,
+        "tracks": [{**track, "occupancy": track["occupancy"].tolist()} for track in tile["tracks"]]
+    }
+
+
+def _parse_qualities(header: Optional[str]) -> Dict[str, float]:
+    """Valori di un header Accept/Accept-Encoding -> preferenza q (default 1)"""
+    accepted = {}
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if not name.strip():
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def negotiate_binary(accept: Optional[str], media_type: str = MIDI_BINARY_MEDIA_TYPE) -> bool:
+    """True se il client preferisce il formato binario media_type al JSON
+
+    Il formato binario va chiesto esplicitamente (i wildcard non lo
+    selezionano) con q > 0 e almeno pari alla preferenza per il JSON
+    (application/json, poi application/*, poi */*).
+    """
+    accepted = _parse_qualities(accept)
+    binary_quality = accepted.get(media_type, 0.0)
+    json_quality = accepted.get("application/json", accepted.get("application/*", accepted.get("*/*", 0.0)))
+    return binary_quality > 0 and binary_quality >= json_quality
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Content-Encoding da usare per la risposta ("br", "gzip" o None)
+
+    Rispetta q=0 (codifica rifiutata); a parità di preferenza vince br,
+    più compatto di gzip, se il pacchetto brotli è installato.
+    """
+    accepted = _parse_qualities(accept_encoding)
+
+    candidates = (["br"] if BROTLI_AVAILABLE else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_payload(data: bytes, encoding: str) -> bytes:
+    """Comprime un payload con la codifica negoziata"""
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0: stesso input, stessi byte (utile per cache e ETag)
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Codifica non supportata: {encoding}")
@@ -0,0 +1,216 @@
+"""
+MIDICOM MIDI Reader
+===================
+
+Parsing dei file MIDI nel formato JSON usato dal frontend (PianoRoll).
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Tuple
+
+import mido
+import numpy as np
+
+# Import logger centralizzato
+from logger import setup_logger
+from midi_payload import midi_data_json
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+DEFAULT_TEMPO = 500000  # Microsecondi per beat (500000 = 120 BPM)
+
+
+class TempoMap:
+    """Indice della mappa dei tempi per conversione tick -> secondi
+
+    Precalcola i breakpoint cumulativi (tick, secondi) di ogni set_tempo:
+    nel segmento k vale  sec = seconds[k] + (tick - ticks[k]) * seconds_per_tick[k].
+    La conversione di un array di tick usa un'unica np.searchsorted vettoriale,
+    quindi costa O(log k) per nota con k cambi di tempo.
+    """
+
+    def __init__(self, ticks_per_beat: int, tempo_events: Iterable[Tuple[int, int]]):
+        """
+        Args:
+            ticks_per_beat: Risoluzione del file MIDI
+            tempo_events: Coppie (tick assoluto, tempo in microsecondi per beat)
+        """
+        # Ordinamento stabile: a parità di tick vince l'ultimo set_tempo
+        events = sorted(tempo_events, key=lambda event: event[0])
+        breakpoints: Dict[int, int] = {0: DEFAULT_TEMPO}
+        for tick, tempo in events:
+            breakpoints[tick] = tempo
+
+        self.ticks_per_beat = ticks_per_beat
+        self.ticks = np.fromiter(breakpoints.keys(), dtype=np.int64)
+        self.tempos = np.fromiter(breakpoints.values(), dtype=np.int64)
+        self.seconds_per_tick = self.tempos / (1_000_000.0 * ticks_per_beat)
+
+        # Secondi cumulativi all'inizio di ogni segmento
+        segment_seconds = np.diff(self.ticks) * self.seconds_per_tick[:-1]
+        self.seconds = np.concatenate(([0.0], np.cumsum(segment_seconds)))
+
+    @classmethod
+    def from_tracks(cls, ticks_per_beat: int, tracks: Iterable[mido.MidiTrack]) -> "TempoMap":
+        """Costruisce la mappa dai set_tempo di una o più tracce"""
+        tempo_events = []
+        for track in tracks:
+            current_ticks = 0
+            for msg in track:
+                current_ticks += msg.time
+                if msg.type == 'set_tempo':
+                    tempo_events.append((current_ticks, msg.tempo))
+        return cls(ticks_per_beat, tempo_events)
+
+    @property
+    def initial_tempo(self) -> int:
+        """Tempo attivo a tick 0 (o primo set_tempo se a tick 0)"""
+        return int(self.tempos[0])
+
+    def to_seconds(self, ticks) -> np.ndarray:
+        """Converte tick assoluti (scalare o array) in secondi"""
+        ticks = np.asarray(ticks, dtype=np.int64)
+        segment = np.searchsorted(self.ticks, ticks, side='right') - 1
+        return self.seconds[segment] + (ticks - self.ticks[segment]) * self.seconds_per_tick[segment]
+
+    def to_json(self) -> List[Dict]:
+        """Breakpoint in formato JSON (tick, secondi, BPM) per il frontend"""
+        return [
+            {"tick": int(tick), "time": float(seconds), "bpm": round(60_000_000 / int(tempo), 2)}
+            for tick, seconds, tempo in zip(self.ticks, self.seconds, self.tempos)
+        ]
+
+
+def _pair_track_notes(track: mido.MidiTrack) -> Dict:
+    """Accoppia note_on/note_off di una traccia in un singolo passaggio
+
+    Algoritmo:
+    1. Accumula i tick assoluti una sola volta (somma dei delta)
+    2. Per ogni note_on apre una nota nella coda (channel, pitch)
+    3. Per ogni note_off (o note_on con velocity 0) chiude la nota aperta
+       più vecchia con lo stesso (channel, pitch)
+    4. Le note vengono emesse nell'ordine dei note_on, quindi già ordinate
+       per tempo di inizio
+
+    Costo O(n) per traccia invece di O(n²) del vecchio track.index() + sum().
+
+    Returns:
+        dict: Nome traccia e liste parallele start/end/pitch/velocity in tick
+    """
+    track_name = None
+    starts: List[int] = []
+    ends: List[int] = []
+    pitches: List[int] = []
+    velocities: List[int] = []
+    open_notes = defaultdict(deque)  # (channel, pitch) -> indici delle note aperte
+
+    current_ticks = 0
+    for msg in track:
+        current_ticks += msg.time
+
+        if msg.type == 'note_on' and msg.velocity > 0:
+            open_notes[(msg.channel, msg.note)].append(len(starts))
+            starts.append(current_ticks)
+            ends.append(-1)  # Nota ancora aperta
+            pitches.append(msg.note)
+            velocities.append(msg.velocity)
+        elif msg.type == 'note_off' or msg.type == 'note_on':
+            pending = open_notes.get((msg.channel, msg.note))
+            if pending:
+                ends[pending.popleft()] = current_ticks
+        elif msg.type == 'track_name':
+            track_name = msg.name
+
+    return {
+        "name": track_name,
+        "starts": starts,
+        "ends": ends,
+        "pitches": pitches,
+        "velocities": velocities
+    }
+
+
+def read_midi_arrays(file_path) -> Dict:
+    """
+    Legge un file MIDI in forma struct-of-arrays.
+
+    Ogni traccia con note contiene array NumPy paralleli time, duration
+    (secondi), pitch e velocity, ordinati per tempo di inizio.
+
+    Args:
+        file_path: Percorso del file MIDI
+
+    Returns:
+        dict: Stessi campi di read_midi_file, con le tracce in forma di array
+    """
+    mid = mido.MidiFile(file_path)
+
+    tracks = []
+    total_duration = 0
+
+    # Type 0/1: la mappa dei tempi è globale (di solito nella prima traccia).
+    # Type 2: ogni traccia è una sequenza indipendente con i propri tempi.
+    global_tempo_map = None
+    if mid.type != 2:
+        global_tempo_map = TempoMap.from_tracks(mid.ticks_per_beat, mid.tracks)
+
+    # BPM iniziale (microseconds per beat -> BPM)
+    first_map = global_tempo_map or TempoMap.from_tracks(mid.ticks_per_beat, mid.tracks[:1])
+    bpm = round(60_000_000 / first_map.initial_tempo, 2)
+    logger.info(f"MIDI file BPM: {bpm}, ticks_per_beat: {mid.ticks_per_beat}, "
+                f"tempo changes: {len(first_map.ticks) - 1}")
+
+    for i, track in enumerate(mid.tracks):
+        paired = _pair_track_notes(track)
+        tempo_map = global_tempo_map or TempoMap.from_tracks(mid.ticks_per_beat, [track])
+
+        starts = np.asarray(paired["starts"], dtype=np.int64)
+        ends = np.asarray(paired["ends"], dtype=np.int64)
+
+        # Note senza note_off o di durata nulla vengono scartate
+        valid = ends > starts
+        if not valid.any():  # Solo aggiungi track con note
+            continue
+
+        start_seconds = tempo_map.to_seconds(starts[valid])
+        end_seconds = tempo_map.to_seconds(ends[valid])
+        tracks.append({
+            "name": paired["name"] or f"Track {i+1}",
+            "time": start_seconds,
+            "duration": end_seconds - start_seconds,
+            "pitch": np.asarray(paired["pitches"], dtype=np.int64)[valid],
+            "velocity": np.asarray(paired["velocities"], dtype=np.int64)[valid]
+        })
+
+        # Calcola durata totale
+        total_duration = max(total_duration, float(end_seconds.max()))
+
+    return {
+        "duration": total_duration,
+        "tracks": tracks,
+        "bpm": bpm,
+        "ticks_per_beat": mid.ticks_per_beat,
+        "tempo_map": first_map.to_json()
+    }
+
+
+def read_midi_file(file_path):
+    """
+    Legge un file MIDI e restituisce i dati in formato JSON.
+
+    Args:
+        file_path: Percorso del file MIDI
+
+    Returns:
+        dict: Dati MIDI in formato JSON con BPM e timing info
+    """
+    try:
+        return midi_data_json(read_midi_arrays(file_path))
+
+    except Exception as e:
+        logger.error(f"Errore nella lettura del file MIDI {file_path}: {str(e)}")
+        raise
@@ -0,0 +1,217 @@
+"""
+MIDICOM Model Registry
+======================
+
+Registro dei modelli Demucs caricati nel processo corrente. Ogni modello
+richiesto viene caricato una sola volta e resta "caldo" tra una separazione
+e l'altra: i worker del pool dei job (vedi jobs.py) sono processi long-lived,
+quindi dal secondo job in poi la separazione costa solo l'inferenza.
+
+I modelli inutilizzati da più di MODEL_IDLE_SECONDS vengono rilasciati, e
+il totale dei pesi in memoria resta entro MODEL_CACHE_MB (eviction LRU).
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import gc
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+MODEL_CACHE_MB = int(os.environ.get("MIDICOM_MODEL_CACHE_MB", "2048"))
+MODEL_IDLE_SECONDS = float(os.environ.get("MIDICOM_MODEL_IDLE_SECONDS", "1800"))
+# Modelli caricati all'avvio di ogni worker (separati da virgola, vuoto = nessuno)
+PRELOAD_MODELS = os.environ.get("MIDICOM_PRELOAD_MODELS", "htdemucs")
+
+# Loader: (nome modello, device) -> separatore pronto all'uso
+ModelLoader = Callable[[str, str], Any]
+
+
+def load_demucs_separator(model_name: str, device: str) -> Any:
+    """Carica un demucs.api.Separator (download dei pesi al primo uso)"""
+    from demucs.api import Separator
+
+    return Separator(model=model_name, device=device, progress=False)
+
+
+def _release_memory():
+    """Libera la memoria dei modelli rimossi (anche la cache CUDA, se in uso)"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def model_size_bytes(separator: Any) -> int:
+    """Dimensione dei pesi del modello in memoria"""
+    model = getattr(separator, "model", None)
+    if model is None or not hasattr(model, "parameters"):
+        return 0
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+class _Entry:
+    """Modello caricato con statistiche d'uso"""
+
+    def __init__(self, separator: Any, size: int, load_time: float):
+        self.separator = separator
+        self.size = size
+        self.load_time = load_time
+        self.last_used = time.time()
+        self.uses = 0
+
+
+class ModelRegistry:
+    """Cache LRU dei modelli Demucs con scadenza per inattività"""
+
+    def __init__(self, max_bytes: int, idle_seconds: float,
+                 loader: ModelLoader = load_demucs_separator):
+        """
+        Args:
+            max_bytes: Memoria massima per i pesi dei modelli caricati
+            idle_seconds: Inattività dopo cui un modello viene rilasciato
+            loader: Funzione che carica un modello (sostituibile nei test)
+        """
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.loader = loader
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def get(self, model_name: str, device: str = "cpu") -> Any:
+        """Restituisce il modello richiesto, caricandolo solo se assente"""
+        key = (model_name, device)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                logger.info(f"📦 Caricamento modello {model_name} ({device})...")
+                start = time.time()
+                separator = self.loader(model_name, device)
+                entry = _Entry(separator, model_size_bytes(separator), time.time() - start)
+                self._entries[key] = entry
+                self.loads += 1
+                logger.info(f"✅ Modello {model_name} caricato in {entry.load_time:.1f}s "
+                            f"({entry.size / (1024 * 1024):.0f} MB)")
+                self._enforce_budget(keep=key)
+
+            entry.last_used = time.time()
+            entry.uses += 1
+            return entry.separator
+
+    def is_loaded(self, model_name: str, device: str = "cpu") -> bool:
+        """True se il modello è già caldo in questo processo"""
+        with self._lock:
+            return (model_name, device) in self._entries
+
+    def preload(self, model_names):
+        """Carica in anticipo i modelli indicati (errori solo loggati)"""
+        for model_name in model_names:
+            try:
+                self.get(model_name)
+            except Exception as e:
+                logger.warning(f"⚠️ Preload modello {model_name} fallito: {e}")
+
+    def evict_idle(self) -> int:
+        """Rilascia i modelli inutilizzati da più di idle_seconds"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items()
+                       if now - entry.last_used > self.idle_seconds]
+            for key in expired:
+                self._discard(key, reason="inattivo")
+        if expired:
+            _release_memory()
+        return len(expired)
+
+    def clear(self):
+        """Rilascia tutti i modelli"""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key, reason="clear")
+        _release_memory()
+
+    def start_reaper(self, interval_seconds: float = 60.0):
+        """Thread daemon che applica evict_idle periodicamente"""
+        if self._reaper is not None:
+            return
+
+        def reap():
+            while True:
+                time.sleep(interval_seconds)
+                self.evict_idle()
+
+        self._reaper = threading.Thread(target=reap, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def stats(self) -> Dict:
+        """Statistiche del registro (modelli caldi, hit, caricamenti)"""
+        now = time.time()
+        with self._lock:
+            return {
+                "models": [
+                    {
+                        "model": model_name,
+                        "device": device,
+                        "size_bytes": entry.size,
+                        "load_time": round(entry.load_time, 3),
+                        "idle_seconds": round(now - entry.last_used, 1),
+                        "uses": entry.uses
+                    }
+                    for (model_name, device), entry in self._entries.items()
+                ],
+                "size_bytes": sum(entry.size for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions
+            }
+
+    def _enforce_budget(self, keep: Tuple[str, str]):
+        """Eviction LRU finché i pesi caricati rientrano in max_bytes"""
+        total = sum(entry.size for entry in self._entries.values())
+        evicted = False
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries[key].size
+            self._discard(key, reason="memoria")
+            evicted = True
+        if evicted:
+            _release_memory()
+
+    def _discard(self, key: Tuple[str, str], reason: str):
+        """Rimuove un modello dal registro"""
+        del self._entries[key]
+        self.evictions += 1
+        logger.info(f"🧹 Modello {key[0]} ({key[1]}) rilasciato: {reason}")
+
+
+# Registro del processo corrente (un worker = un registro)
+_registry: Optional[ModelRegistry] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """Registro dei modelli del processo corrente"""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(MODEL_CACHE_MB * 1024 * 1024, MODEL_IDLE_SECONDS)
+    return _registry
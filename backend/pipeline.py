@@ -0,0 +1,476 @@
+"""
+MIDICOM Processing Pipeline
+===========================
+
+Pipeline completa audio -> stem -> MIDI usata dai job del server API.
+Le funzioni di questo modulo sono sincrone e pensate per girare nei
+processi worker (vedi jobs.py), mai nell'event loop di FastAPI.
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Import logger centralizzato
+from logger import setup_logger
+from audio_io import probe_duration
+from midi_reader import read_midi_file
+from result_store import MULTITRACK_MIDI_NAME
+from separate import AudioSeparator
+from transcribe_to_midi import DRUM_STEM, AudioBuffer, MIDITranscriber
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+# Stem melodici da trascrivere (la batteria ha un percorso solo-onset dedicato)
+MELODIC_STEMS = ("bass", "other", "vocals")
+TRANSCRIBED_STEMS = MELODIC_STEMS + (DRUM_STEM,)
+
+# Frazione del progresso totale alla fine di ogni fase
+SEPARATION_WEIGHT = 0.6
+TRANSCRIPTION_WEIGHT = 0.35
+
+# Messaggi delle fasi riportate dal separatore e dal trascrittore
+STAGE_MESSAGES = {
+    "decode": "Decodifica audio",
+    "separate": "Separazione stem",
+    "onset": "Rilevamento onset",
+    "pitch": "Pitch detection",
+    "group": "Raggruppamento note",
+    "quantize": "Quantizzazione",
+    "write": "Scrittura risultati",
+    "done": "Trascrizione completata"
+}
+
+# Sotto questa durata (secondi per stem) la trascrizione è seriale: per brani
+# brevi la distribuzione ai processi costa più di quanto fa risparmiare
+PARALLEL_MIN_SECONDS = 60.0
+
+# Buffer degli stem condivisi tra processi: tmpfs (RAM) se disponibile
+SHARED_BUFFER_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Stem da trascrivere: path di un file, audio in memoria o buffer condiviso
+# ({"buffer": path .npy, "sample_rate": sr}, letto in memory-map dai worker)
+StemSource = Union[str, AudioBuffer, Dict]
+
+# Callback di progresso: (stage, fraction 0-1 del job, messaggio)
+ProgressCallback = Callable[[str, float, str], None]
+# Progresso della trascrizione di uno stem: (stem, fase, frazione 0-1 dello stem)
+StemProgressCallback = Callable[[str, str, float], None]
+
+# Coda di progresso dei processi di trascrizione (impostata da _init_stem_worker)
+_stem_progress_queue = None
+
+# Pool di trascrizione del processo (uno per worker dei job, riusato tra i
+# job): coda di progresso e thread di inoltro vivono quanto il pool, gli
+# eventi arrivano al callback del job registrato con lo stesso token
+_stem_pool: Optional[ProcessPoolExecutor] = None
+_stem_pool_workers = 0
+_stem_pool_queue = None
+_stem_pool_lock = threading.Lock()
+_stem_progress_targets: Dict[int, StemProgressCallback] = {}
+_stem_progress_tokens = itertools.count()
+
+
+def _no_progress(stage: str, fraction: float, message: str = ""):
+    """Callback di default quando il chiamante non segue il progresso"""
+
+
+def _init_stem_worker(progress_queue):
+    """Inizializzatore dei processi di trascrizione: coda verso il processo del job"""
+    global _stem_progress_queue
+    _stem_progress_queue = progress_queue
+
+
+def _forward_progress(progress_queue):
+    """Thread che inoltra ai job il progresso inviato dai processi di trascrizione"""
+    while True:
+        event = progress_queue.get()
+        if event is None:
+            break
+        token, *stem_event = event
+        target = _stem_progress_targets.get(token)
+        if target is not None:  # Eventi in ritardo di un job già finito: scartati
+            target(*stem_event)
+
+
+def _get_stem_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool di trascrizione del processo, creato al primo uso e poi riusato
+
+    I processi spawn importano librosa (e CREPE) una volta sola invece che
+    a ogni job. Il pool viene ricreato solo se servono più worker.
+    """
+    global _stem_pool, _stem_pool_workers, _stem_pool_queue
+    with _stem_pool_lock:
+        if _stem_pool is not None and _stem_pool_workers >= workers:
+            return _stem_pool
+        if _stem_pool is not None:
+            _stem_pool.shutdown(wait=False)
+            _stem_pool_queue.put(None)  # Ferma il thread di inoltro del vecchio pool
+        # spawn: stesso contesto del pool dei job (nessuno stato ereditato)
+        context = multiprocessing.get_context("spawn")
+        _stem_pool_queue = context.Queue()
+        threading.Thread(target=_forward_progress, args=(_stem_pool_queue,),
+                         name="stem-progress", daemon=True).start()
+        _stem_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                         initializer=_init_stem_worker,
+                                         initargs=(_stem_pool_queue,))
+        _stem_pool_workers = workers
+        logger.info(f"✅ Pool di trascrizione avviato ({workers} worker)")
+        return _stem_pool
+
+
+def _discard_stem_pool(pool: ProcessPoolExecutor):
+    """Scarta un pool rotto (worker terminato): il prossimo job ne crea uno nuovo"""
+    global _stem_pool, _stem_pool_queue
+    with _stem_pool_lock:
+        if _stem_pool is pool:
+            _stem_pool = None
+            _stem_pool_queue.put(None)
+            _stem_pool_queue = None
+    pool.shutdown(wait=False)
+
+
+def _stem_seconds(source: StemSource) -> Optional[float]:
+    """Durata di uno stem senza decodificarlo (None se non nota)"""
+    if isinstance(source, str):
+        return probe_duration(source)
+    if isinstance(source, dict):
+        return None
+    samples, sample_rate = source
+    return samples.shape[-1] / sample_rate
+
+
+def _share_stems(stems: Dict[str, StemSource], buffer_dir: str) -> Dict[str, StemSource]:
+    """Scrive gli stem in memoria come buffer float32 mono memory-mappable
+
+    I worker aprono i buffer con np.load(mmap_mode="r"): niente encoding WAV,
+    niente decodifica e ricampionamento ripetuti, pagine condivise in RAM.
+    """
+    shared = {}
+    for name, source in stems.items():
+        if isinstance(source, str):
+            shared[name] = source
+            continue
+        samples, sample_rate = source
+        mono = samples.mean(axis=0) if samples.ndim == 2 else samples
+        buffer_path = os.path.join(buffer_dir, f"{name}.npy")
+        np.save(buffer_path, np.asarray(mono, dtype=np.float32))
+        shared[name] = {"buffer": buffer_path, "sample_rate": sample_rate}
+    return shared
+
+
+def _open_stem(name: str, source: StemSource) -> Tuple[str, Optional[AudioBuffer]]:
+    """(path descrittivo, audio in memoria o None) di uno stem"""
+    if isinstance(source, str):
+        return source, None
+    if isinstance(source, dict):
+        return source["buffer"], (np.load(source["buffer"], mmap_mode="r"), source["sample_rate"])
+    return f"{name} (in memoria)", source
+
+
+def _transcribe_stem(name: str, source: StemSource, midi_path: str,
+                     transcription_method: str,
+                     transcriber_params: Dict,
+                     progress: Optional[Callable[[str, float], None]] = None,
+                     progress_token: Optional[int] = None) -> Tuple[str, Dict, List[Dict]]:
+    """Trascrive uno stem (eseguita nei processi del pool di trascrizione)
+
+    Args:
+        progress: Callback (fase, frazione) dello stem; nei processi del pool
+            il progresso passa dalla coda impostata da _init_stem_worker
+        progress_token: Job a cui inoltrare il progresso inviato sulla coda
+
+    Returns:
+        Tuple[nome, risultato, note]: note vuote se la trascrizione fallisce
+    """
+    if progress is None and _stem_progress_queue is not None and progress_token is not None:
+        def progress(stage: str, fraction: float):
+            _stem_progress_queue.put((progress_token, name, stage, fraction))
+
+    transcriber = MIDITranscriber(pitch_method=transcription_method, **transcriber_params)
+    try:
+        stem_path, audio = _open_stem(name, source)
+        if name == DRUM_STEM:
+            analysis = transcriber.transcribe_drum_notes(stem_path, audio=audio, progress=progress)
+        else:
+            analysis = transcriber.transcribe_notes(stem_path, audio=audio, progress=progress)
+        if not analysis["success"]:
+            return name, analysis, []
+
+        # MIDI del singolo stem, con programma e canale della traccia multitraccia
+        num_notes = transcriber.create_multitrack_midi({name: analysis["notes"]}, midi_path)
+        return name, transcriber.transcription_summary(stem_path, midi_path, analysis, num_notes), analysis["notes"]
+    except Exception as e:
+        logger.error(f"❌ Errore durante trascrizione {name}: {e}")
+        return name, {"success": False, "error": str(e)}, []
+
+
+def transcribe_stems(stems: Dict[str, StemSource],
+                     midi_dir: str,
+                     transcription_method: str = "librosa",
+                     transcriber_params: Optional[Dict] = None,
+                     max_workers: Optional[int] = None,
+                     progress: Optional[StemProgressCallback] = None,
+                     min_parallel_seconds: float = PARALLEL_MIN_SECONDS) -> Dict:
+    """Trascrive in parallelo gli stem e li unisce in un MIDI multitraccia
+
+    Ogni stem gira in un processo del pool di trascrizione (creato una volta
+    per processo e riusato tra i job), quindi il tempo totale è vicino a
+    quello dello stem più lento invece che alla somma. Stem più brevi di
+    min_parallel_seconds vengono trascritti in serie in questo processo.
+
+    Args:
+        stems: Nome dello stem -> path WAV o (audio, sample rate) in memoria
+            (output di AudioSeparator.separate_audio con return_sources)
+        midi_dir: Directory di output per i MIDI per stem e per il multitraccia
+        transcription_method: Metodo di pitch detection (librosa, crepe, auto)
+        transcriber_params: Parametri di MIDITranscriber
+        max_workers: Processi paralleli (default: uno per stem, entro i core disponibili)
+        progress: Callback opzionale (stem, fase, frazione 0-1 dello stem) ai
+            confini delle fasi di ogni stem, con fase "done" a stem trascritto;
+            in parallelo viene invocata da un thread di inoltro
+        min_parallel_seconds: Durata minima dello stem più lungo per la
+            trascrizione parallela (0 = sempre in parallelo)
+
+    Returns:
+        dict: {"tracks", "midi_files", "multitrack_file", "transcriptions"}
+    """
+    params = transcriber_params or {}
+    to_transcribe = [name for name in TRANSCRIBED_STEMS if name in stems]
+    workers = min(max_workers or len(to_transcribe), os.cpu_count() or 1)
+
+    parallel = workers > 1 and len(to_transcribe) > 1
+    if parallel and min_parallel_seconds > 0:
+        durations = [_stem_seconds(stems[name]) for name in to_transcribe]
+        if all(duration is not None for duration in durations) and max(durations) < min_parallel_seconds:
+            logger.info(f"🎼 Stem di {max(durations):.1f}s: trascrizione seriale")
+            parallel = False
+
+    # In parallelo l'audio in memoria arriva ai worker tramite buffer memory-mapped
+    buffer_dir = tempfile.mkdtemp(prefix="midicom-stems-", dir=SHARED_BUFFER_ROOT) if parallel else None
+    outcomes = {}
+    try:
+        sources = _share_stems({name: stems[name] for name in to_transcribe}, buffer_dir) if parallel else stems
+        jobs = [(name, sources[name], os.path.join(midi_dir, f"{name}.mid"), transcription_method, params)
+                for name in to_transcribe]
+
+        if parallel:
+            executor = _get_stem_pool(workers)
+            token = next(_stem_progress_tokens) if progress else None
+            if progress:
+                _stem_progress_targets[token] = progress
+            try:
+                futures = [executor.submit(_transcribe_stem, *job, progress_token=token) for job in jobs]
+                for future in as_completed(futures):
+                    name, result, notes = future.result()
+                    outcomes[name] = (result, notes)
+                    if progress:
+                        progress(name, "done", 1.0)
+            except BrokenProcessPool:
+                _discard_stem_pool(executor)
+                raise
+            finally:
+                _stem_progress_targets.pop(token, None)
+        else:
+            for job in jobs:
+                stem_progress = partial(progress, job[0]) if progress else None
+                name, result, notes = _transcribe_stem(*job, progress=stem_progress)
+                outcomes[name] = (result, notes)
+                if progress:
+                    progress(name, "done", 1.0)
+    finally:
+        if buffer_dir is not None:
+            shutil.rmtree(buffer_dir, ignore_errors=True)
+
+    # Tracce nell'ordine degli stem, indipendente dall'ordine di completamento
+    tracks = {}
+    midi_files = {}
+    transcriptions = {}
+    for name in to_transcribe:
+        result, notes = outcomes[name]
+        transcriptions[name] = result
+        if not result["success"]:
+            logger.warning(f"⚠️ Trascrizione {name} fallita: {result['error']}")
+            continue
+        tracks[name] = notes
+        midi_files[name] = result["output_file"]
+
+    multitrack_file = None
+    if tracks:
+        multitrack_file = os.path.join(midi_dir, MULTITRACK_MIDI_NAME)
+        MIDITranscriber(**params).create_multitrack_midi(tracks, multitrack_file)
+
+    return {
+        "tracks": list(tracks),
+        "midi_files": midi_files,
+        "multitrack_file": multitrack_file,
+        "transcriptions": transcriptions
+    }
+
+
+def write_stems_manifest(stems_dir: str, stems: Dict[str, str]):
+    """Scrive stems.json (nome -> path WAV) in modo atomico"""
+    os.makedirs(stems_dir, exist_ok=True)
+    manifest_path = os.path.join(stems_dir, "stems.json")
+    with open(f"{manifest_path}.part", "w") as f:
+        json.dump(stems, f)
+    os.replace(f"{manifest_path}.part", manifest_path)
+
+
+def run_stems_export(input_path: str,
+                     stems_dir: str,
+                     midi_dir: str,
+                     separation_model: str = "htdemucs",
+                     separation_options: Optional[Dict] = None,
+                     progress: Optional[ProgressCallback] = None,
+                     **_transcription_options) -> Dict:
+    """Esporta gli stem WAV di un risultato già trascritto (export su richiesta)
+
+    Stessa firma di run_transcription_pipeline: le opzioni di trascrizione
+    e midi_dir vengono ignorate, i MIDI già in archivio non cambiano.
+
+    Returns:
+        dict: {"success", "stems", "stems_exported", "separation_time"} o errore
+    """
+    report = progress or _no_progress
+
+    def separation_progress(stage: str, fraction: float):
+        report(stage, fraction, f"{STAGE_MESSAGES.get(stage, stage)} ({separation_model}, {fraction:.0%})")
+
+    separator = AudioSeparator(model_name=separation_model, **(separation_options or {}))
+    separation = separator.process_file(input_path, stems_dir, export=True, progress=separation_progress)
+    if not separation["success"]:
+        return {"success": False, "stage": "separation", "error": separation["error"]}
+
+    report("write", 1.0, STAGE_MESSAGES["write"])
+    write_stems_manifest(stems_dir, separation["stems"])
+    return {
+        "success": True,
+        "stems": separation["stems"],
+        "stems_exported": True,
+        "separation_time": separation.get("processing_time", 0.0)
+    }
+
+
+def run_transcription_pipeline(input_path: str,
+                               stems_dir: str,
+                               midi_dir: str,
+                               separation_model: str = "htdemucs",
+                               transcription_method: str = "librosa",
+                               transcriber_params: Optional[Dict] = None,
+                               transcription_workers: Optional[int] = None,
+                               separation_options: Optional[Dict] = None,
+                               export_stems: bool = False,
+                               progress: Optional[ProgressCallback] = None) -> Dict:
+    """Separa un file audio in stem e li trascrive in un MIDI multitraccia
+
+    Args:
+        input_path: File audio caricato dall'utente
+        stems_dir: Directory di output per gli stem WAV
+        midi_dir: Directory di output per i file MIDI e midi_data JSON
+        separation_model: Modello Demucs (htdemucs, htdemucs_ft, mdx, ...)
+        transcription_method: Metodo di pitch detection (librosa, crepe, auto)
+        transcriber_params: Parametri di MIDITranscriber (hop_length, quantize_ms, ...)
+        transcription_workers: Processi per la trascrizione parallela degli stem
+        separation_options: Opzioni di AudioSeparator (device, jobs, concurrent_jobs, ...)
+        export_stems: Se True gli stem vengono salvati come WAV in stems_dir
+            (altrimenti passano alla trascrizione solo in memoria)
+        progress: Callback opzionale (stage, fraction, messaggio)
+
+    Returns:
+        dict: Risultato con stems, midi_data e statistiche
+    """
+    report = progress or _no_progress
+    start_time = time.time()
+    os.makedirs(midi_dir, exist_ok=True)
+
+    # 1. Separazione audio con Demucs (progresso per segmento)
+    def separation_progress(stage: str, fraction: float):
+        report(stage, SEPARATION_WEIGHT * fraction,
+               f"{STAGE_MESSAGES.get(stage, stage)} ({separation_model}, {fraction:.0%})")
+
+    separator = AudioSeparator(model_name=separation_model, **(separation_options or {}))
+    separation = separator.process_file(input_path, stems_dir, export=export_stems, return_sources=True,
+                                        progress=separation_progress)
+    if not separation["success"]:
+        return {"success": False, "stage": "separation", "error": separation["error"]}
+
+    # 2. Trascrizione MIDI parallela degli stem (batteria solo onset), con
+    # gli stem passati in memoria: nessun WAV riletto e decodificato
+    stems = separation["stems"]
+    sources = separation.pop("sources")
+    samplerate = separation.pop("samplerate")
+
+    # Progresso della fase: media degli stem (in parallelo gli eventi
+    # arrivano dal thread di inoltro e dal thread principale)
+    stem_fractions = {name: 0.0 for name in TRANSCRIBED_STEMS if name in sources}
+    stem_lock = threading.Lock()
+
+    def stem_progress(name: str, stage: str, fraction: float):
+        with stem_lock:
+            stem_fractions[name] = max(stem_fractions[name], fraction)
+            done = sum(1 for value in stem_fractions.values() if value >= 1.0)
+            overall = sum(stem_fractions.values()) / len(stem_fractions)
+            report(stage, SEPARATION_WEIGHT + TRANSCRIPTION_WEIGHT * overall,
+                   f"{STAGE_MESSAGES.get(stage, stage)}: {name} ({done}/{len(stem_fractions)} stem)")
+
+    transcription = transcribe_stems(
+        {name: (samples, samplerate) for name, samples in sources.items()},
+        midi_dir,
+        transcription_method=transcription_method,
+        transcriber_params=transcriber_params,
+        max_workers=transcription_workers,
+        progress=stem_progress
+    )
+    del sources
+
+    tracks = []
+    if transcription["multitrack_file"]:
+        tracks = read_midi_file(transcription["multitrack_file"])["tracks"]
+
+    # 3. Scrittura risultato in formato PianoRoll
+    report("write", SEPARATION_WEIGHT + TRANSCRIPTION_WEIGHT, STAGE_MESSAGES["write"])
+    write_stems_manifest(stems_dir, stems)
+
+    midi_data = {
+        "duration": max((note["time"] + note["duration"]
+                         for track in tracks for note in track["notes"]), default=0.0),
+        "tracks": tracks,
+        "bpm": 120.0
+    }
+    midi_data_file = os.path.join(midi_dir, "midi_data.json")
+    with open(midi_data_file, "w") as f:
+        json.dump(midi_data, f)
+
+    return {
+        "success": True,
+        "stems": stems,
+        "stems_exported": export_stems,
+        "midi_files": transcription["midi_files"],
+        "multitrack_file": transcription["multitrack_file"],
+        "midi_data_file": midi_data_file,
+        "duration": separation.get("duration", 0.0),
+        "separation_time": separation.get("processing_time", 0.0),
+        "separation_model_cached": separation.get("model_cached", False),
+        "separation_parallelism": separation.get("parallelism"),
+        "processing_time": time.time() - start_time,
+        "separation_model": separation_model,
+        "transcription_method": transcription_method,
+        "transcriber_params": transcriber_params or {},
+        "transcriptions": transcription["transcriptions"]
+    }
@@ -0,0 +1,320 @@
+"""
+MIDICOM Result Store
+====================
+
+Archivio content-addressed dei risultati di separazione + trascrizione.
+La chiave è l'hash di (audio, modello di separazione, metodo di trascrizione,
+parametri del trascrittore), cioè dei soli input che determinano il MIDI:
+un upload ripetuto dello stesso brano con le stesse opzioni restituisce
+subito stem e MIDI già calcolati. Gli stem WAV sono un artefatto opzionale
+della stessa voce: se una voce non li ha e vengono richiesti, un job di
+sola separazione li aggiunge (vedi update_result).
+
+Layout su disco:
+    <root>/<key>/stems/         stems.json + stem WAV (solo con export_stems)
+    <root>/<key>/midi/          file .mid per stem, multitrack.mid + midi_data.json
+    <root>/<key>/manifest.json  scritto solo a risultato completo, con la
+                                dimensione della voce (size_bytes)
+
+Dimensioni e ordine LRU delle voci complete sono tenuti in memoria (letti
+dai manifest al primo uso): eviction e statistiche non percorrono l'archivio.
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+# Da incrementare quando cambia l'output della pipeline (invalida le voci vecchie)
+STORE_FORMAT_VERSION = 5
+
+MANIFEST_NAME = "manifest.json"
+MULTITRACK_MIDI_NAME = "multitrack.mid"
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _directory_size(path: str) -> int:
+    """Dimensione totale dei file contenuti in una directory"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResultStore:
+    """Archivio dei risultati con eviction LRU basata sulla dimensione"""
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        Args:
+            root: Directory radice dell'archivio
+            max_bytes: Dimensione massima su disco prima dell'eviction
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Voci complete -> dimensione in byte, dalla meno recente (LRU)
+        self._sizes: Optional["OrderedDict[str, int]"] = None
+        self._total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio_sha256: str, separation_model: str,
+                 transcription_method: str, transcriber_params: Dict) -> str:
+        """Chiave content-addressed di un risultato (export_stems non ne fa parte)"""
+        payload = json.dumps({
+            "version": STORE_FORMAT_VERSION,
+            "audio": audio_sha256,
+            "separation_model": separation_model,
+            "transcription_method": transcription_method,
+            "transcriber_params": transcriber_params
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_valid_key(key: str) -> bool:
+        """Verifica il formato della chiave (evita path traversal dagli URL)"""
+        return bool(_KEY_PATTERN.match(key))
+
+    def entry_dir(self, key: str) -> str:
+        """Directory di una voce"""
+        return os.path.join(self.root, key)
+
+    def stems_dir(self, key: str) -> str:
+        """Directory degli stem di una voce"""
+        return os.path.join(self.root, key, "stems")
+
+    def midi_dir(self, key: str) -> str:
+        """Directory dei file MIDI di una voce"""
+        return os.path.join(self.root, key, "midi")
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """Restituisce il manifest di un risultato completo, o None"""
+        manifest_path = os.path.join(self.entry_dir(key), MANIFEST_NAME)
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        self.touch(key)
+        with self._lock:
+            self.hits += 1
+        return manifest
+
+    def touch(self, key: str):
+        """Aggiorna l'ultimo accesso di una voce (ordine LRU)"""
+        try:
+            os.utime(os.path.join(self.entry_dir(key), MANIFEST_NAME))
+        except OSError:
+            return
+        with self._lock:
+            sizes = self._load_index()
+            if key in sizes:
+                sizes.move_to_end(key)
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        """Indice delle voci complete, letto dai manifest alla prima chiamata
+
+        Da chiamare con il lock acquisito. Le voci scritte prima che il
+        manifest registrasse size_bytes vengono misurate una volta sola.
+        """
+        if self._sizes is not None:
+            return self._sizes
+
+        entries = []
+        for key in os.listdir(self.root):
+            manifest_path = os.path.join(self.entry_dir(key), MANIFEST_NAME)
+            try:
+                with open(manifest_path, "r") as f:
+                    size = json.load(f).get("size_bytes")
+                mtime = os.path.getmtime(manifest_path)
+            except (OSError, ValueError):
+                continue  # Job in corso o voce incompleta
+            if size is None:
+                size = _directory_size(self.entry_dir(key))
+            entries.append((mtime, key, size))
+
+        self._sizes = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._total_bytes = sum(self._sizes.values())
+        logger.info(f"📇 Indice archivio: {len(self._sizes)} voci, {self._total_bytes} bytes")
+        return self._sizes
+
+    def _record(self, key: str, size: int):
+        """Registra (o aggiorna) la dimensione di una voce come la più recente"""
+        with self._lock:
+            sizes = self._load_index()
+            self._total_bytes += size - sizes.pop(key, 0)
+            sizes[key] = size
+
+    def commit(self, key: str, result: Dict, protected: Iterable[str] = ()):
+        """Registra un risultato completo e applica l'eviction
+
+        Args:
+            key: Chiave della voce
+            result: Risultato della pipeline
+            protected: Chiavi da non rimuovere (job in corso)
+        """
+        size = self._write_manifest(key, {"key": key, "created_at": time.time(), "result": result})
+        self._record(key, size)
+        logger.info(f"💾 Risultato archiviato: {key[:12]} ({size} bytes)")
+        self.evict(protected=set(protected) | {key})
+
+    def update_result(self, key: str, changes: Dict, protected: Iterable[str] = ()) -> Optional[Dict]:
+        """Aggiorna il risultato di una voce completa (es. stem esportati dopo)
+
+        Returns:
+            dict: Risultato aggiornato, o None se la voce non esiste più
+        """
+        manifest_path = os.path.join(self.entry_dir(key), MANIFEST_NAME)
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        manifest["result"].update(changes)
+        self._record(key, self._write_manifest(key, manifest))
+        logger.info(f"💾 Risultato aggiornato: {key[:12]} ({', '.join(changes)})")
+        self.evict(protected=set(protected) | {key})
+        return manifest["result"]
+
+    def _write_manifest(self, key: str, manifest: Dict) -> int:
+        """Scrittura atomica: il manifest segna la voce come completa
+
+        La voce viene misurata qui, una volta per scrittura, e la dimensione
+        (manifest escluso) salvata nel manifest come size_bytes.
+
+        Returns:
+            int: Dimensione della voce in byte
+        """
+        manifest_path = os.path.join(self.entry_dir(key), MANIFEST_NAME)
+        os.makedirs(self.entry_dir(key), exist_ok=True)
+        size = _directory_size(self.entry_dir(key))
+        if os.path.exists(manifest_path):
+            size -= os.path.getsize(manifest_path)
+        manifest["size_bytes"] = size
+        with open(f"{manifest_path}.part", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_path}.part", manifest_path)
+        return size
+
+    def remove(self, key: str):
+        """Rimuove una voce dall'archivio"""
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+        with self._lock:
+            if self._sizes is not None and key in self._sizes:
+                self._total_bytes -= self._sizes.pop(key)
+
+    def evict(self, protected: Iterable[str] = ()):
+        """Rimuove le voci usate meno di recente finché si rientra nel budget
+
+        Usa l'indice in memoria: nessuna scansione del disco. Le voci dei job
+        in corso (senza manifest) non sono nell'indice e non vengono contate.
+        """
+        protected = set(protected)
+        with self._lock:
+            sizes = self._load_index()
+            victims = []
+            for key, size in sizes.items():
+                if self._total_bytes - sum(size for _, size in victims) <= self.max_bytes:
+                    break
+                if key not in protected:
+                    victims.append((key, size))
+            # Fuori dall'indice subito: un evict concorrente non le riconta
+            for key, size in victims:
+                del sizes[key]
+                self._total_bytes -= size
+                self.evictions += 1
+
+        for key, size in victims:
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            logger.info(f"🧹 Risultato rimosso per spazio: {key[:12]} ({size} bytes)")
+
+    def sweep(self, max_age_seconds: float, protected: Iterable[str] = ()):
+        """Rimuove voci incomplete abbandonate (job interrotti) e applica il budget"""
+        protected = set(protected)
+        now = time.time()
+        for key in os.listdir(self.root):
+            path = self.entry_dir(key)
+            if key in protected or not os.path.isdir(path):
+                continue
+            if os.path.exists(os.path.join(path, MANIFEST_NAME)):
+                continue
+            if now - os.path.getmtime(path) > max_age_seconds:
+                self.remove(key)
+                logger.info(f"🧹 Risultato incompleto rimosso: {key[:12]}")
+        self.evict(protected=protected)
+
+    def stats(self) -> Dict:
+        """Statistiche dell'archivio per /status (dall'indice, senza I/O)"""
+        with self._lock:
+            sizes = self._load_index()
+            return {
+                "entries": len(sizes),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+def sweep_directory(path: str, max_age_seconds: float, keep: Iterable[str] = ()) -> int:
+    """Rimuove file e sottodirectory più vecchi di max_age_seconds
+
+    Args:
+        path: Directory temporanea da pulire
+        max_age_seconds: Età massima dei file
+        keep: Path assoluti da non rimuovere (es. upload di job in corso)
+
+    Returns:
+        int: Numero di elementi rimossi
+    """
+    if not os.path.isdir(path):
+        return 0
+
+    keep = {os.path.abspath(p) for p in keep}
+    now = time.time()
+    removed = 0
+    for name in os.listdir(path):
+        full_path = os.path.abspath(os.path.join(path, name))
+        if full_path in keep:
+            continue
+        try:
+            if now - os.path.getmtime(full_path) <= max_age_seconds:
+                continue
+            if os.path.isdir(full_path):
+                shutil.rmtree(full_path, ignore_errors=True)
+            else:
+                os.remove(full_path)
+            removed += 1
+        except OSError:
+            pass
+
+    if removed:
+        logger.info(f"🧹 Rimossi {removed} elementi scaduti da {path}")
+    return removed
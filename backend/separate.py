@@ -7,87 +7,157 @@ Script per separare file audio in stem usando Demucs
 import os
 import sys
 import json
+import logging
 import argparse
-import subprocess
-import tempfile
-from pathlib import Path
-from typing import Dict, List, Optional
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+import threading
 import time
 
+import numpy as np
+
 # Import logger centralizzato
 from logger import setup_logger
+from model_registry import get_model_registry
+from cpu_scheduler import apply_torch_threads, plan_separation
+from audio_io import (AudioDecodeError, collect_audio_files, decode_audio, ffmpeg_available,
+                      prepare_audio, probe_duration)
 
 # Configurazione logging
 logger = setup_logger(__name__)
 
+# Demucs 4.1 (demucs.api) si installa dal sorgente: su PyPI c'è solo la 4.0.1
+DEMUCS_REQUIREMENT = "demucs @ git+https://github.com/facebookresearch/demucs@main"
+
+# Modalità batch: checkpoint JSONL degli input completati, scritto in output_dir
+BATCH_CHECKPOINT_NAME = "separation_checkpoint.jsonl"
+
+# Callback di progresso di una separazione: (fase, frazione 0-1 del file)
+# con fasi decode, separate (segmento per segmento), write
+StageCallback = Callable[[str, float], None]
+# Frazione della separazione all'inizio della rete e della scrittura degli stem
+SEPARATE_START = 0.05
+SEPARATE_END = 0.95
+
+
+def _no_stage(stage: str, fraction: float):
+    """Callback di default quando il chiamante non segue il progresso"""
+
+
+def segment_progress(shifts: int, report: StageCallback) -> Callable[[dict], None]:
+    """Callback di Demucs che traduce i segmenti completati in progresso
+
+    Demucs la invoca all'inizio e alla fine di ogni segmento, per ogni shift
+    e per ogni modello del bag, anche da più thread (jobs > 0): il progresso
+    riportato è monotono.
+    """
+    lock = threading.Lock()
+    done = [0.0]
+
+    def callback(info: dict):
+        if info.get("state") != "end" or not info.get("audio_length"):
+            return
+        shift = (info.get("shift_idx", 0) + info.get("segment_offset", 0) / info["audio_length"]) / max(1, shifts)
+        fraction = (info.get("model_idx_in_bag", 0) + shift) / max(1, info.get("models", 1))
+        with lock:
+            if fraction <= done[0]:
+                return
+            done[0] = fraction
+        report("separate", SEPARATE_START + (SEPARATE_END - SEPARATE_START) * min(1.0, fraction))
+
+    return callback
+
 class AudioSeparator:
     """Classe per separazione audio con Demucs"""
     
-    def __init__(self, model_name: str = "htdemucs"):
+    def __init__(self,
+                 model_name: str = "htdemucs",
+                 device: str = "cpu",
+                 shifts: int = 1,
+                 overlap: float = 0.25,
+                 jobs: Optional[int] = None,
+                 segment: Optional[float] = None,
+                 torch_threads: Optional[int] = None,
+                 concurrent_jobs: int = 1):
+        """
+        Args:
+            model_name: Modello Demucs
+            device: "cpu" o "cuda"
+            shifts: Numero di shift per ensemble (migliora qualità)
+            overlap: Overlap tra segmenti per smoothness
+            jobs: Segmenti elaborati in parallelo (None = scelto dallo scheduler)
+            segment: Lunghezza segmento in secondi (None = scelta dallo scheduler)
+            torch_threads: Thread intra-op torch (None = scelti dallo scheduler)
+            concurrent_jobs: Separazioni simultanee sulla macchina (per ripartire i core)
+        """
         self.model_name = model_name
-        self.temp_dir = None
+        self.device = device
+        self.shifts = shifts
+        self.overlap = overlap
+        self.jobs = jobs
+        self.segment = segment
+        self.torch_threads = torch_threads
+        self.concurrent_jobs = concurrent_jobs
+        self._dependencies_checked = False
         
     def check_dependencies(self) -> bool:
-        """Verifica che tutte le dipendenze siano installate"""
-        try:
-            import demucs
-            import librosa
-            import soundfile
-            logger.info("✅ Dipendenze Python verificate")
+        """Verifica che tutte le dipendenze siano installate (una volta per istanza)
+        
+        Usa importlib.util.find_spec: demucs e torch vengono importati solo
+        al caricamento del modello, non per la verifica.
+        """
+        if self._dependencies_checked:
             return True
-        except ImportError as e:
-            logger.error(f"❌ Dipendenza mancante: {e}")
-            logger.error("Installa con: pip install demucs librosa soundfile")
+        missing = [name for name in ("demucs", "librosa", "soundfile")
+                   if importlib.util.find_spec(name) is None]
+        if missing:
+            logger.error(f"❌ Dipendenza mancante: {', '.join(missing)}")
+            logger.error(f'Installa con: pip install "{DEMUCS_REQUIREMENT}" librosa soundfile')
             return False
+        # demucs.api esiste solo da demucs 4.1 (PyPI ha solo la 4.0.1)
+        if importlib.util.find_spec("demucs.api") is None:
+            logger.error("❌ Serve demucs 4.1 (demucs.api), non disponibile su PyPI")
+            logger.error(f'Installa con: pip install -U "{DEMUCS_REQUIREMENT}"')
+            return False
+        logger.info("✅ Dipendenze Python verificate")
+        self._dependencies_checked = True
+        return True
     
     def check_ffmpeg(self) -> bool:
-        """Verifica che ffmpeg sia installato"""
-        try:
-            subprocess.run(['ffmpeg', '-version'], 
-                         capture_output=True, check=True)
+        """Verifica che ffmpeg sia installato (controllo eseguito una volta per processo)
+        
+        ffmpeg serve solo come fallback per i codec che soundfile/audioread
+        non leggono (vedi audio_io.decode_audio).
+        """
+        if ffmpeg_available():
             logger.info("✅ FFmpeg trovato")
             return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            logger.error("❌ FFmpeg non trovato")
-            logger.error("Installa FFmpeg da: https://ffmpeg.org/download.html")
-            return False
-    
-    def convert_to_wav(self, input_path: str, output_path: str) -> bool:
-        """Converte file audio in WAV 44100 Hz"""
-        try:
-            cmd = [
-                'ffmpeg', '-i', input_path,
-                '-ar', '44100',  # Sample rate
-                '-ac', '2',      # Stereo
-                '-y',            # Overwrite
-                output_path
-            ]
-            
-            logger.info(f"🔄 Conversione in corso: {input_path} -> {output_path}")
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                logger.info("✅ Conversione completata")
-                return True
-            else:
-                logger.error(f"❌ Errore conversione: {result.stderr}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"❌ Errore durante conversione: {e}")
-            return False
+        logger.warning("⚠️ FFmpeg non trovato (solo decoder in-process)")
+        logger.warning("Installa FFmpeg da: https://ffmpeg.org/download.html")
+        return False
     
     def get_audio_duration(self, file_path: str) -> float:
-        """Ottiene durata file audio in secondi"""
-        try:
-            import librosa
-            duration = librosa.get_duration(filename=file_path)
-            return duration
-        except Exception as e:
-            logger.warning(f"⚠️ Impossibile ottenere durata: {e}")
+        """Durata del file in secondi letta dagli header (vedi audio_io.probe_audio)"""
+        duration = probe_duration(file_path)
+        if duration is None:
+            logger.warning(f"⚠️ Impossibile ottenere durata: {file_path}")
             return 0.0
+        return duration
     
-    def separate_audio(self, input_path: str, output_dir: str) -> Dict:
+    def max_model_segment(self, separator) -> Optional[float]:
+        """Segmento massimo accettato dal modello (i transformer hanno un limite)"""
+        limit = getattr(separator.model, "max_allowed_segment", None)
+        if limit is None or limit == float("inf"):
+            return None
+        return float(limit)
+    
+    def separate_audio(self, input_path: str, output_dir: str,
+                       audio: Optional[Tuple[np.ndarray, int]] = None,
+                       export: bool = True,
+                       return_sources: bool = False,
+                       progress: Optional[StageCallback] = None) -> Dict:
         """Separa audio in stem usando Demucs (Deep Music Source Separation)
         
         Algoritmo Demucs:
@@ -100,15 +170,36 @@ class AudioSeparator:
         - shifts: numero di shift temporali per ensemble
         - overlap: overlap tra shift per smoothness
         - split: split automatico per file lunghi
+        - jobs/segment/thread torch: scelti da cpu_scheduler se non impostati
+        
+        Args:
+            input_path: File audio
+            output_dir: Directory degli stem
+            audio: Audio già decodificato (canali, campioni) e sample rate;
+                se assente il file viene decodificato qui
+            export: Se False nessun WAV viene scritto su disco
+            return_sources: Se True il risultato contiene "sources" (nome ->
+                array float32 (canali, campioni)) e "samplerate", per passare
+                gli stem alla trascrizione senza file intermedi
+            progress: Callback opzionale (fase, frazione 0-1 della separazione),
+                invocata a ogni segmento elaborato da Demucs
         """
+        report = progress or _no_stage
         try:
-            from demucs.api import separate_track
+            import torch
+            from demucs.api import save_audio
             
             # Crea directory output se non esiste
             os.makedirs(output_dir, exist_ok=True)
             
+            # Decodifica in memoria (nessun WAV temporaneo)
+            if audio is None:
+                report("decode", 0.0)
+                audio = decode_audio(input_path)
+            samples, sample_rate = audio
+            
             # Stima tempo (approssimativo: ~1x realtime per htdemucs)
-            duration = self.get_audio_duration(input_path)
+            duration = samples.shape[1] / sample_rate
             estimated_time = duration * 1.2  # 20% buffer
             
             logger.info(f"🎵 Inizio separazione: {input_path}")
@@ -118,35 +209,71 @@ class AudioSeparator:
             
             start_time = time.time()
             
-            # Separazione con Demucs usando CNN encoder-decoder
-            stems = separate_track(
-                input_path,
-                model=self.model_name,
-                device='cpu',  # Cambia in 'cuda' se hai GPU
-                shifts=1,      # Numero di shift per ensemble (migliora qualità)
-                overlap=0.25,  # Overlap tra shift per smoothness
-                split=True,    # Split automatico per file lunghi
-                jobs=1         # Numero di job paralleli
+            # Modello dal registro del processo: caricato solo al primo uso
+            registry = get_model_registry()
+            model_cached = registry.is_loaded(self.model_name, self.device)
+            separator = registry.get(self.model_name, device=self.device)
+            model_load_time = time.time() - start_time
+            
+            # Parallelismo: su GPU un solo flusso, su CPU ripartizione dei core
+            if self.device == 'cpu':
+                plan = plan_separation(
+                    concurrent_jobs=self.concurrent_jobs,
+                    duration=duration,
+                    max_segment=self.max_model_segment(separator),
+                    jobs=self.jobs,
+                    segment=self.segment,
+                    torch_threads=self.torch_threads
+                )
+                apply_torch_threads(plan["torch_threads"])
+            else:
+                plan = {"jobs": 0, "segment": self.segment, "torch_threads": None}
+            
+            # Parametri per chiamata: il separatore è condiviso tra i job del worker
+            separator.update_parameter(
+                shifts=self.shifts,      # Numero di shift per ensemble (migliora qualità)
+                overlap=self.overlap,    # Overlap tra segmenti per smoothness
+                split=True,              # Split automatico per file lunghi
+                segment=plan["segment"], # Lunghezza segmento (None = default del modello)
+                jobs=plan["jobs"],       # Segmenti elaborati in parallelo
+                # Progresso per segmento (None azzera quella di un job precedente)
+                callback=segment_progress(self.shifts, report) if progress else None
             )
             
-            # Salva stem separati
+            # Ricampionamento e canali del modello in memoria, poi separazione
+            # con Demucs usando CNN encoder-decoder
+            report("separate", SEPARATE_START)
+            wav = prepare_audio(samples, sample_rate, separator.samplerate, separator.audio_channels)
+            _, stems = separator.separate_tensor(torch.from_numpy(wav), separator.samplerate)
+            
+            # Salva stem separati (solo se richiesti come file)
             stem_paths = {}
-            for name, stem in stems.items():
-                output_path = os.path.join(output_dir, f"{name}.wav")
-                stem.export(output_path, format="wav")
-                stem_paths[name] = output_path
-                logger.info(f"✅ Salvato: {name}.wav")
+            report("write", SEPARATE_END)
+            if export:
+                for name, source in stems.items():
+                    output_path = os.path.join(output_dir, f"{name}.wav")
+                    save_audio(source, output_path, samplerate=separator.samplerate)
+                    stem_paths[name] = output_path
+                    logger.info(f"✅ Salvato: {name}.wav")
             
             elapsed_time = time.time() - start_time
             logger.info(f"🎉 Separazione completata in {elapsed_time:.1f}s")
             
-            return {
+            result = {
                 "success": True,
                 "stems": stem_paths,
                 "duration": duration,
                 "processing_time": elapsed_time,
-                "model": self.model_name
+                "model": self.model_name,
+                "model_cached": model_cached,
+                "model_load_time": model_load_time,
+                "parallelism": plan
             }
+            if return_sources:
+                # Tensori CPU -> array NumPy senza copia
+                result["sources"] = {name: source.cpu().numpy() for name, source in stems.items()}
+                result["samplerate"] = separator.samplerate
+            return result
             
         except Exception as e:
             logger.error(f"❌ Errore durante separazione: {e}")
@@ -156,43 +283,195 @@ class AudioSeparator:
                 "duration": self.get_audio_duration(input_path)
             }
     
-    def process_file(self, input_path: str, output_dir: str) -> Dict:
-        """Processa file audio completo"""
+    def process_file(self, input_path: str, output_dir: str,
+                     export: bool = True, return_sources: bool = False,
+                     progress: Optional[StageCallback] = None) -> Dict:
+        """Processa file audio completo (export/return_sources/progress: vedi separate_audio)"""
         logger.info(f"🚀 Avvio processamento: {input_path}")
         
         # Verifica dipendenze
         if not self.check_dependencies():
             return {"success": False, "error": "Dipendenze mancanti"}
         
-        if not self.check_ffmpeg():
-            return {"success": False, "error": "FFmpeg non trovato"}
-        
         # Verifica file input
         if not os.path.exists(input_path):
             return {"success": False, "error": f"File non trovato: {input_path}"}
         
-        # Crea directory temporanea
-        self.temp_dir = tempfile.mkdtemp()
-        
+        # Decodifica in-process (ffmpeg via pipe solo per codec non supportati)
+        if progress:
+            progress("decode", 0.0)
         try:
-            # Determina se serve conversione
-            input_ext = Path(input_path).suffix.lower()
-            if input_ext != '.wav':
-                # Converte in WAV
-                temp_wav = os.path.join(self.temp_dir, "temp.wav")
-                if not self.convert_to_wav(input_path, temp_wav):
-                    return {"success": False, "error": "Errore conversione"}
-                input_path = temp_wav
-            
-            # Separazione
-            result = self.separate_audio(input_path, output_dir)
-            return result
-            
-        finally:
-            # Cleanup directory temporanea
-            if self.temp_dir and os.path.exists(self.temp_dir):
-                import shutil
-                shutil.rmtree(self.temp_dir)
+            audio = decode_audio(input_path)
+        except AudioDecodeError as e:
+            logger.error(f"❌ Errore decodifica: {e}")
+            return {"success": False, "error": str(e)}
+        
+        # Separazione
+        return self.separate_audio(input_path, output_dir, audio=audio,
+                                   export=export, return_sources=return_sources,
+                                   progress=progress)
+
+# Separatore del processo worker in modalità batch (impostato da _init_batch_worker)
+_batch_separator: Optional[AudioSeparator] = None
+# Errore di caricamento del modello nel worker: ogni file fallisce con questo
+_batch_init_error: Optional[str] = None
+
+
+def _init_batch_worker(params: Dict):
+    """Inizializzatore dei worker batch: dipendenze verificate e modello caricato una volta
+
+    Un errore qui non deve rompere il pool: viene ricordato e riportato
+    come fallimento di ogni file assegnato al worker.
+    """
+    global _batch_separator, _batch_init_error
+    _batch_separator = AudioSeparator(**params)
+    _batch_init_error = None
+    if not _batch_separator.check_dependencies():
+        _batch_init_error = "Dipendenze mancanti"
+        return
+    try:
+        get_model_registry().get(_batch_separator.model_name, device=_batch_separator.device)
+    except Exception as e:
+        _batch_init_error = f"Caricamento modello {_batch_separator.model_name} fallito: {e}"
+        logger.error(f"❌ {_batch_init_error}")
+
+
+def _batch_separate(input_path: str, output_dir: str) -> Dict:
+    """Separa un file nel worker batch (eseguita nei processi del pool o in linea)"""
+    if _batch_init_error is not None:
+        return {"success": False, "error": _batch_init_error,
+                "input_file": input_path, "output_dir": output_dir}
+    result = _batch_separator.process_file(input_path, output_dir)
+    result.update({"input_file": input_path, "output_dir": output_dir})
+    if result.get("success") and result.get("duration"):
+        result["rtf"] = result["processing_time"] / result["duration"]
+    return result
+
+
+def read_manifest(manifest_path: str) -> List[str]:
+    """Input elencati in un manifest (una riga per file/directory/glob, # per i commenti)
+
+    I percorsi relativi sono risolti rispetto alla directory del manifest.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.normpath(os.path.join(base_dir, line))
+            for line in lines if line and not line.startswith("#")]
+
+
+def load_checkpoint(checkpoint_path: str) -> set:
+    """Input già separati con successo in un'esecuzione precedente"""
+    completed = set()
+    if not os.path.exists(checkpoint_path):
+        return completed
+    with open(checkpoint_path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Riga troncata da un'interruzione
+            if entry.get("success"):
+                completed.add(entry["input_file"])
+    return completed
+
+
+def rtf_stats(results: List[Dict], wall_time: float) -> Dict:
+    """Statistiche aggregate del real-time factor (tempo di elaborazione / durata audio)"""
+    done = [result for result in results if result.get("success") and result.get("rtf") is not None]
+    if not done:
+        return {"files": 0}
+    rtfs = np.array([result["rtf"] for result in done])
+    audio_seconds = sum(result["duration"] for result in done)
+    processing_seconds = sum(result["processing_time"] for result in done)
+    return {
+        "files": len(done),
+        "audio_seconds": round(audio_seconds, 1),
+        "processing_seconds": round(processing_seconds, 1),
+        "wall_seconds": round(wall_time, 1),
+        "rtf": round(processing_seconds / audio_seconds, 3),
+        "rtf_mean": round(float(rtfs.mean()), 3),
+        "rtf_p50": round(float(np.percentile(rtfs, 50)), 3),
+        "rtf_p95": round(float(np.percentile(rtfs, 95)), 3),
+        "rtf_max": round(float(rtfs.max()), 3),
+        # Secondi di audio separati per secondo di orologio (tutti i worker)
+        "throughput": round(audio_seconds / wall_time, 2) if wall_time > 0 else None
+    }
+
+
+def run_batch(inputs: List[str], output_dir: str, params: Dict, workers: int = 1,
+              checkpoint_path: Optional[str] = None) -> Dict:
+    """Separa molti file con modelli caldi, riprendendo da un checkpoint
+
+    Ogni input finisce in output_dir/<percorso relativo senza estensione>/.
+    Ogni file completato viene aggiunto al checkpoint JSONL: rilanciando lo
+    stesso comando dopo un'interruzione gli input già separati vengono
+    saltati (quelli falliti vengono ritentati). Input (file, directory,
+    glob o riga del manifest) senza nessun file audio contano come falliti.
+
+    Args:
+        inputs: File, directory o glob
+        output_dir: Directory radice degli stem
+        params: Parametri di AudioSeparator
+        workers: Separazioni simultanee; ognuna in un processo con il proprio
+            modello, con i core ripartiti da cpu_scheduler
+        checkpoint_path: Checkpoint JSONL (default: output_dir/separation_checkpoint.jsonl)
+
+    Returns:
+        dict: {"total", "separated", "skipped", "failed", "unmatched",
+        "checkpoint_file", "rtf"}
+    """
+    checkpoint_path = checkpoint_path or os.path.join(output_dir, BATCH_CHECKPOINT_NAME)
+    os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+    completed = load_checkpoint(checkpoint_path)
+
+    files, unmatched = collect_audio_files(inputs)
+    pairs = [(path, os.path.join(output_dir, os.path.splitext(relative)[0]))
+             for path, relative in files]
+    todo = [(src, dst) for src, dst in pairs if src not in completed]
+    stats = {"total": len(pairs), "separated": 0, "skipped": len(pairs) - len(todo),
+             "failed": len(unmatched), "unmatched": unmatched, "checkpoint_file": checkpoint_path}
+    logger.info(f"📂 Batch: {len(pairs)} file, {len(todo)} da separare, "
+                f"{stats['skipped']} già nel checkpoint")
+
+    workers = max(1, min(workers, len(todo) or 1))
+    params = {**params, "concurrent_jobs": workers}
+    results = []
+    start_time = time.time()
+
+    with open(checkpoint_path, "a") as checkpoint:
+        def record(result: Dict):
+            results.append(result)
+            stats["separated" if result.get("success") else "failed"] += 1
+            checkpoint.write(json.dumps(result, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            logger.info(f"{'✅' if result.get('success') else '❌'} "
+                        f"[{len(results)}/{len(todo)}] {result['input_file']}")
+
+        if workers == 1:
+            # Un solo worker: nessun pool, il modello resta caldo in questo processo
+            if todo:
+                _init_batch_worker(params)
+            for src, dst in todo:
+                record(_batch_separate(src, dst))
+        else:
+            # spawn: come i pool di pipeline.py e jobs.py
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_batch_worker, initargs=(params,)) as executor:
+                futures = {executor.submit(_batch_separate, src, dst): (src, dst) for src, dst in todo}
+                for future in as_completed(futures):
+                    src, dst = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"success": False, "error": str(e), "input_file": src, "output_dir": dst}
+                    record(result)
+
+    stats["rtf"] = rtf_stats(results, time.time() - start_time)
+    logger.info(f"🏁 Batch completato: {stats}")
+    return stats
+
 
 def main():
     """Funzione principale"""
@@ -204,6 +483,10 @@ Esempi di utilizzo:
   python separate.py input.mp3 output/
   python separate.py input.wav output/ --model htdemucs
   python separate.py input.flac output/ --verbose
+  python separate.py input.wav output/ --jobs 4 --torch-threads 4 --segment 7
+  python separate.py input.wav output/ --concurrent 8   # 8 separazioni simultanee
+  python separate.py --batch archivio/ "extra/*.mp3" --output-dir stems/ --workers 2
+  python separate.py --manifest tracce.txt --output-dir stems/   # riprende dal checkpoint
 
 Modelli disponibili:
   - htdemucs (default): Alta qualità, più lento
@@ -212,10 +495,32 @@ Modelli disponibili:
         """
     )
     
-    parser.add_argument("input", help="Path file audio input")
-    parser.add_argument("output", help="Directory output per stem")
+    parser.add_argument("input", nargs="?", help="Path file audio input")
+    parser.add_argument("output", nargs="?", help="Directory output per stem")
+    parser.add_argument("--batch", nargs="+", metavar="INPUT", default=[],
+                       help="Modalità batch: file, directory o glob da separare")
+    parser.add_argument("--manifest", help="Modalità batch: file con un input per riga")
+    parser.add_argument("--output-dir", help="Directory radice degli stem in modalità batch")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Separazioni simultanee in modalità batch (default: 1)")
+    parser.add_argument("--checkpoint",
+                       help=f"Checkpoint JSONL (default: OUTPUT_DIR/{BATCH_CHECKPOINT_NAME})")
     parser.add_argument("--model", default="htdemucs", 
                        help="Modello Demucs da usare (default: htdemucs)")
+    parser.add_argument("--device", default="cpu",
+                       help="Device torch: cpu o cuda (default: cpu)")
+    parser.add_argument("--shifts", type=int, default=1,
+                       help="Shift per ensemble (default: 1)")
+    parser.add_argument("--overlap", type=float, default=0.25,
+                       help="Overlap tra segmenti (default: 0.25)")
+    parser.add_argument("--jobs", type=int, default=None,
+                       help="Segmenti in parallelo (default: automatico)")
+    parser.add_argument("--segment", type=float, default=None,
+                       help="Lunghezza segmento in secondi (default: automatica)")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                       help="Thread intra-op torch (default: automatico)")
+    parser.add_argument("--concurrent", type=int, default=1,
+                       help="Separazioni simultanee tra cui ripartire i core (default: 1)")
     parser.add_argument("--verbose", "-v", action="store_true",
                        help="Output verboso")
     
@@ -224,8 +529,38 @@ Modelli disponibili:
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
+    params = {
+        "model_name": args.model,
+        "device": args.device,
+        "shifts": args.shifts,
+        "overlap": args.overlap,
+        "jobs": args.jobs,
+        "segment": args.segment,
+        "torch_threads": args.torch_threads,
+        "concurrent_jobs": args.concurrent
+    }
+    
+    if args.batch or args.manifest:
+        if not args.output_dir:
+            parser.error("--batch/--manifest richiedono --output-dir")
+        # Verifica una volta qui: senza dipendenze ogni worker fallirebbe
+        if not AudioSeparator(**params).check_dependencies():
+            sys.exit(1)
+        inputs = args.batch + (read_manifest(args.manifest) if args.manifest else [])
+        stats = run_batch(inputs, args.output_dir, params, workers=args.workers,
+                          checkpoint_path=args.checkpoint)
+        print("\n" + "="*50)
+        print("RISULTATO BATCH")
+        print("="*50)
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
+        # Exit code 1 anche se nessun input corrisponde a un file audio
+        sys.exit(0 if stats["failed"] == 0 and stats["total"] > 0 else 1)
+    
+    if not args.input or not args.output:
+        parser.error("servono input e output (oppure --batch/--manifest)")
+    
     # Crea separatore
-    separator = AudioSeparator(model_name=args.model)
+    separator = AudioSeparator(**params)
     
     # Processa file
     result = separator.process_file(args.input, args.output)
@@ -2,23 +2,151 @@
 """
 MIDICOM MIDI Transcriber
 Script per trascrivere audio in MIDI usando onset detection + pitch detection
+
+librosa, pretty_midi e CREPE (TensorFlow) vengono importati al primo uso:
+--help, la verifica delle dipendenze e l'import del modulo restano rapidi.
 """
 
 import os
 import sys
+import json
+import time
+import logging
 import argparse
+import importlib.util
+import multiprocessing
 import numpy as np
-import librosa
-import pretty_midi
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import List, Tuple, Dict, Optional
+from typing import TYPE_CHECKING, Callable, Iterator, List, Tuple, Dict, Optional
+
+if TYPE_CHECKING:
+    import pretty_midi
 
 # Import logger centralizzato
 from logger import setup_logger
+from audio_io import collect_audio_files
 
 # Configurazione logging
 logger = setup_logger(__name__)
 
+# Layout delle note in forma vettoriale (un record per nota)
+NOTE_DTYPE = np.dtype([
+    ('start', np.float64),
+    ('end', np.float64),
+    ('pitch', np.int64),
+    ('velocity', np.int64),
+    ('frequency', np.float64)
+])
+
+# Trascrizione a blocchi: oltre questa durata l'audio non viene caricato intero
+STREAMING_THRESHOLD_SECONDS = 600.0
+DEFAULT_BLOCK_SECONDS = 60.0
+# Contesto letto prima e dopo ogni blocco (onset e pitch ai bordi restano stabili)
+BLOCK_OVERLAP_SECONDS = 2.0
+
+# Audio già in memoria: (campioni mono (n,) o (canali, n), sample rate)
+AudioBuffer = Tuple[np.ndarray, int]
+
+# Callback di progresso di una trascrizione: (fase, frazione 0-1 del file)
+# con fasi decode, onset, pitch, group, quantize
+StageCallback = Callable[[str, float], None]
+# Frazione della trascrizione alla fine della decodifica, dell'analisi
+# (onset + pitch) e del raggruppamento in note
+DECODE_END = 0.1
+ANALYSIS_END = 0.85
+GROUP_END = 0.95
+# Quota dell'analisi spesa negli onset (il pitch tracking domina)
+ONSET_SHARE = 0.25
+
+# Programmi General MIDI delle tracce nel MIDI multitraccia
+DRUM_STEM = "drums"
+STEM_PROGRAMS = {
+    "bass": 33,    # Electric Bass (finger)
+    "vocals": 52,  # Choir Aahs
+    "other": 0     # Acoustic Grand Piano
+}
+
+# Batteria: note GM percussioni e soglie sul centroide spettrale (Hz)
+DRUM_KICK = 36
+DRUM_SNARE = 38
+DRUM_HIHAT = 42
+KICK_MAX_CENTROID = 800.0
+SNARE_MAX_CENTROID = 4000.0
+DRUM_ATTACK_FRAMES = 3
+DRUM_HIT_DURATION = 0.1
+
+# Modalità batch: riepilogo JSONL scritto in output_dir
+BATCH_SUMMARY_NAME = "transcription_summary.jsonl"
+
+# CREPE: capacità del modello, sample rate e finestra (campioni) della rete
+CREPE_CAPACITIES = ("tiny", "small", "medium", "large", "full")
+CREPE_SAMPLE_RATE = 16000
+CREPE_FRAME_LENGTH = 1024
+# Soglia suggerita (dBFS) per il gate RMS opzionale di CREPE (crepe_silence_db):
+# i frame sotto soglia non passano dalla rete e non producono pitch
+CREPE_SILENCE_DB = -60.0
+# Frame estratti e inferiti per volta (limita la memoria su file lunghi)
+CREPE_CHUNK_FRAMES = 8192
+
+
+def _no_stage(stage: str, fraction: float):
+    """Callback di default quando il chiamante non segue il progresso"""
+
+
+@lru_cache(maxsize=None)
+def load_crepe_model(capacity: str):
+    """Modello CREPE della capacità richiesta, caricato una volta per processo"""
+    from crepe.core import build_and_load_model
+
+    logger.info(f"📦 Caricamento modello CREPE {capacity}...")
+    return build_and_load_model(capacity)
+
+
+class SpectralFeatures:
+    """Feature spettrali di un segnale, calcolate al primo uso e condivise
+    
+    Onset detection, piptrack, centroide e RMS partono tutti dalla stessa
+    STFT (n_fft 2048, hop_length del trascrittore): viene calcolata una volta
+    sola e ogni detector legge da qui invece di rifare l'analisi sull'audio.
+    I risultati coincidono con le chiamate librosa su y.
+    """
+    
+    def __init__(self, y: np.ndarray, sr: int, hop_length: int, n_fft: int = 2048):
+        self.y = y
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+    
+    @cached_property
+    def magnitude(self) -> np.ndarray:
+        """Modulo della STFT (bin, frame)"""
+        import librosa
+        return np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+    
+    @cached_property
+    def onset_envelope(self) -> np.ndarray:
+        """Spectral flux sul mel-spettrogramma in dB (come onset_strength(y=...))"""
+        import librosa
+        
+        mel = librosa.feature.melspectrogram(S=self.magnitude ** 2, sr=self.sr)
+        return librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=self.sr,
+                                            hop_length=self.hop_length)
+    
+    @cached_property
+    def rms(self) -> np.ndarray:
+        """Energia RMS per frame"""
+        import librosa
+        return librosa.feature.rms(S=self.magnitude, frame_length=self.n_fft)[0]
+    
+    @cached_property
+    def spectral_centroid(self) -> np.ndarray:
+        """Centroide spettrale per frame in Hz"""
+        import librosa
+        return librosa.feature.spectral_centroid(S=self.magnitude, sr=self.sr)[0]
+
+
 class MIDITranscriber:
     """Classe per trascrizione audio -> MIDI"""
     
@@ -26,34 +154,50 @@ class MIDITranscriber:
                  hop_length: int = 512,
                  threshold_onset: float = 0.3,
                  min_note_duration: float = 0.1,
-                 quantize_ms: int = 50):
+                 quantize_ms: int = 50,
+                 pitch_method: str = "auto",
+                 block_duration: float = DEFAULT_BLOCK_SECONDS,
+                 crepe_capacity: str = "full",
+                 crepe_step_ms: int = 10,
+                 crepe_batch_size: int = 256,
+                 crepe_silence_db: Optional[float] = None):
         self.hop_length = hop_length
         self.threshold_onset = threshold_onset
         self.min_note_duration = min_note_duration
         self.quantize_ms = quantize_ms
+        self.pitch_method = pitch_method  # "auto" (CREPE se disponibile), "crepe" o "librosa"
+        self.use_crepe = False
         self.sample_rate = 22050  # Sample rate per analisi
+        self.block_duration = block_duration  # Secondi per blocco in modalità streaming
+        self.crepe_capacity = crepe_capacity  # tiny/small/medium/large/full
+        self.crepe_step_ms = crepe_step_ms  # Passo tra frame CREPE in millisecondi
+        self.crepe_batch_size = crepe_batch_size  # Frame per batch di inferenza
+        self.crepe_silence_db = crepe_silence_db  # Gate RMS in dBFS (None = disattivato)
         
     def check_dependencies(self) -> bool:
-        """Verifica dipendenze"""
-        try:
-            import librosa
-            import pretty_midi
-            import numpy as np
-            logger.info("✅ Dipendenze base verificate")
-            
-            # Prova a importare crepe (opzionale)
-            try:
-                import crepe
-                logger.info("✅ CREPE disponibile per pitch detection avanzata")
-                self.use_crepe = True
-            except ImportError:
-                logger.warning("⚠️ CREPE non disponibile, usando librosa per pitch detection")
-                self.use_crepe = False
-                
-            return True
-        except ImportError as e:
-            logger.error(f"❌ Dipendenza mancante: {e}")
+        """Verifica dipendenze senza importarle (importlib.util.find_spec)
+        
+        Le librerie vengono importate solo quando servono: la verifica non
+        paga l'import di librosa, pretty_midi o di TensorFlow (per CREPE).
+        """
+        missing = [name for name in ("librosa", "pretty_midi")
+                   if importlib.util.find_spec(name) is None]
+        if missing:
+            logger.error(f"❌ Dipendenza mancante: {', '.join(missing)}")
             return False
+        logger.info("✅ Dipendenze base verificate")
+        
+        # CREPE è opzionale (e richiede TensorFlow)
+        if self.pitch_method == "librosa":
+            self.use_crepe = False
+            return True
+        self.use_crepe = all(importlib.util.find_spec(name) is not None
+                             for name in ("crepe", "tensorflow"))
+        if self.use_crepe:
+            logger.info("✅ CREPE disponibile per pitch detection avanzata")
+        else:
+            logger.warning("⚠️ CREPE non disponibile, usando librosa per pitch detection")
+        return True
     
     def load_audio(self, file_path: str) -> Tuple[np.ndarray, int]:
         """Carica e preprocessa audio per analisi
@@ -64,6 +208,8 @@ class MIDITranscriber:
         Returns:
             Tuple[audio_data, sample_rate]: Audio mono e sample rate
         """
+        import librosa
+        
         logger.info(f"🎵 Caricamento audio: {file_path}")
         
         # Carica audio mono a sample rate standardizzato
@@ -72,7 +218,171 @@ class MIDITranscriber:
         logger.info(f"📊 Audio caricato: {len(audio_data)/sample_rate:.1f}s, {sample_rate}Hz")
         return audio_data, sample_rate
     
-    def detect_onsets(self, y: np.ndarray, sr: int) -> np.ndarray:
+    def prepare_samples(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Stesso preprocessing di load_audio per audio già in memoria
+        
+        Args:
+            samples: Audio mono (n,) o multicanale (canali, n)
+            sample_rate: Sample rate di samples
+            
+        Returns:
+            np.ndarray: Audio mono float32 a self.sample_rate
+        """
+        import librosa
+        
+        audio_data = samples.mean(axis=0) if samples.ndim == 2 else samples
+        audio_data = np.asarray(audio_data, dtype=np.float32)
+        if sample_rate != self.sample_rate:
+            audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=self.sample_rate)
+        return audio_data
+    
+    def audio_duration(self, file_path: str) -> Optional[float]:
+        """Durata del file letta dall'header, senza decodificare l'audio
+        
+        Returns:
+            Durata in secondi, o None se il formato non è leggibile da soundfile
+        """
+        import soundfile as sf
+        try:
+            info = sf.info(file_path)
+        except RuntimeError:  # LibsndfileError deriva da RuntimeError
+            return None
+        return info.frames / info.samplerate
+    
+    def source_duration(self, file_path: str, audio: Optional[AudioBuffer] = None) -> Optional[float]:
+        """Durata dell'audio in memoria o del file (None se non leggibile)"""
+        if audio is not None:
+            return audio[0].shape[-1] / audio[1]
+        return self.audio_duration(file_path)
+    
+    def iter_audio_blocks(self, file_path: str,
+                          audio: Optional[AudioBuffer] = None) -> Iterator[Tuple[np.ndarray, float, float, float]]:
+        """Legge l'audio a blocchi sovrapposti, mono e al sample rate di analisi
+        
+        Ogni blocco copre [core_start, core_end) più BLOCK_OVERLAP_SECONDS di
+        contesto su entrambi i lati; in memoria c'è un solo blocco alla volta.
+        Con audio (es. buffer memory-mapped) i blocchi sono slice del buffer.
+        
+        Yields:
+            Tuple[audio, offset, core_start, core_end]: audio del blocco, istante
+            del suo primo campione e regione (in secondi) di cui il blocco è responsabile
+        """
+        if audio is not None:
+            samples, native_sr = audio
+            yield from self._iter_blocks(native_sr, samples.shape[-1],
+                                         lambda start, end: samples[..., start:end])
+            return
+        
+        import soundfile as sf
+        
+        with sf.SoundFile(file_path) as f:
+            def read(start: int, end: int) -> np.ndarray:
+                f.seek(start)
+                return f.read(end - start, dtype='float32', always_2d=True).T
+            
+            yield from self._iter_blocks(f.samplerate, f.frames, read)
+    
+    def _iter_blocks(self, native_sr: int, total_frames: int,
+                     read: Callable[[int, int], np.ndarray]) -> Iterator[Tuple[np.ndarray, float, float, float]]:
+        """Suddivisione in blocchi comune a file e buffer (vedi iter_audio_blocks)"""
+        # Bordi dei blocchi sulla griglia degli hop: i frame di ogni blocco
+        # coincidono con quelli dell'analisi sull'intero file
+        hop_seconds = self.hop_length / self.sample_rate
+        block_hops = max(1, round(self.block_duration / hop_seconds))
+        overlap_hops = int(np.ceil(BLOCK_OVERLAP_SECONDS / hop_seconds))
+        
+        def to_frames(hops: int) -> int:
+            return min(total_frames, max(0, round(hops * hop_seconds * native_sr)))
+        
+        block_start_hop = 0
+        while to_frames(block_start_hop) < total_frames:
+            core_start = to_frames(block_start_hop)
+            core_end = to_frames(block_start_hop + block_hops)
+            read_start = to_frames(block_start_hop - overlap_hops)
+            read_end = to_frames(block_start_hop + block_hops + overlap_hops)
+            block_start_hop += block_hops
+            
+            # Stesso preprocessing di load_audio: downmix mono + resample
+            audio_data = self.prepare_samples(read(read_start, read_end), native_sr)
+            
+            yield audio_data, read_start / native_sr, core_start / native_sr, core_end / native_sr
+    
+    def analyze_stream(self, file_path: str,
+                       audio: Optional[AudioBuffer] = None,
+                       progress: Optional[StageCallback] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+        """Onset e pitch detection blocco per blocco
+        
+        Di ogni blocco si tengono solo onset e frame di pitch che cadono nella
+        sua regione centrale, riportati al tempo assoluto: le sovrapposizioni
+        non producono duplicati e group_notes, eseguito una volta sola sugli
+        array concatenati, ricuce le note a cavallo dei bordi. La memoria
+        dipende dalla durata del blocco, non da quella del brano.
+        
+        Il progresso (0-1 dell'analisi) avanza blocco per blocco.
+        
+        Returns:
+            Tuple[onset_times, pitch_times, frequencies, duration]
+        """
+        logger.info(f"🎵 Analisi a blocchi da {self.block_duration:.0f}s: {file_path}")
+        
+        onset_chunks = []
+        pitch_time_chunks = []
+        frequency_chunks = []
+        duration = 0.0
+        # Confronto sui bordi a metà hop: un frame sulla griglia non cade mai in due blocchi
+        edge = 0.5 * self.hop_length / self.sample_rate
+        report = progress or _no_stage
+        total = self.source_duration(file_path, audio) or 0.0
+        
+        for audio_data, offset, core_start, core_end in self.iter_audio_blocks(file_path, audio):
+            # Progresso del blocco riportato alla sua quota del file
+            def block_progress(stage: str, fraction: float, start=core_start, end=core_end):
+                if total > 0:
+                    report(stage, min(1.0, (start + fraction * (end - start)) / total))
+            
+            onset_times, pitch_times, frequencies = self.analyze_signal(audio_data, self.sample_rate,
+                                                                        block_progress)
+            onset_times = onset_times + offset
+            pitch_times = pitch_times + offset
+            
+            onset_mask = (onset_times >= core_start - edge) & (onset_times < core_end - edge)
+            pitch_mask = (pitch_times >= core_start - edge) & (pitch_times < core_end - edge)
+            onset_chunks.append(onset_times[onset_mask])
+            pitch_time_chunks.append(pitch_times[pitch_mask])
+            frequency_chunks.append(frequencies[pitch_mask])
+            duration = core_end
+        
+        if not onset_chunks:
+            empty = np.zeros(0)
+            return empty, empty, empty, duration
+        
+        logger.info(f"📊 Audio analizzato a blocchi: {duration:.1f}s")
+        return (np.concatenate(onset_chunks), np.concatenate(pitch_time_chunks),
+                np.concatenate(frequency_chunks), duration)
+    
+    def analyze_signal(self, y: np.ndarray, sr: int,
+                       progress: Optional[StageCallback] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Onset e pitch di un segnale con una sola STFT condivisa
+        
+        Args:
+            progress: Callback opzionale (fase, frazione 0-1 dell'analisi)
+        
+        Returns:
+            Tuple[onset_times, pitch_times, frequencies]
+        """
+        report = progress or _no_stage
+        features = SpectralFeatures(y, sr, self.hop_length)
+        report("onset", 0.0)
+        onset_times = self.detect_onsets(y, sr, features)
+        report("pitch", ONSET_SHARE)
+        if self.use_crepe:
+            pitch_times, frequencies = self.detect_pitch_crepe(y, sr)
+        else:
+            pitch_times, frequencies = self.detect_pitch_librosa(y, sr, features)
+        return onset_times, pitch_times, frequencies
+    
+    def detect_onsets(self, y: np.ndarray, sr: int,
+                      features: Optional[SpectralFeatures] = None) -> np.ndarray:
         """Rileva onset delle note usando spectral flux analysis
         
         Algoritmo:
@@ -80,15 +390,20 @@ class MIDITranscriber:
         2. Applica threshold per filtrare rumore
         3. Rileva picchi significativi come onset
         4. Converte frame indices in timestamp
+        
+        features: STFT già calcolata per y (vedi SpectralFeatures)
         """
+        import librosa
+        
         logger.info("🔍 Rilevamento onset...")
+        features = features or SpectralFeatures(y, sr, self.hop_length)
         
         # Onset detection con multiple features (spectral flux, energy, etc.)
         onset_frames = librosa.onset.onset_detect(
-            y=y,
+            onset_envelope=features.onset_envelope,
             sr=sr,
             hop_length=self.hop_length,
-            threshold=self.threshold_onset,
+            delta=self.threshold_onset,  # Soglia del peak picking
             units='frames'
         )
         
@@ -103,74 +418,127 @@ class MIDITranscriber:
         
         Algoritmo:
         1. Resample audio a 16kHz (requisito CREPE)
-        2. Applica CNN pre-trained per pitch estimation
-        3. Usa Viterbi algorithm per smoothing temporale
-        4. Filtra risultati per confidence > 0.3
+        2. Gate RMS opzionale (crepe_silence_db): i frame silenziosi non
+           passano dalla rete; disattivato di default perché cambia le note
+        3. Applica CNN pre-trained per pitch estimation, a batch di crepe_batch_size
+        4. Usa Viterbi algorithm per smoothing temporale (come crepe.predict(viterbi=True))
+        5. Filtra risultati per confidence > 0.3
         
-        CREPE è più accurato di librosa per pitch detection complessi
+        CREPE è più accurato di librosa per pitch detection complessi. Il
+        modello viene caricato una volta per processo (load_crepe_model);
+        capacità e passo (crepe_capacity, crepe_step_ms) bilanciano qualità
+        e costo su CPU.
         """
         if not self.use_crepe:
             return self.detect_pitch_librosa(y, sr)
         
-        logger.info("🎯 Pitch detection con CREPE...")
+        logger.info(f"🎯 Pitch detection con CREPE ({self.crepe_capacity}, "
+                    f"passo {self.crepe_step_ms}ms)...")
+        
+        import librosa
         
-        import crepe
+        from crepe.core import to_viterbi_cents
         
         # CREPE richiede audio a 16kHz per compatibilità con modello pre-trained
-        y_16k = librosa.resample(y, orig_sr=sr, target_sr=16000)
+        y_16k = librosa.resample(y, orig_sr=sr, target_sr=CREPE_SAMPLE_RATE)
         
-        # Pitch detection con CNN + Viterbi smoothing
-        time, frequency, confidence, activation = crepe.predict(
-            y_16k, 16000, model_capacity='full', viterbi=True
-        )
+        # Frame centrati come crepe.predict(center=True): vista senza copia
+        step = max(1, int(CREPE_SAMPLE_RATE * self.crepe_step_ms / 1000))
+        padded = np.pad(np.asarray(y_16k, dtype=np.float32), CREPE_FRAME_LENGTH // 2)
+        if len(padded) < CREPE_FRAME_LENGTH:
+            return np.zeros(0), np.zeros(0)
+        frames = librosa.util.frame(padded, frame_length=CREPE_FRAME_LENGTH,
+                                    hop_length=step, axis=0)
+        
+        if self.crepe_silence_db is None:
+            active = np.arange(len(frames))
+        else:
+            # Gate RMS con somme cumulative (nessuna matrice di frame in memoria)
+            energy = np.concatenate(([0.0], np.cumsum(padded.astype(np.float64) ** 2)))
+            starts = np.arange(len(frames)) * step
+            rms = np.sqrt((energy[starts + CREPE_FRAME_LENGTH] - energy[starts]) / CREPE_FRAME_LENGTH)
+            active = np.flatnonzero(rms > 10 ** (self.crepe_silence_db / 20))
+        if len(active) == 0:
+            logger.info("✅ Pitch detection completata: 0 note rilevate (audio silenzioso)")
+            return np.zeros(0), np.zeros(0)
+        
+        model = load_crepe_model(self.crepe_capacity)
+        activations = []
+        for chunk_start in range(0, len(active), CREPE_CHUNK_FRAMES):
+            # Stessa normalizzazione per frame di crepe.get_activation
+            chunk = frames[active[chunk_start:chunk_start + CREPE_CHUNK_FRAMES]]
+            chunk = chunk - chunk.mean(axis=1, keepdims=True)
+            chunk /= np.maximum(chunk.std(axis=1, keepdims=True), 1e-8)
+            activations.append(model.predict(chunk, batch_size=self.crepe_batch_size, verbose=0))
+        activation = np.concatenate(activations)
+        
+        # Pitch con Viterbi smoothing, confidence = picco dell'attivazione
+        confidence = activation.max(axis=1)
+        cents = to_viterbi_cents(activation)
+        frequency = 10 * 2 ** (cents / 1200)
+        frequency[np.isnan(frequency)] = 0
+        time = active * step / CREPE_SAMPLE_RATE
         
         # Filtra per confidence threshold (0.3 = 30% confidence)
         valid_mask = confidence > 0.3
         time = time[valid_mask]
         frequency = frequency[valid_mask]
-        confidence = confidence[valid_mask]
         
-        logger.info(f"✅ Pitch detection completata: {len(frequency)} note rilevate")
+        logger.info(f"✅ Pitch detection completata: {len(frequency)} note rilevate "
+                    f"({len(active)}/{len(frames)} frame sopra il gate)")
         return time, frequency
     
-    def detect_pitch_librosa(self, audio_data: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+    def detect_pitch_librosa(self, audio_data: np.ndarray, sample_rate: int,
+                             features: Optional[SpectralFeatures] = None) -> Tuple[np.ndarray, np.ndarray]:
         """Pitch detection con librosa (fallback quando CREPE non disponibile)
         
         Algoritmo:
         1. Usa piptrack per pitch tracking
         2. Trova pitch dominanti per ogni frame
         3. Filtra pitch validi (threshold > 0)
+        
+        features: STFT già calcolata per audio_data (vedi SpectralFeatures)
         """
+        import librosa
+        
         logger.info("🎯 Pitch detection con librosa...")
+        features = features or SpectralFeatures(audio_data, sample_rate, self.hop_length)
         
         # Estrai pitch con librosa piptrack
         pitches, magnitudes = librosa.piptrack(
-            y=audio_data,
+            S=features.magnitude,
             sr=sample_rate,
             hop_length=self.hop_length,
             threshold=0.1
         )
         
-        # Trova pitch dominanti per ogni frame
-        times = librosa.frames_to_time(np.arange(pitches.shape[1]), sr=sample_rate, hop_length=self.hop_length)
-        frequencies = []
-        valid_times = []
-        
-        for frame_idx in range(pitches.shape[1]):
-            # Trova pitch con magnitudine massima
-            max_magnitude_idx = magnitudes[:, frame_idx].argmax()
-            pitch_frequency = pitches[max_magnitude_idx, frame_idx]
-            
-            if pitch_frequency > 0:  # Pitch valido
-                frequencies.append(pitch_frequency)
-                valid_times.append(times[frame_idx])
-        
-        frequencies = np.array(frequencies)
-        valid_times = np.array(valid_times)
+        valid_times, frequencies = self.dominant_pitches(pitches, magnitudes, sample_rate)
         
         logger.info(f"✅ Pitch detection completata: {len(frequencies)} note rilevate")
         return valid_times, frequencies
     
+    def dominant_pitches(self, pitches: np.ndarray, magnitudes: np.ndarray,
+                         sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Estrae il pitch dominante di ogni frame dall'output di piptrack
+        
+        Tutto vettoriale: argmax sull'asse delle frequenze, fancy indexing
+        (bin, frame) per leggere il pitch e maschera per i frame validi.
+        
+        Returns:
+            Tuple[times, frequencies]: Solo i frame con pitch > 0
+        """
+        import librosa
+        
+        frame_indices = np.arange(pitches.shape[1])
+        times = librosa.frames_to_time(frame_indices, sr=sample_rate, hop_length=self.hop_length)
+        
+        # Bin con magnitudine massima per ogni frame
+        max_magnitude_idx = magnitudes.argmax(axis=0)
+        frame_pitches = pitches[max_magnitude_idx, frame_indices]
+        
+        valid_mask = frame_pitches > 0  # Pitch valido
+        return times[valid_mask], frame_pitches[valid_mask]
+    
     def group_notes(self, onset_times: np.ndarray, pitch_times: np.ndarray, 
                    frequencies: np.ndarray) -> List[Dict]:
         """Raggruppa onset e pitch in note complete usando temporal matching
@@ -181,48 +549,126 @@ class MIDITranscriber:
         3. Stima durata nota fino al prossimo onset
         4. Calcola velocity basata su frequenza e intensità
         5. Filtra note con durata minima
+        
+        Tutti i passi sono vettoriali su array NumPy (vedi group_notes_array).
         """
         logger.info("🎼 Raggruppamento note...")
         
-        notes = []
-        
-        for onset_time in onset_times:
-            # Trova pitch più vicino temporalmente all'onset
-            time_diff = np.abs(pitch_times - onset_time)
-            closest_idx = np.argmin(time_diff)
-            
-            # Verifica che il pitch sia abbastanza vicino (entro 0.2s)
-            if time_diff[closest_idx] < 0.2:
-                frequency = frequencies[closest_idx]
-                
-                # Converti frequenza in MIDI note number (A4 = 440Hz = MIDI 69)
-                midi_note = self.freq_to_midi(frequency)
-                
-                # Stima durata nota (fino al prossimo onset o fine)
-                next_onset_idx = np.searchsorted(onset_times, onset_time + 0.1)
-                if next_onset_idx < len(onset_times):
-                    end_time = onset_times[next_onset_idx] - 0.05  # Piccolo gap tra note
-                else:
-                    end_time = onset_time + 1.0  # Durata default per ultima nota
-                
-                # Verifica durata minima per evitare note troppo brevi
-                duration = end_time - onset_time
-                if duration >= self.min_note_duration:
-                    # Stima velocity basata su frequenza e intensità
-                    velocity = self.estimate_velocity(frequency, onset_time)
-                    
-                    note = {
-                        'start': onset_time,
-                        'end': end_time,
-                        'pitch': int(midi_note),
-                        'velocity': velocity,
-                        'frequency': frequency
-                    }
-                    notes.append(note)
+        note_array = self.group_notes_array(onset_times, pitch_times, frequencies)
+        notes = [dict(zip(NOTE_DTYPE.names, row)) for row in note_array.tolist()]
         
         logger.info(f"✅ Raggruppate {len(notes)} note")
         return notes
     
+    def group_notes_array(self, onset_times: np.ndarray, pitch_times: np.ndarray,
+                          frequencies: np.ndarray) -> np.ndarray:
+        """Versione vettoriale di group_notes che restituisce un array strutturato
+        
+        Il matching onset -> pitch usa un'unica np.searchsorted sugli onset
+        (pitch_times è ordinato) più il confronto con il frame precedente:
+        O((n + m) log m) invece di O(n * m) con n onset e m frame di pitch.
+        
+        Returns:
+            np.ndarray: Array strutturato con dtype NOTE_DTYPE
+        """
+        onset_times = np.asarray(onset_times, dtype=np.float64)
+        pitch_times = np.asarray(pitch_times, dtype=np.float64)
+        frequencies = np.asarray(frequencies)
+        
+        if len(onset_times) == 0 or len(pitch_times) == 0:
+            return np.empty(0, dtype=NOTE_DTYPE)
+        
+        # 1. Pitch più vicino: primo frame >= onset o quello immediatamente prima.
+        # A parità di distanza vince il frame precedente (come np.argmin).
+        right_idx = np.searchsorted(pitch_times, onset_times)
+        left_idx = np.clip(right_idx - 1, 0, len(pitch_times) - 1)
+        right_idx = np.clip(right_idx, 0, len(pitch_times) - 1)
+        left_diff = np.abs(pitch_times[left_idx] - onset_times)
+        right_diff = np.abs(pitch_times[right_idx] - onset_times)
+        closest_idx = np.where(right_diff < left_diff, right_idx, left_idx)
+        closest_diff = np.minimum(left_diff, right_diff)
+        
+        # 2. Pitch abbastanza vicino (entro 0.2s)
+        matched = closest_diff < 0.2
+        starts = onset_times[matched]
+        frequency = frequencies[closest_idx[matched]]
+        
+        # 3. Fine nota: prossimo onset dopo 0.1s (meno un piccolo gap) o durata default
+        next_onset_idx = np.searchsorted(onset_times, starts + 0.1)
+        has_next = next_onset_idx < len(onset_times)
+        ends = np.where(
+            has_next,
+            onset_times[np.minimum(next_onset_idx, len(onset_times) - 1)] - 0.05,
+            starts + 1.0
+        )
+        
+        # 5. Durata minima per evitare note troppo brevi
+        keep = (ends - starts) >= self.min_note_duration
+        starts, ends, frequency = starts[keep], ends[keep], frequency[keep]
+        
+        # Frequenza -> MIDI (A4 = 440Hz = MIDI 69), 0 per frequenze non valide
+        with np.errstate(divide='ignore', invalid='ignore'):
+            midi_notes = np.where(frequency > 0, 12 * np.log2(frequency / 440.0) + 69, 0)
+        
+        # 4. Velocity come estimate_velocity: base 80 scalata dalla frequenza
+        freq_factor = np.clip(frequency / 440.0, 0.5, 1.5)
+        velocities = np.clip((80 * freq_factor * 1.0).astype(np.int64), 1, 127)
+        
+        notes = np.empty(len(starts), dtype=NOTE_DTYPE)
+        notes['start'] = starts
+        notes['end'] = ends
+        notes['pitch'] = midi_notes.astype(np.int64)
+        notes['velocity'] = velocities
+        notes['frequency'] = frequency
+        return notes
+    
+    def detect_drum_hits(self, y: np.ndarray, sr: int) -> np.ndarray:
+        """Colpi di batteria da onset + centroide spettrale
+        
+        Algoritmo:
+        1. Onset detection come per gli stem melodici (nessun pitch tracking)
+        2. Centroide spettrale medio sull'attacco di ogni colpo
+        3. Classificazione: grave = cassa, medio = rullante, acuto = hi-hat
+        4. Velocity proporzionale alla forza dell'onset
+        
+        Returns:
+            np.ndarray: Colpi con dtype NOTE_DTYPE (pitch = nota GM percussioni)
+        """
+        import librosa
+        
+        features = SpectralFeatures(y, sr, self.hop_length)
+        onset_envelope = features.onset_envelope
+        onset_frames = librosa.onset.onset_detect(
+            onset_envelope=onset_envelope,
+            sr=sr,
+            hop_length=self.hop_length,
+            delta=self.threshold_onset,
+            units='frames'
+        )
+        
+        hits = np.zeros(len(onset_frames), dtype=NOTE_DTYPE)
+        if len(onset_frames) == 0:
+            return hits
+        
+        centroid = features.spectral_centroid
+        attack_frames = np.minimum(onset_frames[:, None] + np.arange(DRUM_ATTACK_FRAMES), len(centroid) - 1)
+        attack_centroid = centroid[attack_frames].mean(axis=1)
+        
+        strength = onset_envelope[onset_frames] / max(float(onset_envelope.max()), 1e-9)
+        
+        hits['start'] = librosa.frames_to_time(onset_frames, sr=sr, hop_length=self.hop_length)
+        hits['end'] = hits['start'] + DRUM_HIT_DURATION
+        hits['pitch'] = np.select(
+            [attack_centroid < KICK_MAX_CENTROID, attack_centroid < SNARE_MAX_CENTROID],
+            [DRUM_KICK, DRUM_SNARE],
+            DRUM_HIHAT
+        )
+        hits['velocity'] = np.clip(40 + 87 * strength, 1, 127).astype(np.int64)
+        hits['frequency'] = attack_centroid
+        
+        logger.info(f"🥁 Trovati {len(hits)} colpi di batteria")
+        return hits
+    
     def freq_to_midi(self, frequency: float) -> float:
         """Converte frequenza in MIDI note number usando formula logaritmica
         
@@ -286,28 +732,35 @@ class MIDITranscriber:
         logger.info("✅ Quantizzazione completata")
         return notes
     
-    def create_midi(self, notes: List[Dict], output_path: str, tempo: float = 120.0):
-        """Crea file MIDI"""
-        logger.info(f"🎼 Creazione MIDI: {output_path}")
-        
-        # Crea oggetto MIDI
-        midi = pretty_midi.PrettyMIDI()
+    def notes_to_instrument(self, notes: List[Dict], program: int = 0,
+                            name: str = "", is_drum: bool = False) -> "pretty_midi.Instrument":
+        """Crea una traccia pretty_midi dalle note"""
+        import pretty_midi
         
-        # Crea traccia
-        instrument = pretty_midi.Instrument(program=0)  # Piano
+        instrument = pretty_midi.Instrument(program=program, is_drum=is_drum, name=name)
         
         # Aggiungi note
         for note_data in notes:
             note = pretty_midi.Note(
-                velocity=note['velocity'],
-                pitch=note['pitch'],
-                start=note['start'],
-                end=note['end']
+                velocity=note_data['velocity'],
+                pitch=note_data['pitch'],
+                start=note_data['start'],
+                end=note_data['end']
             )
             instrument.notes.append(note)
+        return instrument
+    
+    def create_midi(self, notes: List[Dict], output_path: str, tempo: float = 120.0):
+        """Crea file MIDI"""
+        import pretty_midi
         
-        # Aggiungi traccia al MIDI
-        midi.instruments.append(instrument)
+        logger.info(f"🎼 Creazione MIDI: {output_path}")
+        
+        # Crea oggetto MIDI
+        midi = pretty_midi.PrettyMIDI()
+        
+        # Crea traccia (Piano) e aggiungila al MIDI
+        midi.instruments.append(self.notes_to_instrument(notes, program=0))
         
         # Salva file
         midi.write(output_path)
@@ -317,69 +770,333 @@ class MIDITranscriber:
         
         return len(notes)
     
-    def transcribe(self, input_path: str, output_path: str) -> Dict:
-        """Trascrizione completa audio -> MIDI"""
-        logger.info(f"🚀 Avvio trascrizione: {input_path}")
+    def create_multitrack_midi(self, tracks: Dict[str, List[Dict]], output_path: str) -> int:
+        """Crea un unico file MIDI con una traccia per stem
+        
+        Args:
+            tracks: Nome dello stem -> note (lo stem "drums" va sul canale percussioni)
+            output_path: File MIDI di output
+        
+        Returns:
+            int: Note totali scritte
+        """
+        import pretty_midi
+        
+        logger.info(f"🎼 Creazione MIDI multitraccia: {output_path}")
+        
+        midi = pretty_midi.PrettyMIDI()
+        for name, notes in tracks.items():
+            midi.instruments.append(self.notes_to_instrument(
+                notes,
+                program=STEM_PROGRAMS.get(name, 0),
+                name=name,
+                is_drum=(name == DRUM_STEM)
+            ))
+        midi.write(output_path)
+        
+        num_notes = sum(len(notes) for notes in tracks.values())
+        logger.info(f"✅ MIDI salvato: {output_path} ({len(tracks)} tracce, {num_notes} note)")
+        return num_notes
+    
+    def resolve_streaming(self, input_path: str, streaming: Optional[bool],
+                          audio: Optional[AudioBuffer] = None) -> bool:
+        """Sceglie l'analisi a blocchi quando non specificato (file oltre la soglia)"""
+        if streaming is not None:
+            return streaming
+        file_duration = self.source_duration(input_path, audio)
+        return file_duration is not None and file_duration > STREAMING_THRESHOLD_SECONDS
+    
+    def transcribe_notes(self, input_path: str, streaming: Optional[bool] = None,
+                         audio: Optional[AudioBuffer] = None,
+                         progress: Optional[StageCallback] = None) -> Dict:
+        """Analisi audio -> note quantizzate, senza scrivere il file MIDI
+        
+        Args:
+            input_path: File audio (solo descrittivo se audio è fornito)
+            streaming: True per l'analisi a blocchi, False per caricare tutto
+                in memoria, None per sceglierla in base alla durata del file
+            audio: Audio già in memoria (es. stem appena separato): nessuna
+                decodifica da file
+            progress: Callback opzionale (fase, frazione 0-1 della trascrizione)
+                ai confini delle fasi decode, onset, pitch, group, quantize
+        
+        Returns:
+            dict: {"success", "notes", "duration", "onsets_detected",
+                   "pitch_detected", "streaming"} oppure {"success": False, "error"}
+        """
+        report = progress or _no_stage
+        
+        def analysis_progress(stage: str, fraction: float):
+            report(stage, DECODE_END + fraction * (ANALYSIS_END - DECODE_END))
         
         # Verifica dipendenze
         if not self.check_dependencies():
             return {"success": False, "error": "Dipendenze mancanti"}
         
         # Verifica file input
-        if not os.path.exists(input_path):
+        if audio is None and not os.path.exists(input_path):
             return {"success": False, "error": f"File non trovato: {input_path}"}
         
-        try:
+        streaming = self.resolve_streaming(input_path, streaming, audio)
+        report("decode", 0.0)
+        if streaming:
+            # Analisi a blocchi: memoria costante anche per registrazioni di ore
+            onset_times, pitch_times, frequencies, duration = self.analyze_stream(
+                input_path, audio, analysis_progress)
+        else:
             # Carica audio
-            y, sr = self.load_audio(input_path)
-            
-            # Rileva onset
-            onset_times = self.detect_onsets(y, sr)
-            
-            # Rileva pitch
-            if self.use_crepe:
-                pitch_times, frequencies = self.detect_pitch_crepe(y, sr)
+            if audio is not None:
+                y, sr = self.prepare_samples(*audio), self.sample_rate
             else:
-                pitch_times, frequencies = self.detect_pitch_librosa(y, sr)
-            
-            # Raggruppa in note
-            notes = self.group_notes(onset_times, pitch_times, frequencies)
-            
-            if not notes:
-                return {"success": False, "error": "Nessuna nota rilevata"}
-            
-            # Quantizza
-            notes = self.quantize_notes(notes)
-            
-            # Crea MIDI
-            num_notes = self.create_midi(notes, output_path)
-            
-            # Statistiche
+                y, sr = self.load_audio(input_path)
             duration = len(y) / sr
-            note_density = num_notes / duration
             
-            return {
-                "success": True,
-                "input_file": input_path,
-                "output_file": output_path,
-                "duration": duration,
-                "num_notes": num_notes,
-                "note_density": note_density,
-                "onsets_detected": len(onset_times),
-                "pitch_detected": len(frequencies),
-                "parameters": {
-                    "hop_length": self.hop_length,
-                    "threshold_onset": self.threshold_onset,
-                    "min_note_duration": self.min_note_duration,
-                    "quantize_ms": self.quantize_ms,
-                    "use_crepe": self.use_crepe
-                }
+            # Rileva onset e pitch
+            onset_times, pitch_times, frequencies = self.analyze_signal(y, sr, analysis_progress)
+            del y  # L'audio non serve più: libera memoria prima del MIDI
+        
+        # Raggruppa in note
+        report("group", ANALYSIS_END)
+        notes = self.group_notes(onset_times, pitch_times, frequencies)
+        
+        if not notes:
+            return {"success": False, "error": "Nessuna nota rilevata"}
+        
+        report("quantize", GROUP_END)
+        return {
+            "success": True,
+            "notes": self.quantize_notes(notes),
+            "duration": duration,
+            "onsets_detected": len(onset_times),
+            "pitch_detected": len(frequencies),
+            "streaming": streaming
+        }
+    
+    def transcribe_drum_notes(self, input_path: str, streaming: Optional[bool] = None,
+                              audio: Optional[AudioBuffer] = None,
+                              progress: Optional[StageCallback] = None) -> Dict:
+        """Trascrizione di uno stem di batteria: solo onset, senza pitch tracking
+        
+        Stessi argomenti e formato di ritorno di transcribe_notes (pitch_detected = 0;
+        fasi di progresso decode, onset, quantize).
+        """
+        if audio is None and not os.path.exists(input_path):
+            return {"success": False, "error": f"File non trovato: {input_path}"}
+        
+        report = progress or _no_stage
+        streaming = self.resolve_streaming(input_path, streaming, audio)
+        report("decode", 0.0)
+        if streaming:
+            edge = 0.5 * self.hop_length / self.sample_rate
+            total = self.source_duration(input_path, audio) or 0.0
+            hit_chunks = []
+            duration = 0.0
+            for audio_data, offset, core_start, core_end in self.iter_audio_blocks(input_path, audio):
+                if total > 0:
+                    report("onset", DECODE_END + (ANALYSIS_END - DECODE_END) * min(1.0, core_start / total))
+                hits = self.detect_drum_hits(audio_data, self.sample_rate)
+                hits['start'] += offset
+                hits['end'] += offset
+                hit_chunks.append(hits[(hits['start'] >= core_start - edge) & (hits['start'] < core_end - edge)])
+                duration = core_end
+            hits = np.concatenate(hit_chunks) if hit_chunks else np.zeros(0, dtype=NOTE_DTYPE)
+        else:
+            if audio is not None:
+                y, sr = self.prepare_samples(*audio), self.sample_rate
+            else:
+                y, sr = self.load_audio(input_path)
+            duration = len(y) / sr
+            report("onset", DECODE_END)
+            hits = self.detect_drum_hits(y, sr)
+            del y
+        
+        if len(hits) == 0:
+            return {"success": False, "error": "Nessun colpo rilevato"}
+        
+        report("quantize", GROUP_END)
+        notes = [dict(zip(NOTE_DTYPE.names, row)) for row in hits.tolist()]
+        return {
+            "success": True,
+            "notes": self.quantize_notes(notes),
+            "duration": duration,
+            "onsets_detected": len(hits),
+            "pitch_detected": 0,
+            "streaming": streaming
+        }
+    
+    def transcription_summary(self, input_path: str, output_path: str,
+                              analysis: Dict, num_notes: int) -> Dict:
+        """Risultato di transcribe con statistiche e parametri usati"""
+        streaming = analysis["streaming"]
+        return {
+            "success": True,
+            "input_file": input_path,
+            "output_file": output_path,
+            "duration": analysis["duration"],
+            "num_notes": num_notes,
+            "note_density": num_notes / analysis["duration"],
+            "onsets_detected": analysis["onsets_detected"],
+            "pitch_detected": analysis["pitch_detected"],
+            "parameters": {
+                "hop_length": self.hop_length,
+                "threshold_onset": self.threshold_onset,
+                "min_note_duration": self.min_note_duration,
+                "quantize_ms": self.quantize_ms,
+                "use_crepe": self.use_crepe,
+                "crepe": {
+                    "capacity": self.crepe_capacity,
+                    "step_ms": self.crepe_step_ms,
+                    "batch_size": self.crepe_batch_size,
+                    "silence_db": self.crepe_silence_db
+                } if self.use_crepe else None,
+                "streaming": streaming,
+                "block_duration": self.block_duration if streaming else None
             }
+        }
+    
+    def transcribe(self, input_path: str, output_path: str,
+                   streaming: Optional[bool] = None) -> Dict:
+        """Trascrizione completa audio -> MIDI
+        
+        Args:
+            input_path: File audio
+            output_path: File MIDI di output
+            streaming: True per l'analisi a blocchi, False per caricare tutto
+                in memoria, None per sceglierla in base alla durata del file
+        """
+        logger.info(f"🚀 Avvio trascrizione: {input_path}")
+        
+        try:
+            analysis = self.transcribe_notes(input_path, streaming)
+            if not analysis["success"]:
+                return analysis
+            
+            # Crea MIDI
+            num_notes = self.create_midi(analysis["notes"], output_path)
+            return self.transcription_summary(input_path, output_path, analysis, num_notes)
             
         except Exception as e:
             logger.error(f"❌ Errore durante trascrizione: {e}")
             return {"success": False, "error": str(e)}
 
+# Trascrittore del processo worker in modalità batch (impostato da _init_batch_worker)
+_batch_transcriber: Optional[MIDITranscriber] = None
+
+
+def _init_batch_worker(params: Dict):
+    """Inizializzatore dei worker batch: import e modello CREPE una volta per processo"""
+    global _batch_transcriber
+    _batch_transcriber = MIDITranscriber(**params)
+    _batch_transcriber.check_dependencies()
+    if _batch_transcriber.use_crepe:
+        load_crepe_model(_batch_transcriber.crepe_capacity)
+
+
+def _batch_transcribe(input_path: str, output_path: str,
+                      streaming: Optional[bool]) -> Dict:
+    """Trascrive un file nel worker batch (eseguita nei processi del pool)"""
+    start = time.time()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    result = _batch_transcriber.transcribe(input_path, output_path, streaming=streaming)
+    result.update({"input_file": input_path, "output_file": output_path,
+                   "processing_time": round(time.time() - start, 3)})
+    return result
+
+
+def collect_batch_inputs(inputs: List[str], output_dir: str) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """Coppie (audio, MIDI di output) da file, directory (ricorsive) e glob
+    
+    I file trovati in una directory mantengono il percorso relativo sotto
+    output_dir; file singoli e risultati dei glob finiscono in output_dir.
+    
+    Returns:
+        Tuple[coppie, non trovati]: input senza file audio a parte
+    """
+    files, unmatched = collect_audio_files(inputs)
+    return [(path, os.path.join(output_dir, os.path.splitext(relative)[0] + ".mid"))
+            for path, relative in files], unmatched
+
+
+def _json_default(value):
+    """Scalari NumPy nei risultati (durate, conteggi) -> tipi JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def is_up_to_date(input_path: str, output_path: str) -> bool:
+    """True se il MIDI esiste ed è più recente dell'audio"""
+    return (os.path.exists(output_path)
+            and os.path.getmtime(output_path) >= os.path.getmtime(input_path))
+
+
+def run_batch(inputs: List[str], output_dir: str, params: Dict,
+              workers: Optional[int] = None, streaming: Optional[bool] = None,
+              summary_path: Optional[str] = None, force: bool = False) -> Dict:
+    """Trascrive molti file con un pool di worker caldi
+    
+    Ogni worker importa librosa/pretty_midi (e CREPE) e carica il modello
+    una volta sola, poi elabora file su file. Gli output già aggiornati
+    vengono saltati; ogni risultato viene aggiunto al riepilogo JSONL appena
+    pronto, così un'esecuzione interrotta lascia un riepilogo valido.
+    Input senza nessun file audio contano come falliti.
+    
+    Args:
+        inputs: File, directory o glob (es. "archivio/**/*.flac")
+        output_dir: Directory dei MIDI di output
+        params: Parametri di MIDITranscriber
+        workers: Processi worker (default: core disponibili)
+        streaming: Come in transcribe (None = automatico per durata)
+        summary_path: Riepilogo JSONL (default: output_dir/transcription_summary.jsonl)
+        force: Ritrascrive anche gli output aggiornati
+    
+    Returns:
+        dict: {"total", "transcribed", "skipped", "failed", "unmatched", "summary_file"}
+    """
+    pairs, unmatched = collect_batch_inputs(inputs, output_dir)
+    summary_path = summary_path or os.path.join(output_dir, BATCH_SUMMARY_NAME)
+    os.makedirs(os.path.dirname(summary_path) or ".", exist_ok=True)
+    
+    todo = [(src, dst) for src, dst in pairs if force or not is_up_to_date(src, dst)]
+    stats = {"total": len(pairs), "transcribed": 0, "skipped": len(pairs) - len(todo),
+             "failed": len(unmatched), "unmatched": unmatched, "summary_file": summary_path}
+    logger.info(f"📂 Batch: {len(pairs)} file, {len(todo)} da trascrivere, {stats['skipped']} aggiornati")
+    
+    with open(summary_path, "a") as summary:
+        def record(result: Dict):
+            summary.write(json.dumps(result, default=_json_default) + "\n")
+            summary.flush()
+        
+        for pattern in unmatched:
+            record({"success": False, "input_file": pattern, "error": "Nessun file audio trovato"})
+        
+        pending = set(todo)
+        for src, dst in pairs:
+            if (src, dst) not in pending:
+                record({"success": True, "skipped": True, "input_file": src, "output_file": dst})
+        
+        if todo:
+            workers = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+            # spawn: come i pool di pipeline.py e jobs.py
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_batch_worker, initargs=(params,)) as executor:
+                futures = {executor.submit(_batch_transcribe, src, dst, streaming): (src, dst)
+                           for src, dst in todo}
+                for done, future in enumerate(as_completed(futures), 1):
+                    src, dst = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"success": False, "error": str(e), "input_file": src, "output_file": dst}
+                    stats["transcribed" if result["success"] else "failed"] += 1
+                    record(result)
+                    logger.info(f"{'✅' if result['success'] else '❌'} [{done}/{len(todo)}] {src}")
+    
+    logger.info(f"🏁 Batch completato: {stats}")
+    return stats
+
+
 def main():
     """Funzione principale"""
     parser = argparse.ArgumentParser(
@@ -390,17 +1107,28 @@ Esempi di utilizzo:
   python transcribe_to_midi.py input.wav output.mid
   python transcribe_to_midi.py input.wav output.mid --threshold-onset 0.5
   python transcribe_to_midi.py input.wav output.mid --quantize 100 --min-duration 0.2
+  python transcribe_to_midi.py live_3h.wav output.mid --stream --block-duration 30
+  python transcribe_to_midi.py --batch archivio/ "extra/**/*.flac" --output-dir midi/ --workers 8
 
 Parametri:
   --hop-length: Dimensione hop per analisi (default: 512)
   --threshold-onset: Soglia per rilevamento onset (default: 0.3)
   --min-duration: Durata minima nota in secondi (default: 0.1)
   --quantize: Quantizzazione in millisecondi (default: 50)
+  --stream: Analisi a blocchi a memoria costante (automatica oltre 10 minuti)
         """
     )
     
-    parser.add_argument("input", help="File audio input (WAV)")
-    parser.add_argument("output", help="File MIDI output")
+    parser.add_argument("input", nargs="?", help="File audio input (WAV)")
+    parser.add_argument("output", nargs="?", help="File MIDI output")
+    parser.add_argument("--batch", nargs="+", metavar="INPUT",
+                       help="Modalità batch: file, directory o glob da trascrivere")
+    parser.add_argument("--output-dir", help="Directory dei MIDI in modalità batch")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="Processi worker in modalità batch (default: core disponibili)")
+    parser.add_argument("--summary", help=f"Riepilogo JSONL (default: OUTPUT_DIR/{BATCH_SUMMARY_NAME})")
+    parser.add_argument("--force", action="store_true",
+                       help="Ritrascrive anche i file con MIDI già aggiornato")
     parser.add_argument("--hop-length", type=int, default=512,
                        help="Hop length per analisi (default: 512)")
     parser.add_argument("--threshold-onset", type=float, default=0.3,
@@ -409,6 +1137,19 @@ Parametri:
                        help="Durata minima nota in secondi (default: 0.1)")
     parser.add_argument("--quantize", type=int, default=50,
                        help="Quantizzazione in millisecondi (default: 50)")
+    parser.add_argument("--stream", action="store_true", default=None,
+                       help="Forza l'analisi a blocchi (default: automatica per file lunghi)")
+    parser.add_argument("--block-duration", type=float, default=DEFAULT_BLOCK_SECONDS,
+                       help=f"Durata dei blocchi in secondi (default: {DEFAULT_BLOCK_SECONDS:.0f})")
+    parser.add_argument("--crepe-capacity", choices=CREPE_CAPACITIES, default="full",
+                       help="Capacità del modello CREPE (default: full; tiny/small molto più veloci su CPU)")
+    parser.add_argument("--crepe-step", type=int, default=10,
+                       help="Passo tra frame CREPE in millisecondi (default: 10)")
+    parser.add_argument("--crepe-batch-size", type=int, default=256,
+                       help="Frame per batch di inferenza CREPE (default: 256)")
+    parser.add_argument("--crepe-silence-db", type=float, default=None,
+                       help=f"Gate RMS CREPE in dBFS (es. {CREPE_SILENCE_DB:.0f}): salta i frame "
+                            "silenziosi, più veloce ma cambia le note rilevate (default: disattivato)")
     parser.add_argument("--verbose", "-v", action="store_true",
                        help="Output verboso")
     
@@ -417,16 +1158,44 @@ Parametri:
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
+    params = {
+        "hop_length": args.hop_length,
+        "threshold_onset": args.threshold_onset,
+        "min_note_duration": args.min_duration,
+        "quantize_ms": args.quantize,
+        "block_duration": args.block_duration,
+        "crepe_capacity": args.crepe_capacity,
+        "crepe_step_ms": args.crepe_step,
+        "crepe_batch_size": args.crepe_batch_size,
+        "crepe_silence_db": args.crepe_silence_db
+    }
+    
+    if args.batch:
+        if not args.output_dir:
+            parser.error("--batch richiede --output-dir")
+        stats = run_batch(args.batch, args.output_dir, params, workers=args.workers,
+                          streaming=args.stream, summary_path=args.summary, force=args.force)
+        print("\n" + "="*50)
+        print("RISULTATO BATCH")
+        print("="*50)
+        print(f"File trovati: {stats['total']}")
+        print(f"Trascritti: {stats['transcribed']}")
+        print(f"Già aggiornati: {stats['skipped']}")
+        print(f"Falliti: {stats['failed']}")
+        for pattern in stats["unmatched"]:
+            print(f"  Nessun file audio: {pattern}")
+        print(f"Riepilogo: {stats['summary_file']}")
+        # Exit code 1 anche se nessun input corrisponde a un file audio
+        sys.exit(0 if stats["failed"] == 0 and stats["total"] > 0 else 1)
+    
+    if not args.input or not args.output:
+        parser.error("servono input e output (oppure --batch)")
+    
     # Crea trascrittore
-    transcriber = MIDITranscriber(
-        hop_length=args.hop_length,
-        threshold_onset=args.threshold_onset,
-        min_note_duration=args.min_duration,
-        quantize_ms=args.quantize
-    )
+    transcriber = MIDITranscriber(**params)
     
     # Trascrizione
-    result = transcriber.transcribe(args.input, args.output)
+    result = transcriber.transcribe(args.input, args.output, streaming=args.stream)
     
     # Output JSON
     print("\n" + "="*50)
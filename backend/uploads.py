@@ -0,0 +1,136 @@
+"""
+MIDICOM Upload Handling
+=======================
+
+Salvataggio in streaming dei file caricati: il payload viene copiato su disco
+a blocchi di dimensione fissa, con hash SHA-256 calcolato durante la copia e
+limite massimo di dimensione. La memoria usata per upload resta costante
+qualunque sia la dimensione del file. La copia gira in un thread, fuori
+dall'event loop, e UploadLimitMiddleware rifiuta le richieste con un
+Content-Length oltre il limite prima che il multipart venga letto.
+
+Author: MIDICOM Team
+Version: 1.0.0
+"""
+
+import os
+import asyncio
+import hashlib
+import json
+from typing import BinaryIO, Dict
+
+from fastapi import HTTPException, UploadFile
+
+# Import logger centralizzato
+from logger import setup_logger
+
+# Configurazione logging
+logger = setup_logger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB per blocco
+# Margine per boundary e campi del form oltre al file nel Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+async def save_upload_file(upload: UploadFile,
+                           dest_path: str,
+                           max_bytes: int,
+                           chunk_size: int = UPLOAD_CHUNK_SIZE) -> Dict:
+    """Copia un UploadFile su disco a blocchi calcolando lo SHA-256
+
+    Il file viene scritto in un ".part" e rinominato atomicamente solo a
+    copia completata, così nessun lettore vede mai un file parziale.
+
+    Args:
+        upload: File ricevuto da FastAPI
+        dest_path: Path di destinazione
+        max_bytes: Dimensione massima consentita (413 se superata)
+        chunk_size: Dimensione dei blocchi di lettura
+
+    Returns:
+        dict: {"size": byte scritti, "sha256": digest esadecimale}
+    """
+    # Rifiuto immediato se la dimensione è già nota dal multipart
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=_too_large_message(max_bytes))
+
+    await upload.seek(0)
+    return await asyncio.to_thread(_copy_upload, upload.file, dest_path, max_bytes, chunk_size)
+
+
+def _copy_upload(source: BinaryIO, dest_path: str, max_bytes: int, chunk_size: int) -> Dict:
+    """Copia bloccante di save_upload_file (eseguita in un thread)"""
+    hasher = hashlib.sha256()
+    size = 0
+    part_path = f"{dest_path}.part"
+
+    try:
+        with open(part_path, "wb") as buffer:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=_too_large_message(max_bytes))
+
+                hasher.update(chunk)
+                buffer.write(chunk)
+
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    return {"size": size, "sha256": hasher.hexdigest()}
+
+
+class UploadLimitMiddleware:
+    """Middleware ASGI: 413 immediato se il Content-Length supera il limite
+
+    Starlette legge (e scrive su disco) tutto il multipart prima di chiamare
+    l'endpoint: il controllo sull'header evita di ricevere upload che
+    verrebbero comunque rifiutati. Il limite nel form resta per le richieste
+    senza Content-Length (chunked).
+
+    Args:
+        app: Applicazione ASGI
+        limits: Byte massimi del file per path (es. {"/transcribe": 500 MiB});
+            al Content-Length si concede MULTIPART_OVERHEAD_BYTES in più
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if max_bytes is not None:
+            content_length = dict(scope["headers"]).get(b"content-length")
+            if content_length and content_length.isdigit() \
+                    and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+                logger.warning(f"⚠️ Upload rifiutato su {scope['path']}: "
+                               f"Content-Length {int(content_length)} bytes")
+                await _send_too_large(send, max_bytes)
+                return
+        await self.app(scope, receive, send)
+
+
+async def _send_too_large(send, max_bytes: int):
+    """Risposta 413 con lo stesso corpo JSON di HTTPException"""
+    body = json.dumps({"detail": _too_large_message(max_bytes)}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                    (b"connection", b"close")]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _too_large_message(max_bytes: int) -> str:
+    """Messaggio di errore per upload oltre il limite"""
+    return f"File troppo grande (massimo {max_bytes // (1024 * 1024)} MB)"
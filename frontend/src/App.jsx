@@ -21,7 +21,7 @@ function App() {
   const [midiUploadError, setMidiUploadError] = useState(null)
   
   // Load MIDI data and process audio files
-  const { midiData, stems, loading: midiLoading, error: midiError, processingStep } = useMIDI(selectedFile, selectedMidi)
+  const { midiData, midiSource, stems, loading: midiLoading, error: midiError, processingStep } = useMIDI(selectedFile, selectedMidi)
   
   // Playback system
   const { isPlaying, currentTime, duration, play, pause, stop, seek } = usePlayback(midiData)
@@ -496,6 +496,7 @@ function App() {
               <PianoRoll 
                 midiFile={selectedMidi}
                 midiData={midiData}
+                midiSource={midiSource}
                 stems={stems}
                 isPlaying={isPlaying}
                 currentTime={currentTime}
@@ -1,6 +1,6 @@
-import React, { useRef, useEffect, useState, useCallback } from 'react'
+import React, { useRef, useEffect, useState, useCallback, useMemo } from 'react'
 import * as Tone from 'tone'
-import { useMIDI } from '../hooks/useMIDI'
+import { useMIDI, useMIDIViewport } from '../hooks/useMIDI'
 import { useAudioPlayer } from '../hooks/useAudioPlayer'
 import { useMIDIPlayer } from '../hooks/useMIDIPlayer'
 import { devLog } from '../utils/logger'
@@ -16,6 +16,7 @@ const formatTime = (seconds) => {
 const PianoRoll = ({ 
   midiFile, 
   midiData,
+  midiSource,
   stems, 
   isPlaying, 
   currentTime,
@@ -135,31 +136,64 @@ const PianoRoll = ({
   // Extract notes from MIDI data with track information
   // Algoritmo: parsing MIDI tracks -> note objects con metadata
   const extractNotesFromMIDI = (midi) => {
-    const notes = []
-    
-    if (midi.tracks) {
-      midi.tracks.forEach((track, trackIndex) => {
-        if (track.notes) {
-          track.notes.forEach(note => {
-            // Crea note object con ID univoco e metadata
-            notes.push({
-              id: `${trackIndex}-${note.midi}-${note.time}`, // ID univoco per React keys
-              pitch: note.midi,                              // MIDI note number (0-127)
-              start: note.time,                              // Start time in seconds
-              end: note.time + note.duration,                // End time in seconds
-              velocity: note.velocity,                       // MIDI velocity (1-127)
-              track: trackIndex,                             // Track index per multi-track
-              noteName: midiToNoteName(note.midi)           // Human-readable note name
-            })
-          })
-        }
-      })
+    if (!midi.tracks) {
+      return []
+    }
+
+    // Payload binario: tracce struct-of-arrays già ordinate per inizio,
+    // basta un merge (nessun sort né oggetti intermedi per nota)
+    if (midi.tracks.every(track => track.sorted)) {
+      return mergeSortedTracks(midi.tracks)
     }
+
+    const notes = []
+    midi.tracks.forEach((track, position) => {
+      // Le tracce di una query per finestra riportano l'indice nel file
+      const trackIndex = track.index ?? position
+      if (track.notes) {
+        track.notes.forEach(note => {
+          notes.push(createNote(trackIndex, note.midi, note.time, note.duration, note.velocity))
+        })
+      }
+    })
     
     // Sort notes by start time per rendering sequenziale
     return notes.sort((a, b) => a.start - b.start)
   }
 
+  // Crea note object con ID univoco e metadata
+  const createNote = (trackIndex, pitch, time, duration, velocity) => ({
+    id: `${trackIndex}-${pitch}-${time}`, // ID univoco per React keys
+    pitch,                                // MIDI note number (0-127)
+    start: time,                          // Start time in seconds
+    end: time + duration,                 // End time in seconds
+    velocity,                             // MIDI velocity (1-127)
+    track: trackIndex,                    // Track index per multi-track
+    noteName: midiToNoteName(pitch)       // Human-readable note name
+  })
+
+  // Merge k-way delle tracce ordinate: O(n·k) con k tracce (pochi stem)
+  // Algoritmo: a ogni passo prende la traccia con l'inizio più piccolo
+  const mergeSortedTracks = (tracks) => {
+    const total = tracks.reduce((sum, track) => sum + track.count, 0)
+    const notes = new Array(total)
+    const cursors = new Array(tracks.length).fill(0)
+
+    for (let i = 0; i < total; i++) {
+      let next = -1
+      for (let t = 0; t < tracks.length; t++) {
+        if (cursors[t] < tracks[t].count &&
+            (next === -1 || tracks[t].time[cursors[t]] < tracks[next].time[cursors[next]])) {
+          next = t
+        }
+      }
+      const track = tracks[next]
+      const j = cursors[next]++
+      notes[i] = createNote(track.index ?? next, track.pitch[j], track.time[j], track.duration[j], track.velocity[j])
+    }
+    return notes
+  }
+
   // Convert MIDI note number to note name (C4, D#5, etc.)
   // Algoritmo: MIDI number -> note name + octave
   const midiToNoteName = (midi) => {
@@ -197,6 +231,30 @@ const PianoRoll = ({
     return beats * (60 / BPM)
   }, [dimensions.width, zoom, scrollX])
 
+  // Visible window of the piano roll: seconds and MIDI pitch range on screen
+  const view = useMemo(() => {
+    const keyWidth = 400
+    const keyHeight = 20
+    const clampPitch = (pitch) => Math.max(0, Math.min(127, pitch))
+    return {
+      start: Math.max(0, pixelsToTime(keyWidth)),
+      end: pixelsToTime(dimensions.width),
+      width: dimensions.width - keyWidth,
+      zoom,
+      minPitch: clampPitch(Math.floor(127 - (scrollY + dimensions.height) / keyHeight)),
+      maxPitch: clampPitch(Math.ceil(127 - scrollY / keyHeight))
+    }
+  }, [pixelsToTime, dimensions, zoom, scrollY])
+
+  // Vista chiesta al backend: tile di occupazione a zoom ridotto, note della
+  // finestra quando la tile segnala "detail". Senza risposta (dati mock, query
+  // fallita o non ancora arrivata) si disegnano le note dell'intero file
+  const viewport = useMIDIViewport(midiSource, midiData ? view : null)
+  const visibleNotes = useMemo(() => {
+    if (!viewport) return notes
+    return viewport.midiData ? extractNotesFromMIDI(viewport.midiData) : []
+  }, [viewport, notes])
+
   // Calculate if horizontal scrollbar should be shown (memoized)
   const calculateScrollbarVisibility = useCallback(() => {
     if (!midiData || !dimensions.width) return false
@@ -286,10 +344,14 @@ const PianoRoll = ({
 
     // Render layers in order (optimized)
     drawGrid(ctx)
-    drawNotes(ctx)
+    if (viewport?.overview) {
+      drawOverview(ctx, viewport.overview)
+    } else {
+      drawNotes(ctx)
+    }
     drawPlayhead(ctx)
     drawPianoKeys(ctx)
-  }, [dimensions, notes, zoom, scrollX, scrollY, currentTime, activeNotes])
+  }, [dimensions, viewport, visibleNotes, zoom, scrollX, scrollY, currentTime, activeNotes])
 
   // Draw professional grid like FL Studio
   // Algoritmo: time grid con barre, beat, e sedicesimi
@@ -440,13 +502,13 @@ const PianoRoll = ({
     const keyWidth = 400
     
     // Draw MIDI notes on canvas
-    if (notes.length > 0) {
-      devLog(`🎨 Drawing ${notes.length} notes, first note:`, {
-        pitch: notes[0].pitch,
-        start: notes[0].start,
-        end: notes[0].end,
-        x: timeToPixels(notes[0].start),
-        y: pitchToY(notes[0].pitch),
+    if (visibleNotes.length > 0) {
+      devLog(`🎨 Drawing ${visibleNotes.length} notes, first note:`, {
+        pitch: visibleNotes[0].pitch,
+        start: visibleNotes[0].start,
+        end: visibleNotes[0].end,
+        x: timeToPixels(visibleNotes[0].start),
+        y: pitchToY(visibleNotes[0].pitch),
         scrollX,
         scrollY,
         zoom,
@@ -456,7 +518,7 @@ const PianoRoll = ({
     }
     
     let drawnCount = 0
-    notes.forEach(note => {
+    visibleNotes.forEach(note => {
       // Show all notes in the full MIDI range
       // No filtering needed - we show the full range
       
@@ -515,11 +577,54 @@ const PianoRoll = ({
       }
     })
     
-    if (notes.length > 0) {
-      devLog(`🎨 Drew ${drawnCount} out of ${notes.length} notes (visible in viewport)`)
+    if (visibleNotes.length > 0) {
+      devLog(`🎨 Drew ${drawnCount} out of ${visibleNotes.length} notes (visible in viewport)`)
     }
   }
 
+  // Draw occupancy tile for zoomed-out views
+  // Algoritmo: una cella per bucket × pitch, opacità = frazione del bucket in
+  // cui la nota suona (massimo tra le tracce): il costo dipende dai pixel,
+  // non dal numero di note
+  const drawOverview = (ctx, overview) => {
+    const containerWidth = dimensions.width
+    const containerHeight = dimensions.height
+    const keyWidth = 400
+    const keyHeight = 20
+    const { start, bucket_seconds: bucketSeconds, buckets, pitches, tracks } = overview
+
+    const pixelsPerSecond = timeToPixels(1) - timeToPixels(0)
+    const bucketWidth = Math.max(bucketSeconds * pixelsPerSecond, 1)
+    // Solo i bucket che cadono nella vista
+    const firstBucket = Math.max(0, Math.floor((pixelsToTime(keyWidth) - start) / bucketSeconds))
+    const lastBucket = Math.min(buckets, Math.ceil((pixelsToTime(containerWidth) - start) / bucketSeconds))
+
+    let drawnCount = 0
+    ctx.save()
+    for (let pitch = overview.min_pitch; pitch <= overview.max_pitch; pitch++) {
+      const y = pitchToY(pitch)
+      if (y <= 0 || y >= containerHeight) continue
+
+      const hue = (pitch * 2.8) % 360
+      ctx.fillStyle = `hsl(${hue}, 90%, 60%)`
+      const column = pitch - overview.min_pitch
+      for (let bucket = firstBucket; bucket < lastBucket; bucket++) {
+        let value = 0
+        for (const track of tracks) {
+          value = Math.max(value, track.occupancy[bucket * pitches + column])
+        }
+        if (value > 0) {
+          drawnCount++
+          ctx.globalAlpha = 0.25 + 0.75 * (value / 255)
+          ctx.fillRect(timeToPixels(start + bucket * bucketSeconds), y - keyHeight/2, bucketWidth, keyHeight)
+        }
+      }
+    }
+    ctx.restore()
+
+    devLog(`🗺️ Drew ${drawnCount} overview cells (level ${overview.level}, ${bucketSeconds}s buckets)`)
+  }
+
   // Draw playhead with smoother rendering
   const drawPlayhead = (ctx) => {
     const x = timeToPixels(currentTime)
@@ -1,12 +1,107 @@
-import { useState, useEffect, useCallback } from 'react'
-import { uploadAudioFile, getSeparatedStems, getMIDITranscription } from '../services/apiService'
+import { useState, useEffect, useCallback, useRef } from 'react'
+import { uploadAudioFile, waitForJob, getSeparatedStems, getMIDITranscription, getMIDIWindow, getMIDIOverview } from '../services/apiService'
 import { devLog, devWarn } from '../utils/logger'
 
 // Backend API configuration
 const API_BASE_URL = 'http://localhost:8000'
 
+// Viewport queries: extra viewport fetched on each side so that small
+// scrolls are served from the last response, and debounce while dragging
+const VIEWPORT_MARGIN = 0.5
+const VIEWPORT_DEBOUNCE_MS = 150
+
+/**
+ * Whether a loaded viewport response still covers the requested view
+ * (same zoom, time and pitch range inside the fetched one)
+ */
+const viewportCovers = (loaded, view) => (
+  loaded.zoom === view.zoom &&
+  loaded.start <= view.start && view.end <= loaded.end &&
+  loaded.minPitch <= view.minPitch && view.maxPitch <= loaded.maxPitch
+)
+
+/**
+ * Fetch what the piano roll viewport needs from the backend instead of
+ * drawing the whole file: an occupancy tile (GET /midi/{source}/overview)
+ * while zoomed out, the notes of the window (GET /midi/{source}?start&end...)
+ * once the tile's `detail` flag says the view is finer than its finest level.
+ * The request is padded by VIEWPORT_MARGIN viewports and only repeated when
+ * the view leaves the fetched range or the zoom changes.
+ * @param {string|null} source - Job id or file name served by /midi (null: no backend data)
+ * @param {Object|null} view - { start, end, width, zoom, minPitch, maxPitch }
+ * @returns {Object|null} { start, end, minPitch, maxPitch } of the last response
+ *   plus either `overview` (tile) or `midiData` (window notes)
+ */
+export const useMIDIViewport = (source, view) => {
+  const [viewport, setViewport] = useState(null)
+  const loadedRef = useRef(null)
+  // Lowest zoom at which the tile asked for notes: from there on (finer
+  // views) the overview request is skipped
+  const detailZoomRef = useRef({ source: null, zoom: Infinity })
+
+  useEffect(() => {
+    if (!source || !view) {
+      loadedRef.current = null
+      setViewport(null)
+      return
+    }
+    const loaded = loadedRef.current
+    if (loaded && loaded.source === source && viewportCovers(loaded, view)) {
+      return
+    }
+
+    const controller = new AbortController()
+    const timeoutId = setTimeout(async () => {
+      const span = view.end - view.start
+      const pitchSpan = view.maxPitch - view.minPitch
+      const request = {
+        start: Math.max(0, view.start - span * VIEWPORT_MARGIN),
+        end: view.end + span * VIEWPORT_MARGIN,
+        minPitch: Math.max(0, Math.floor(view.minPitch - pitchSpan * VIEWPORT_MARGIN)),
+        maxPitch: Math.min(127, Math.ceil(view.maxPitch + pitchSpan * VIEWPORT_MARGIN))
+      }
+      try {
+        const detailZoom = detailZoomRef.current
+        if (detailZoom.source !== source || view.zoom < detailZoom.zoom) {
+          const width = view.width * (1 + 2 * VIEWPORT_MARGIN)
+          const { overview } = await getMIDIOverview(source, { ...request, width, signal: controller.signal })
+          if (!overview.detail) {
+            devLog(`🗺️ Overview ${request.start.toFixed(1)}-${request.end.toFixed(1)}s: level ${overview.level}, ${overview.buckets} buckets`)
+            loadedRef.current = { ...request, source, zoom: view.zoom }
+            setViewport({ ...request, source, overview })
+            return
+          }
+          detailZoomRef.current = { source, zoom: view.zoom }
+        }
+
+        const result = await getMIDIWindow(source, { ...request, signal: controller.signal })
+        devLog(`🪟 Viewport ${request.start.toFixed(1)}-${request.end.toFixed(1)}s:`, result.midi_data.window)
+        loadedRef.current = { ...request, source, zoom: view.zoom }
+        setViewport({ ...request, source, midiData: result.midi_data })
+      } catch (err) {
+        if (err.name !== 'AbortError') {
+          // PianoRoll falls back to the notes of the whole file
+          devWarn('Viewport query failed:', err.message)
+          loadedRef.current = null
+          setViewport(null)
+        }
+      }
+    }, VIEWPORT_DEBOUNCE_MS)
+
+    return () => {
+      clearTimeout(timeoutId)
+      controller.abort()
+    }
+  }, [source, view])
+
+  // A response for the previous file is never drawn over the new one
+  return viewport?.source === source ? viewport : null
+}
+
 export const useMIDI = (audioFile, selectedMidiFile) => {
   const [midiData, setMidiData] = useState(null)
+  // Job id or file name the backend serves the MIDI as (null for mock data)
+  const [midiSource, setMidiSource] = useState(null)
   const [stems, setStems] = useState({})
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState(null)
@@ -26,10 +121,16 @@ export const useMIDI = (audioFile, selectedMidiFile) => {
       const uploadResult = await uploadAudioFile(file, 'htdemucs', 'librosa')
       devLog('Upload result:', uploadResult)
 
-      // Step 2: Get separated stems
+      // Step 2: Wait for the background job (separation + transcription)
+      await waitForJob(uploadResult.job_id, (job) => {
+        const eta = job.eta_seconds != null ? `, ~${Math.ceil(job.eta_seconds)}s left` : ''
+        setProcessingStep(`${job.message} (${Math.round(job.progress * 100)}%${eta})`)
+      })
+
+      // Step 3: Get separated stems
       setProcessingStep('Getting separated stems...')
       try {
-        const stemsData = await getSeparatedStems(uploadResult.filename)
+        const stemsData = await getSeparatedStems(uploadResult.job_id)
         setStems(stemsData.stems)
         devLog('Stems loaded:', stemsData.stems)
       } catch (stemsError) {
@@ -37,16 +138,18 @@ export const useMIDI = (audioFile, selectedMidiFile) => {
         // Continue without stems for now
       }
 
-      // Step 3: Get MIDI transcription
-      setProcessingStep('Transcribing to MIDI...')
+      // Step 4: Get MIDI transcription
+      setProcessingStep('Loading MIDI transcription...')
       try {
-        const midiResult = await getMIDITranscription(uploadResult.filename)
+        const midiResult = await getMIDITranscription(uploadResult.job_id)
         setMidiData(midiResult.midi_data)
+        setMidiSource(uploadResult.job_id)
         devLog('MIDI data loaded:', midiResult.midi_data)
       } catch (midiError) {
         devWarn('MIDI not available yet, using mock data:', midiError.message)
         // Fallback to mock data if backend MIDI endpoint not ready
         setMidiData(getMockMidiData(file.name))
+        setMidiSource(null)
       }
 
       setProcessingStep('Processing complete!')
@@ -64,6 +167,7 @@ export const useMIDI = (audioFile, selectedMidiFile) => {
     devLog('🎵 loadMIDIFile called with:', fileName)
     if (!fileName) {
       setMidiData(null)
+      setMidiSource(null)
       return
     }
 
@@ -74,25 +178,21 @@ export const useMIDI = (audioFile, selectedMidiFile) => {
       // Always try backend first, then fallback to mock data
       try {
         devLog('🌐 Fetching MIDI from backend:', `${API_BASE_URL}/midi/${fileName}`)
-        const response = await fetch(`${API_BASE_URL}/midi/${fileName}`)
-        if (response.ok) {
-          const result = await response.json()
-          devLog('✅ MIDI data loaded from backend:', result)
-          
-          // Handle different response formats
-          if (result.midi_data) {
-            devLog('📊 Setting MIDI data from result.midi_data:', result.midi_data)
-            setMidiData(result.midi_data)
-          } else if (result.tracks) {
-            devLog('📊 Setting MIDI data from result:', result)
-            setMidiData(result)
-          } else {
-            throw new Error('Invalid MIDI data format from backend')
-          }
-          return
+        const result = await getMIDITranscription(fileName)
+        devLog('✅ MIDI data loaded from backend:', result)
+
+        // Handle different response formats
+        if (result.midi_data) {
+          devLog('📊 Setting MIDI data from result.midi_data:', result.midi_data)
+          setMidiData(result.midi_data)
+        } else if (result.tracks) {
+          devLog('📊 Setting MIDI data from result:', result)
+          setMidiData(result)
         } else {
-          throw new Error(`Backend returned ${response.status}: ${response.statusText}`)
+          throw new Error('Invalid MIDI data format from backend')
         }
+        setMidiSource(fileName)
+        return
       } catch (backendError) {
         devLog('Backend MIDI endpoint error:', backendError.message)
         devLog('Falling back to mock data')
@@ -101,6 +201,7 @@ export const useMIDI = (audioFile, selectedMidiFile) => {
         const mockData = getMockMidiData(fileName)
         devLog('📊 Setting mock MIDI data:', mockData)
         setMidiData(mockData)
+        setMidiSource(null)
         devLog('✅ Using mock MIDI data for:', fileName)
       }
     } catch (err) {
@@ -230,6 +331,7 @@ export const useMIDI = (audioFile, selectedMidiFile) => {
 
   return { 
     midiData, 
+    midiSource,
     stems, 
     loading, 
     error, 
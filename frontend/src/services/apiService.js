@@ -1,5 +1,6 @@
 // API service for backend communication
 import { devWarn } from '../utils/logger'
+import { MIDI_BINARY_MEDIA_TYPE, OVERVIEW_BINARY_MEDIA_TYPE, parseMidiResponse, parseOverviewResponse } from '../utils/midiPayload'
 
 const API_BASE_URL = 'http://localhost:8000'
 
@@ -8,13 +9,16 @@ const API_BASE_URL = 'http://localhost:8000'
  * @param {File} file - Audio file to upload
  * @param {string} separationModel - Model for audio separation (default: 'htdemucs')
  * @param {string} transcriptionMethod - Method for MIDI transcription (default: 'librosa')
+ * @param {boolean} exportStems - Keep stem WAVs for playback/download (default: true)
  * @returns {Promise<Object>} Upload result
  */
-export const uploadAudioFile = async (file, separationModel = 'htdemucs', transcriptionMethod = 'librosa') => {
+export const uploadAudioFile = async (file, separationModel = 'htdemucs', transcriptionMethod = 'librosa', exportStems = true) => {
   const formData = new FormData()
   formData.append('file', file)
   formData.append('separation_model', separationModel)
   formData.append('transcription_method', transcriptionMethod)
+  // Stems are only written to disk when requested; the player needs them
+  formData.append('export_stems', exportStems ? 'true' : 'false')
 
   const response = await fetch(`${API_BASE_URL}/transcribe`, {
     method: 'POST',
@@ -28,6 +32,98 @@ export const uploadAudioFile = async (file, separationModel = 'htdemucs', transc
   return await response.json()
 }
 
+/**
+ * Get transcription job status
+ * @param {string} jobId - Job id returned by /transcribe
+ * @returns {Promise<Object>} Job status (queued, running, completed, failed)
+ */
+export const getJobStatus = async (jobId) => {
+  const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`, {
+    method: 'GET',
+  })
+
+  if (!response.ok) {
+    throw new Error(`Failed to get job status: ${response.statusText}`)
+  }
+
+  const result = await response.json()
+  return result.job
+}
+
+/**
+ * Follow a transcription job over Server-Sent Events (/jobs/{id}/events)
+ * The server pushes the job status (with `stage` and `eta_seconds`) at every
+ * pipeline stage boundary and a heartbeat with a fresh ETA in between, so the
+ * client never polls. EventSource reconnects by itself after network errors.
+ * @param {string} jobId - Job id returned by /transcribe
+ * @param {Function} onProgress - Optional callback invoked with each job status
+ * @returns {Promise<Object>} Final job status; rejects with `unsupported` set
+ *   when the stream is unavailable (caller may fall back to polling)
+ */
+export const streamJob = (jobId, onProgress = null) => new Promise((resolve, reject) => {
+  if (typeof EventSource === 'undefined') {
+    reject(Object.assign(new Error('EventSource not available'), { unsupported: true }))
+    return
+  }
+
+  const source = new EventSource(`${API_BASE_URL}/jobs/${jobId}/events`)
+  let received = false
+  const handle = (event) => {
+    received = true
+    const job = JSON.parse(event.data)
+    if (onProgress) onProgress(job)
+    if (event.type === 'completed') {
+      source.close()
+      resolve(job)
+    } else if (event.type === 'failed') {
+      source.close()
+      reject(new Error(`Transcription failed: ${job.error}`))
+    }
+  }
+
+  source.addEventListener('progress', handle)
+  source.addEventListener('completed', handle)
+  source.addEventListener('failed', handle)
+  source.onerror = () => {
+    // Never connected (old server, proxy) or reconnection refused (e.g. 404
+    // after a server restart): let the caller poll instead. Otherwise
+    // EventSource is already retrying.
+    if (!received || source.readyState === EventSource.CLOSED) {
+      source.close()
+      reject(Object.assign(new Error('Job event stream unavailable'), { unsupported: true }))
+    }
+  }
+})
+
+/**
+ * Wait for a transcription job to complete or fail
+ * Uses the SSE stream; polls /jobs/{id} only when the stream is unavailable
+ * @param {string} jobId - Job id returned by /transcribe
+ * @param {Function} onProgress - Optional callback invoked with each job status
+ * @param {number} intervalMs - Polling interval of the fallback in milliseconds (default: 1000)
+ * @returns {Promise<Object>} Final job status
+ */
+export const waitForJob = async (jobId, onProgress = null, intervalMs = 1000) => {
+  try {
+    return await streamJob(jobId, onProgress)
+  } catch (err) {
+    if (!err.unsupported) throw err
+    devWarn('Job event stream unavailable, polling status:', err.message)
+  }
+
+  for (;;) {
+    const job = await getJobStatus(jobId)
+    if (onProgress) onProgress(job)
+
+    if (job.status === 'completed') return job
+    if (job.status === 'failed') {
+      throw new Error(`Transcription failed: ${job.error}`)
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, intervalMs))
+  }
+}
+
 /**
  * Get separated audio stems
  * @param {string} filename - Name of the processed file
@@ -47,19 +143,90 @@ export const getSeparatedStems = async (filename) => {
 
 /**
  * Get MIDI transcription
+ * Requests the compact binary payload (typed arrays per track, notes sorted
+ * by start); the server falls back to JSON when it cannot produce it
  * @param {string} filename - Name of the processed file
  * @returns {Promise<Object>} MIDI data
  */
 export const getMIDITranscription = async (filename) => {
   const response = await fetch(`${API_BASE_URL}/midi/${filename}`, {
     method: 'GET',
+    headers: {
+      'Accept': `${MIDI_BINARY_MEDIA_TYPE}, application/json;q=0.9`,
+    },
   })
 
   if (!response.ok) {
     throw new Error(`Failed to get MIDI: ${response.statusText}`)
   }
 
-  return await response.json()
+  return await parseMidiResponse(response)
+}
+
+/**
+ * Get the notes visible in a piano roll viewport
+ * Only notes sounding in [start, end) and within the pitch range are sent,
+ * so scrolling a long transcription fetches kilobytes instead of the file
+ * @param {string} filename - Name of the processed file
+ * @param {Object} viewport - { start, end, tracks, minPitch, maxPitch, signal }
+ *   (seconds, track indices or names, MIDI note numbers, AbortSignal; all optional)
+ * @returns {Promise<Object>} MIDI data; tracks carry their file `index`
+ */
+export const getMIDIWindow = async (filename, { start, end, tracks, minPitch, maxPitch, signal } = {}) => {
+  const params = new URLSearchParams()
+  if (start !== undefined) params.set('start', start)
+  if (end !== undefined) params.set('end', end)
+  if (tracks?.length) params.set('tracks', tracks.join(','))
+  if (minPitch !== undefined) params.set('min_pitch', minPitch)
+  if (maxPitch !== undefined) params.set('max_pitch', maxPitch)
+
+  const response = await fetch(`${API_BASE_URL}/midi/${filename}?${params}`, {
+    method: 'GET',
+    headers: {
+      'Accept': `${MIDI_BINARY_MEDIA_TYPE}, application/json;q=0.9`,
+    },
+    signal,
+  })
+
+  if (!response.ok) {
+    throw new Error(`Failed to get MIDI window: ${response.statusText}`)
+  }
+
+  return await parseMidiResponse(response)
+}
+
+/**
+ * Get the level-of-detail occupancy tile for a zoomed-out view
+ * The server picks the power-of-two level with about one bucket per pixel,
+ * so drawing cost depends on `width`, not on the number of notes. When
+ * `overview.detail` is true the view is zoomed in past the finest level:
+ * use getMIDIWindow to draw the actual notes instead
+ * @param {string} filename - Name of the processed file
+ * @param {Object} view - { start, end, width, tracks, minPitch, maxPitch, signal }
+ * @returns {Promise<Object>} { overview } with Uint8Array occupancy per track
+ */
+export const getMIDIOverview = async (filename, { start, end, width, tracks, minPitch, maxPitch, signal } = {}) => {
+  const params = new URLSearchParams()
+  if (start !== undefined) params.set('start', start)
+  if (end !== undefined) params.set('end', end)
+  if (width !== undefined) params.set('width', Math.round(width))
+  if (tracks?.length) params.set('tracks', tracks.join(','))
+  if (minPitch !== undefined) params.set('min_pitch', minPitch)
+  if (maxPitch !== undefined) params.set('max_pitch', maxPitch)
+
+  const response = await fetch(`${API_BASE_URL}/midi/${filename}/overview?${params}`, {
+    method: 'GET',
+    headers: {
+      'Accept': `${OVERVIEW_BINARY_MEDIA_TYPE}, application/json;q=0.9`,
+    },
+    signal,
+  })
+
+  if (!response.ok) {
+    throw new Error(`Failed to get MIDI overview: ${response.statusText}`)
+  }
+
+  return await parseOverviewResponse(response)
 }
 
 /**
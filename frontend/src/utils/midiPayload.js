@@ -0,0 +1,154 @@
+/**
+ * Decoder for the compact binary MIDI payloads served by GET /midi/{filename}
+ * (`Accept: application/vnd.midicom.notes`) and GET /midi/{filename}/overview
+ * (`Accept: application/vnd.midicom.overview`); layout documented in
+ * backend/midi_payload.py.
+ *
+ * Each track is exposed as struct-of-arrays TypedArray views over the
+ * received buffer (no copy, no per-note objects), with notes sorted by start.
+ */
+
+export const MIDI_BINARY_MEDIA_TYPE = 'application/vnd.midicom.notes'
+export const OVERVIEW_BINARY_MEDIA_TYPE = 'application/vnd.midicom.overview'
+
+const BINARY_MAGIC = 'MIDN'
+const OVERVIEW_MAGIC = 'MIDO'
+const BINARY_VERSION = 1
+const PREFIX_SIZE = 12
+
+/**
+ * Lazily materialize the legacy `notes` array ({ midi, time, duration, velocity })
+ * for consumers that still iterate note objects (e.g. the MIDI player).
+ * Built on first access only, then memoized on the track.
+ */
+const defineLazyNotes = (track) => {
+  Object.defineProperty(track, 'notes', {
+    configurable: true,
+    enumerable: false,
+    get() {
+      const notes = new Array(track.count)
+      for (let i = 0; i < track.count; i++) {
+        notes[i] = {
+          midi: track.pitch[i],
+          time: track.time[i],
+          duration: track.duration[i],
+          velocity: track.velocity[i]
+        }
+      }
+      Object.defineProperty(track, 'notes', { value: notes, enumerable: false })
+      return notes
+    }
+  })
+  return track
+}
+
+/**
+ * Read the prefix and JSON header shared by note and overview payloads
+ * @param {ArrayBuffer} buffer - Response body
+ * @param {string} expectedMagic - Payload type ('MIDN' notes, 'MIDO' overview)
+ * @returns {Object} Parsed header
+ */
+const readHeader = (buffer, expectedMagic) => {
+  const view = new DataView(buffer)
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4))
+  if (magic !== expectedMagic) {
+    throw new Error('Invalid MIDI payload')
+  }
+  const version = view.getUint16(4, true)
+  if (version !== BINARY_VERSION) {
+    throw new Error(`Unsupported MIDI payload version ${version}`)
+  }
+
+  const headerLength = view.getUint32(8, true)
+  return JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, PREFIX_SIZE, headerLength)))
+}
+
+/**
+ * Decode a binary MIDI payload
+ * @param {ArrayBuffer} buffer - Response body
+ * @returns {Object} Same shape as the JSON response: { status, filename, source, midi_data }
+ */
+export const decodeMidiPayload = (buffer) => {
+  const { filename, source, tracks, ...metadata } = readHeader(buffer, BINARY_MAGIC)
+
+  return {
+    status: 'success',
+    filename,
+    source,
+    midi_data: {
+      ...metadata,
+      tracks: tracks.map(({ name, count, offset, ...extra }) => defineLazyNotes({
+        name,
+        ...extra, // e.g. `index` of the track in the file for viewport queries
+        count,
+        sorted: true,
+        time: new Float32Array(buffer, offset, count),
+        duration: new Float32Array(buffer, offset + 4 * count, count),
+        pitch: new Uint8Array(buffer, offset + 8 * count, count),
+        velocity: new Uint8Array(buffer, offset + 9 * count, count)
+      }))
+    }
+  }
+}
+
+/**
+ * Decode a binary overview tile (GET /midi/{filename}/overview)
+ * Each track's `occupancy` is a Uint8Array view of buckets × pitches cells,
+ * row-major: cell (bucket b, pitch p) is at b * pitches + (p - min_pitch),
+ * 0-255 = fraction of the bucket during which the pitch sounds
+ * @param {ArrayBuffer} buffer - Response body
+ * @returns {Object} Same shape as the JSON response: { status, filename, source, overview }
+ */
+export const decodeOverviewPayload = (buffer) => {
+  const { filename, source, tracks, ...tile } = readHeader(buffer, OVERVIEW_MAGIC)
+  const cells = tile.buckets * (tile.max_pitch - tile.min_pitch + 1)
+
+  return {
+    status: 'success',
+    filename,
+    source,
+    overview: {
+      ...tile,
+      pitches: tile.max_pitch - tile.min_pitch + 1,
+      tracks: tracks.map(({ index, name, offset }) => ({
+        index,
+        name,
+        occupancy: new Uint8Array(buffer, offset, cells)
+      }))
+    }
+  }
+}
+
+/**
+ * Parse a /midi/{filename}/overview response in whichever format the server chose
+ * (JSON occupancy is flattened to the same Uint8Array layout as the binary one)
+ * @param {Response} response - fetch response
+ * @returns {Promise<Object>} { status, filename, source, overview }
+ */
+export const parseOverviewResponse = async (response) => {
+  const contentType = response.headers.get('Content-Type') || ''
+  if (contentType.startsWith(OVERVIEW_BINARY_MEDIA_TYPE)) {
+    return decodeOverviewPayload(await response.arrayBuffer())
+  }
+  const result = await response.json()
+  const { overview } = result
+  overview.pitches = overview.max_pitch - overview.min_pitch + 1
+  overview.tracks = overview.tracks.map(track => ({
+    ...track,
+    occupancy: Uint8Array.from(track.occupancy.flat())
+  }))
+  return result
+}
+
+/**
+ * Parse a /midi response in whichever format the server chose
+ * @param {Response} response - fetch response
+ * @returns {Promise<Object>} { status, filename, source, midi_data }
+ */
+export const parseMidiResponse = async (response) => {
+  const contentType = response.headers.get('Content-Type') || ''
+  if (contentType.startsWith(MIDI_BINARY_MEDIA_TYPE)) {
+    return decodeMidiPayload(await response.arrayBuffer())
+  }
+  return await response.json()
+}
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark parsing MIDI per MIDICOM
+Misura la latenza di GET /midi/{filename} su file MIDI densi (default 100k note)
+e confronta dimensioni e tempi dei formati JSON e binario, con e senza gzip
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+import mido
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def generate_dense_midi(path: str, num_notes: int, ticks_per_beat: int = 480,
+                        polyphony: int = 4):
+    """Genera un file MIDI denso (accordi sovrapposti stile pianoforte)"""
+    mid = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+    track = mido.MidiTrack()
+    mid.tracks.append(track)
+    track.append(mido.MetaMessage('track_name', name='Dense Piano', time=0))
+    track.append(mido.MetaMessage('set_tempo', tempo=500000, time=0))
+
+    step = ticks_per_beat // 4
+    emitted = 0
+    while emitted < num_notes:
+        chord = [36 + (emitted + k * 7) % 60 for k in range(polyphony)]
+        chord = list(dict.fromkeys(chord))
+        for note in chord:
+            track.append(mido.Message('note_on', note=note, velocity=80, time=0))
+        for k, note in enumerate(chord):
+            track.append(mido.Message('note_off', note=note, velocity=0,
+                                      time=step if k == 0 else 0))
+        emitted += len(chord)
+
+    mid.save(path)
+
+
+def legacy_read_midi_file(file_path):
+    """Vecchio algoritmo O(n²) (track.index + sum) per confronto"""
+    mid = mido.MidiFile(file_path)
+    seconds_per_tick = 0.5 / mid.ticks_per_beat
+    count = 0
+    for track in mid.tracks:
+        current_time_ticks = 0
+        for msg in track:
+            current_time_ticks += msg.time
+            if msg.type == 'note_on' and msg.velocity > 0:
+                note_off_time_ticks = current_time_ticks
+                for j, next_msg in enumerate(track[track.index(msg)+1:], track.index(msg)+1):
+                    if (next_msg.type == 'note_off' and next_msg.note == msg.note) or \
+                       (next_msg.type == 'note_on' and next_msg.note == msg.note and next_msg.velocity == 0):
+                        note_off_time_ticks += sum(m.time for m in track[track.index(msg)+1:j+1])
+                        break
+                if note_off_time_ticks > current_time_ticks:
+                    count += 1
+    return count * seconds_per_tick
+
+
+def time_call(fn, repeat: int):
+    """Esegue fn `repeat` volte e restituisce i tempi in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark GET /midi/{filename}")
+    parser.add_argument("--notes", type=int, default=100_000,
+                        help="Numero di note nel file di test (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Ripetizioni per misura (default: 5)")
+    parser.add_argument("--legacy-notes", type=int, default=5_000,
+                        help="Note per il confronto con l'algoritmo O(n²) (0 = salta)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="midicom_bench_")
+    os.chdir(workdir)  # app.py crea le directory temporanee nella cwd
+
+    from fastapi.testclient import TestClient
+    import app as backend_app
+    from midi_reader import read_midi_file
+
+    filename = f"dense_{args.notes}.mid"
+    midi_path = os.path.join(backend_app.TEST_MIDI_DIR, filename)
+    print(f"📝 Generazione MIDI con {args.notes:,} note...")
+    generate_dense_midi(midi_path, args.notes)
+    print(f"   {os.path.getsize(midi_path):,} bytes")
+
+    parse_ms = time_call(lambda: read_midi_file(midi_path), args.repeat)
+    print(f"\n⏱️ read_midi_file: mediana {statistics.median(parse_ms):.1f} ms")
+
+    client = TestClient(backend_app.app)
+    http_ms = time_call(lambda: client.get(f"/midi/{filename}").raise_for_status(), args.repeat + 1)
+    print(f"⏱️ GET /midi/{filename} a freddo: {http_ms[0]:.1f} ms")
+    print(f"⏱️ GET /midi/{filename} da cache: mediana {statistics.median(http_ms[1:]):.1f} ms "
+          f"(min {min(http_ms[1:]):.1f}, max {max(http_ms[1:]):.1f})")
+
+    # Formati negoziati: byte sul filo e latenza da cache
+    from midi_payload import MIDI_BINARY_MEDIA_TYPE
+    print()
+    for label, accept in (("JSON", "application/json"), ("binario", MIDI_BINARY_MEDIA_TYPE)):
+        for encoding in ("identity", "gzip"):
+            headers = {"Accept": accept, "Accept-Encoding": encoding}
+            request = lambda: client.get(f"/midi/{filename}", headers=headers)
+            response = request()
+            format_ms = time_call(lambda: request().raise_for_status(), args.repeat)
+            print(f"📦 {label:<8} {encoding:<9} {response.num_bytes_downloaded:>12,} bytes, "
+                  f"mediana {statistics.median(format_ms):.1f} ms")
+    print(f"📊 Cache: {client.get('/status').json()['midi_cache']}")
+
+    if args.legacy_notes > 0:
+        small_path = os.path.join(workdir, "legacy.mid")
+        generate_dense_midi(small_path, args.legacy_notes)
+        new_ms = statistics.median(time_call(lambda: read_midi_file(small_path), 3))
+        old_ms = statistics.median(time_call(lambda: legacy_read_midi_file(small_path), 1))
+        print(f"\n📊 Confronto su {args.legacy_notes:,} note: "
+              f"vecchio {old_ms:.1f} ms, nuovo {new_ms:.1f} ms ({old_ms / new_ms:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
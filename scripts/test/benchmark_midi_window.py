@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark query per finestra di GET /midi/{filename}
+Genera una trascrizione lunga (default 1 ora, 4 tracce) e confronta il file
+intero con le finestre da pochi secondi richieste scorrendo il PianoRoll e
+con le tile di GET /midi/{filename}/overview per le viste a zoom ridotto
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+import mido
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def generate_long_midi(path: str, duration: float, tracks: int, notes_per_second: float,
+                       ticks_per_beat: int = 480):
+    """Genera un MIDI multitraccia lungo con note casuali a densità costante"""
+    rng = np.random.default_rng(0)
+    ticks_per_second = ticks_per_beat * 2  # 120 BPM
+    mid = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+    for t in range(tracks):
+        track = mido.MidiTrack()
+        mid.tracks.append(track)
+        track.append(mido.MetaMessage('track_name', name=f'Track {t}', time=0))
+
+        num_notes = int(duration * notes_per_second)
+        starts = np.sort(rng.integers(0, int(duration * ticks_per_second), num_notes))
+        lengths = rng.integers(ticks_per_beat // 8, ticks_per_beat * 2, num_notes)
+        pitches = rng.integers(24 + 12 * t, 60 + 12 * t, num_notes)
+        events = sorted([(int(s), 1, int(p)) for s, p in zip(starts, pitches)] +
+                        [(int(s + l), 0, int(p)) for s, l, p in zip(starts, lengths, pitches)])
+        current = 0
+        for tick, on, pitch in events:
+            track.append(mido.Message('note_on' if on else 'note_off', note=pitch,
+                                      velocity=80 if on else 0, time=tick - current))
+            current = tick
+    mid.save(path)
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark query per finestra di /midi")
+    parser.add_argument("--duration", type=float, default=3600.0,
+                        help="Durata della trascrizione in secondi (default: 3600)")
+    parser.add_argument("--tracks", type=int, default=4,
+                        help="Numero di tracce (default: 4)")
+    parser.add_argument("--density", type=float, default=8.0,
+                        help="Note al secondo per traccia (default: 8)")
+    parser.add_argument("--window", type=float, default=10.0,
+                        help="Ampiezza della finestra in secondi (default: 10)")
+    parser.add_argument("--steps", type=int, default=200,
+                        help="Finestre richieste scorrendo il brano (default: 200)")
+    parser.add_argument("--width", type=int, default=2000,
+                        help="Larghezza in pixel della vista per le tile di overview (default: 2000)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="midicom_bench_")
+    os.chdir(workdir)  # app.py crea le directory temporanee nella cwd
+
+    from fastapi.testclient import TestClient
+    import app as backend_app
+    from midi_payload import MIDI_BINARY_MEDIA_TYPE
+
+    filename = "long.mid"
+    midi_path = os.path.join(backend_app.TEST_MIDI_DIR, filename)
+    print(f"📝 Generazione MIDI di {args.duration:.0f}s, {args.tracks} tracce...")
+    generate_long_midi(midi_path, args.duration, args.tracks, args.density)
+
+    client = TestClient(backend_app.app)
+    headers = {"Accept": MIDI_BINARY_MEDIA_TYPE, "Accept-Encoding": "gzip"}
+    start = time.perf_counter()
+    full = client.get(f"/midi/{filename}", headers=headers)
+    full.raise_for_status()
+    print(f"⏱️ File intero a freddo (parsing + indice): {(time.perf_counter() - start) * 1000:.0f} ms")
+    full_ms = []
+    for _ in range(3):
+        start = time.perf_counter()
+        full = client.get(f"/midi/{filename}", headers=headers)
+        full_ms.append((time.perf_counter() - start) * 1000)
+    print(f"📦 File intero: {full.num_bytes_downloaded:,} bytes sul filo, "
+          f"mediana {statistics.median(full_ms):.1f} ms da cache")
+
+    timings, sizes, notes = [], [], []
+    positions = np.linspace(0, args.duration - args.window, args.steps)
+    for position in positions:
+        params = {"start": position, "end": position + args.window}
+        start = time.perf_counter()
+        response = client.get(f"/midi/{filename}", params=params, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        sizes.append(response.num_bytes_downloaded)
+
+    json_window = client.get(f"/midi/{filename}", params={"start": 0, "end": args.window}).json()
+    notes = json_window["midi_data"]["window"]["notes"]
+    print(f"🔎 Finestra di {args.window:.0f}s ({notes} note): mediana {statistics.median(sizes):,.0f} bytes, "
+          f"{statistics.median(timings):.1f} ms (p95 {np.percentile(timings, 95):.1f} ms)")
+    print(f"📊 Scorrere l'intero brano: {sum(sizes):,} bytes in {args.steps} richieste "
+          f"({full.num_bytes_downloaded / statistics.median(sizes):.0f}x meno byte per vista)")
+
+    # Overview: zoom da brano intero a qualche minuto, vista larga --width pixel
+    overview_url = f"/midi/{filename}/overview"
+    start = time.perf_counter()
+    client.get(overview_url, params={"width": args.width}, headers=headers).raise_for_status()
+    print(f"\n⏱️ Overview a freddo (piramide dall'indice in cache): "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    for span in (args.duration, args.duration / 8, args.duration / 64):
+        params = {"start": 0, "end": span, "width": args.width}
+        start = time.perf_counter()
+        response = client.get(overview_url, params=params, headers=headers)
+        elapsed = (time.perf_counter() - start) * 1000
+        tile = client.get(overview_url, params=params).json()["overview"]
+        print(f"🗺️ Vista di {span:.0f}s: livello {tile['level']} ({tile['bucket_seconds']:g}s/bucket), "
+              f"{tile['buckets']} bucket, {response.num_bytes_downloaded:,} bytes, {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
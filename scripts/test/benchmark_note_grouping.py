@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark raggruppamento note per MIDICOM
+Confronta il vecchio matching onset -> pitch O(onset × frame) con
+MIDITranscriber.group_notes (searchsorted vettoriale) su una registrazione lunga
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from transcribe_to_midi import MIDITranscriber
+
+
+def legacy_group_notes(transcriber, onset_times, pitch_times, frequencies):
+    """Vecchio loop per onset con np.abs sull'intero array di pitch"""
+    notes = []
+    for onset_time in onset_times:
+        time_diff = np.abs(pitch_times - onset_time)
+        closest_idx = np.argmin(time_diff)
+        if time_diff[closest_idx] < 0.2:
+            frequency = frequencies[closest_idx]
+            midi_note = transcriber.freq_to_midi(frequency)
+            next_onset_idx = np.searchsorted(onset_times, onset_time + 0.1)
+            if next_onset_idx < len(onset_times):
+                end_time = onset_times[next_onset_idx] - 0.05
+            else:
+                end_time = onset_time + 1.0
+            if end_time - onset_time >= transcriber.min_note_duration:
+                notes.append({
+                    'start': onset_time,
+                    'end': end_time,
+                    'pitch': int(midi_note),
+                    'velocity': transcriber.estimate_velocity(frequency, onset_time),
+                    'frequency': frequency
+                })
+    return notes
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark raggruppamento note")
+    parser.add_argument("--duration", type=float, default=3600.0,
+                        help="Durata simulata in secondi (default: 3600 = 1 ora)")
+    parser.add_argument("--onsets-per-second", type=float, default=4.0,
+                        help="Densità di onset (default: 4/s)")
+    args = parser.parse_args()
+
+    transcriber = MIDITranscriber()
+    rng = np.random.default_rng(0)
+    frame_period = transcriber.hop_length / transcriber.sample_rate
+    pitch_times = np.arange(0, args.duration, frame_period)
+    frequencies = rng.uniform(40, 2000, len(pitch_times)).astype(np.float32)
+    onset_times = np.sort(rng.uniform(0, args.duration, int(args.duration * args.onsets_per_second)))
+    print(f"📊 {len(onset_times):,} onset, {len(pitch_times):,} frame di pitch ({args.duration:.0f}s)")
+
+    start = time.perf_counter()
+    new_notes = transcriber.group_notes(onset_times, pitch_times, frequencies)
+    new_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    old_notes = legacy_group_notes(transcriber, onset_times, pitch_times, frequencies)
+    old_ms = (time.perf_counter() - start) * 1000
+
+    assert old_notes == new_notes, "Output diverso dal loop originale"
+    print(f"⏱️ Loop per onset: {old_ms:.0f} ms")
+    print(f"⏱️ Vettoriale:     {new_ms:.0f} ms ({old_ms / new_ms:.0f}x)")
+    print(f"✅ Output identico ({len(new_notes):,} note)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark analisi spettrale condivisa per MIDICOM
+Confronta onset detection + piptrack su audio grezzo (due STFT) con
+MIDITranscriber.analyze_signal (una STFT condivisa tramite SpectralFeatures)
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import librosa
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from transcribe_to_midi import MIDITranscriber
+
+
+def synthetic_stem(duration: float, sample_rate: int) -> np.ndarray:
+    """Melodia sintetica: una nota diversa ogni 250 ms più rumore"""
+    rng = np.random.default_rng(0)
+    note_samples = int(sample_rate * 0.25)
+    num_notes = int(duration / 0.25)
+    freqs = 110.0 * 2 ** (rng.integers(0, 36, num_notes) / 12)
+    t = np.arange(note_samples) / sample_rate
+    audio = np.concatenate([0.3 * np.sin(2 * np.pi * f * t) for f in freqs])
+    audio += 0.01 * rng.standard_normal(len(audio))
+    return audio.astype(np.float32)
+
+
+def legacy_analysis(transcriber, y, sr):
+    """Vecchio percorso: onset_detect e piptrack calcolano ognuno la propria STFT"""
+    onset_frames = librosa.onset.onset_detect(
+        y=y, sr=sr, hop_length=transcriber.hop_length,
+        delta=transcriber.threshold_onset, units='frames'
+    )
+    onset_times = librosa.frames_to_time(onset_frames, sr=sr, hop_length=transcriber.hop_length)
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr, hop_length=transcriber.hop_length, threshold=0.1)
+    pitch_times, frequencies = transcriber.dominant_pitches(pitches, magnitudes, sr)
+    return onset_times, pitch_times, frequencies
+
+
+def best_of(fn, repeat: int):
+    """Miglior tempo in ms su `repeat` esecuzioni e ultimo risultato"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark analisi spettrale condivisa")
+    parser.add_argument("--duration", type=float, default=300.0,
+                        help="Durata dello stem in secondi (default: 300)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Ripetizioni per misura (default: 3)")
+    args = parser.parse_args()
+
+    transcriber = MIDITranscriber(pitch_method="librosa")
+    sr = transcriber.sample_rate
+    y = synthetic_stem(args.duration, sr)
+    print(f"📊 Stem sintetico di {args.duration:.0f}s a {sr}Hz")
+
+    old_ms, old = best_of(lambda: legacy_analysis(transcriber, y, sr), args.repeat)
+    new_ms, new = best_of(lambda: transcriber.analyze_signal(y, sr), args.repeat)
+
+    assert all(np.array_equal(a, b) for a, b in zip(old, new)), "Output diverso dal percorso originale"
+    print(f"⏱️ Due STFT:       {old_ms:.0f} ms")
+    print(f"⏱️ STFT condivisa: {new_ms:.0f} ms ({old_ms / new_ms:.1f}x)")
+    print(f"✅ Output identico ({len(new[0]):,} onset, {len(new[2]):,} frame di pitch)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark avvio a freddo per MIDICOM
+Misura il tempo di import del server API e di --help delle due CLI in
+processi nuovi, e verifica che i moduli pesanti non vengano caricati
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / "backend"
+
+# (nome, argomenti dell'interprete)
+COMMANDS = [
+    ("import app", ["-c", "import app"]),
+    ("transcribe_to_midi.py --help", ["transcribe_to_midi.py", "--help"]),
+    ("separate.py --help", ["separate.py", "--help"]),
+]
+# Moduli che non devono comparire dopo l'import (caricati solo al primo uso);
+# le CLI usano numpy ovunque, il server API solo nel parsing MIDI
+HEAVY_MODULES = ["librosa", "pretty_midi", "mido", "torch", "demucs", "tensorflow", "crepe"]
+LAZY_IMPORTS = {
+    "app": ["numpy"] + HEAVY_MODULES,
+    "transcribe_to_midi": HEAVY_MODULES,
+    "separate": HEAVY_MODULES,
+}
+
+
+def best_of(args, repeat: int) -> float:
+    """Miglior tempo in ms su `repeat` processi nuovi"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=BACKEND_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def loaded_heavy_modules(module: str) -> list:
+    """Moduli pesanti presenti in sys.modules dopo `import module`"""
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {LAZY_IMPORTS[module]!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def slowest_imports(module: str, top: int):
+    """Moduli con il tempo di import cumulativo più alto (-X importtime)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark avvio a freddo")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Processi per misura (default: 5)")
+    parser.add_argument("--top", type=int, default=0,
+                        help="Mostra i N import più lenti di app e transcribe_to_midi")
+    args = parser.parse_args()
+
+    for name, command in COMMANDS:
+        print(f"⏱️ {name:<30} {best_of(command, args.repeat):.0f} ms")
+
+    for module in LAZY_IMPORTS:
+        heavy = loaded_heavy_modules(module)
+        status = "✅" if not heavy else "⚠️"
+        print(f"{status} import {module}: moduli pesanti caricati {heavy or 'nessuno'}")
+
+    for module in ("app", "transcribe_to_midi") if args.top else ():
+        print(f"\n📊 Import più lenti per {module}:")
+        for micros, name in slowest_imports(module, args.top):
+            print(f"   {micros / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark trascrizione a blocchi per MIDICOM
+Confronta memoria di picco e note prodotte da MIDITranscriber.transcribe con
+audio caricato intero e con analisi a blocchi (streaming) su una registrazione lunga
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def write_synthetic_recording(path: str, duration: float, sample_rate: int = 44100):
+    """Registrazione stereo sintetica scritta a blocchi (una nota ogni 250 ms)"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * 0.25)) / sample_rate
+    envelope = np.exp(-3 * t)
+    with sf.SoundFile(path, "w", sample_rate, 2, "PCM_16") as f:
+        for _ in range(int(duration / 30)):
+            freqs = 110.0 * 2 ** (rng.integers(0, 36, 120) / 12)
+            audio = np.concatenate([0.3 * np.sin(2 * np.pi * freq * t) * envelope for freq in freqs])
+            f.write(np.stack([audio, audio], axis=1))
+
+
+def run_mode(input_path: str, output_path: str, streaming: bool, block_duration: float):
+    """Trascrive nel processo corrente e stampa note, tempo e memoria di picco"""
+    from transcribe_to_midi import MIDITranscriber
+
+    transcriber = MIDITranscriber(pitch_method="librosa", block_duration=block_duration)
+    start = time.perf_counter()
+    result = transcriber.transcribe(input_path, output_path, streaming=streaming)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{result.get('num_notes', 0)} {elapsed:.1f} {peak_mb:.0f}")
+
+
+def main():
+    """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Benchmark trascrizione a blocchi")
+    parser.add_argument("--duration", type=float, default=1800.0,
+                        help="Durata della registrazione in secondi (default: 1800 = 30 minuti)")
+    parser.add_argument("--block-duration", type=float, default=60.0,
+                        help="Durata dei blocchi in secondi (default: 60)")
+    parser.add_argument("--mode", choices=["full", "stream"], help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Processo figlio: una sola modalità, così ru_maxrss misura solo quella
+    if args.mode:
+        run_mode(args.input, f"benchmark_{args.mode}.mid", args.mode == "stream", args.block_duration)
+        return
+
+    input_path = f"benchmark_recording_{int(args.duration)}s.wav"
+    if not os.path.exists(input_path):
+        print(f"🎵 Generazione registrazione sintetica: {args.duration:.0f}s")
+        write_synthetic_recording(input_path, args.duration)
+
+    results = {}
+    for mode in ("full", "stream"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--input", input_path,
+             "--block-duration", str(args.block_duration)],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        notes, elapsed, peak_mb = output.split()
+        results[mode] = (int(notes), float(elapsed), float(peak_mb))
+
+    for mode, label in (("full", "Audio intero"), ("stream", "A blocchi   ")):
+        notes, elapsed, peak_mb = results[mode]
+        print(f"⏱️ {label}: {elapsed:.1f}s, picco {peak_mb:.0f} MB, {notes:,} note")
+    print(f"✅ Memoria di picco ridotta di {results['full'][2] / results['stream'][2]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()